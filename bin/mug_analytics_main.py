@@ -6,8 +6,13 @@ Created on 28 Dec 2016
 
 import pprint
 import pymongo
+from pymongo.errors import OperationFailure
 import sys
 import datetime
+import time
+import copy
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
 
 from argparse import ArgumentParser, ArgumentTypeError
 
@@ -17,10 +22,14 @@ from mugalyser.gdrive import GDrive
 
 from mongodb_utils.agg import Agg, Sorter, CursorFormatter
 from mugalyser.mongodb import MUGAlyserMongoDB
-from mugalyser.audit import Audit
 from mugalyser.groups import EU_COUNTRIES, NORDICS_COUNTRIES, Groups
 from mugalyser.members import Members
 from mugalyser.events import PastEvents
+from mugalyser.mugdata import chunks
+from mugalyser.querycache import QueryCache, CachedAgg
+from mugalyser.rollups import Rollups
+from mugalyser.facet import Pipeline, Facet
+from mugalyser.exporter import Exporter
     
 def get_date( date_string ):
     if date_string is None :
@@ -50,20 +59,31 @@ def getDateRange( start_date, end_date ):
         return( start_date, end_date )
 
     
-def addJoinDate( mdb, cursor ):
-    
+def addJoinDate( mdb, cursor, chunk_size=1000 ):
+    '''
+    Add the member join_date to each attendee. The members for each chunk_size
+    attendees are fetched with one query rather than one query per attendee.
+    '''
     members = Members( mdb )
-    for i in cursor :
-        member = members.get_by_ID( i[ "info"]["attendee"]["member"][ "id"])
-        i[ "join_date"] = member[ "join_time" ]
-        yield i
-        
-def addCountry( mdb, cursor ):
+    for rows in chunks( cursor, chunk_size ):
+        joined = members.get_by_IDs( [ i[ "info"]["attendee"]["member"][ "id"] for i in rows ], 
+                                     { "member.join_time" : 1 }, chunk_size )
+        for i in rows :
+            member = joined.get( i[ "info"]["attendee"]["member"][ "id"] )
+            i[ "join_date"] = member[ "join_time" ] if member else None
+            yield i
+        
+def addCountry( mdb, cursor, chunk_size=1000 ):
+    '''
+    Add the group country to each row. The groups for each chunk_size rows are
+    fetched with one query rather than one query per row.
+    '''
     groups = Groups( mdb )
-    for i in cursor:
-        country = groups.get_country( i[ 'group'] )
-        i[ "country"] = country
-        yield i    
+    for rows in chunks( cursor, chunk_size ):
+        countries = groups.get_countries( [ i[ 'group'] for i in rows ], chunk_size )
+        for i in rows :
+            i[ "country"] = countries.get( i[ 'group'] )
+            yield i    
         
 class Filename( object ):
     '''
@@ -104,10 +124,20 @@ class Filename( object ):
 
         
 class MUG_Analytics( object ):
+    
+    #
+    # The stats that can be run together by get_combined :
+    # stat : ( pipeline builder, report, file suffix, fieldNames, datemap )
+    #
+    COMBINABLE = { "grouptotals" : ( "group_totals_agg",  "get_group_totals",  "grouptotals", [ "year", "group", "event_count", "rsvp_count"], None ),
+                   "events"      : ( "events_agg",        "get_events",        "events",      [ "group", "name", "rsvp_count", "date" ], [ "date" ] ),
+                   "rsvps"       : ( "rsvps_agg",         "get_rsvps",         "rsvps",       [ "attendee", "group", "event_count" ], None ),
+                   "activeusers" : ( "active_users_agg",  "get_active_users",  "active",      [ "_id", "count", "groups" ], None ),
+                   "rsvpevents"  : ( "rsvp_by_event_agg", "get_rsvp_by_event", "rsvpevents",  [ "_id", "rsvp_count" ], None ) }
             
     def __init__(self, mdb, output_filename="-", formatter="json", batchID=None, limit=None, view=None ):
         self._mdb = mdb
-        audit = Audit( mdb )
+        audit = mdb.audit()
     
 
         self._sorter = None
@@ -125,10 +155,61 @@ class MUG_Analytics( object ):
             self._batchID = batchID
             
         self._pro_account = audit.isProBatch( self._batchID )
+        
+        self._rollups = Rollups( mdb )
+        self._hasRollups = None
+        self._compress = False
+        self._batchSize = 1000
     
     def files(self):
         return self._files
     
+    def copy(self ):
+        '''
+        A copy that shares our connection and settings but has its own output
+        filename and file list, so reports can run on it in another thread.
+        '''
+        c = copy.copy( self )
+        c._files = []
+        return c
+    
+    def useRollups(self ):
+        '''
+        The rollups hold whole batch totals so we can only use them when there is no
+        date range. Views are always made from the live pipelines.
+        '''
+        if self._start_date or self._end_date or self._view :
+            return False
+        if self._hasRollups is None :
+            self._hasRollups = self._rollups.exists( self._batchID )
+        return self._hasRollups
+    
+    def aggregate(self, agg, collection_name, cacheable=True ):
+        '''
+        Run agg, using the query cache if there is one and the batch has finished. Pass
+        cacheable=False for pipelines that aren't limited to finished batches.
+        '''
+        cache = self._mdb.queryCache()
+        if ( cacheable and cache is not None and not self._view and 
+             self._mdb.audit().isFinished( self._batchID )) :
+            return CachedAgg( cache, agg, self._mdb.uri(), self._mdb.database().name + "." + collection_name ).aggregate()
+        else:
+            return agg.aggregate()
+    
+    def export(self, cursor, fieldNames, datemap=None, limit=None ):
+        '''
+        Stream cursor to the current output file and record the file for upload.
+        '''
+        exporter = Exporter( self._filename, self._format, compress=self._compress, batchSize=self._batchSize )
+        exporter.output( cursor, fieldNames, datemap=datemap, limit=limit )
+        
+        if exporter.filename() != "-":
+            self._files.append( exporter.filename())
+            
+    def setExport(self, compress=False, batchSize=1000 ):
+        self._compress = compress
+        self._batchSize = batchSize
+        
     def setRange(self, start_date, end_date ):
         self._start_date = start_date
         self._end_date = end_date      
@@ -146,6 +227,10 @@ class MUG_Analytics( object ):
         
         agg.addMatch({ "batchID"       : { "$in" : [ self._batchID ]},
                        "group.urlname" : { "$in" : urls }} )
+        
+        # batchID is an array for documents shared between batches
+        agg.addUnwind( "$batchID" )
+        agg.addMatch({ "batchID" : self._batchID } )
          
         agg.addProject(  { "_id" : 0, 
                            "urlname" : "$group.urlname", 
@@ -162,8 +247,7 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "members_view")
             
-        formatter = CursorFormatter( agg.aggregate(), self._filename, self._format )
-        formatter.output( fieldNames= [ "urlname", "country", "batchID", "member_count"] )
+        self.export( self.aggregate( agg, "groups" ), fieldNames=[ "urlname", "country", "batchID", "member_count"] )
         
     def get_RSVP_history(self, urls, filename=None ):
         '''
@@ -197,32 +281,35 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "rsvps_view" )
             
-        formatter = CursorFormatter( agg.aggregate(), self._filename, self._format )
-        filename = formatter.output( fieldNames= [ "_id", "rsvp_count" ], datemap=[ "_id"], limit=self._limit )
+        self.export( self.aggregate( agg, "past_events", cacheable=False ), fieldNames=[ "_id", "rsvp_count" ], datemap=[ "_id"], limit=self._limit )
         
-        if filename != "-":
-            self._files.append( filename )
 
     def get_member_history(self, urls, filename=None ):
         '''
         Got into every batch and see what the member count was for each group (URL) this uses all 
         the batches to get a history of a group.
-        Range is used to select batches in this case via the "timestamp" field.
+        Range is used to select batches in this case via the batch start time.
         '''
-        audit = Audit( self._mdb )
-        
-        validBatches = list( audit.getCurrentValidBatchIDs())
+        audit = self._mdb.audit()
+        
+        #
+        # Documents shared between batches keep the timestamp of the batch that wrote
+        # them, so the time of each batch comes from its audit document.
+        #
+        starts = OrderedDict( ( i[ "batchID" ], i[ "start" ] ) 
+                              for i in audit.getCurrentValidBatches( self._start_date, self._end_date ).aggregate())
+        validBatches = starts.keys()
                 
         agg = Agg( self._mdb.groupsCollection())
         
-        if self._start_date or self._end_date :
-            agg.addRangeMatch( "timestamp", self._start_date, self._end_date )
-        
         agg.addMatch({ "batchID"       : { "$in" : validBatches },
                        "group.urlname" : { "$in" : urls }} )
         
+        # batchID is an array for documents shared between batches
+        agg.addUnwind( "$batchID" )
+        agg.addMatch({ "batchID" : { "$in" : validBatches }} )
+        
         agg.addProject({ "_id": 0,
-                        "timestamp" : 1,
                          "batchID" : 1,
                          "urlname" : "$group.urlname",
                          #"count" : "$group.members" } )
@@ -231,10 +318,15 @@ class MUG_Analytics( object ):
 
         
 
-        agg.addGroup( { "_id" : { "ts": "$timestamp", "batchID" : "$batchID" },
+        agg.addGroup( { "_id" : "$batchID",
                         "groups" : { "$addToSet" : "$urlname" },
                         "count" : { "$sum" : "$count"}})
         
+        agg.addProject( { "_id" : { "ts" : { "$arrayElemAt" : [ starts.values(), { "$indexOfArray" : [ validBatches, "$_id" ] } ] },
+                                    "batchID" : "$_id" },
+                          "groups" : 1,
+                          "count" : 1 } )
+        
         #CursorFormatter( agg.aggregate()).output()
         
         if self._sorter :
@@ -247,11 +339,8 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "groups_view" )
             
-        formatter = CursorFormatter( agg.aggregate(), self._filename, self._format )
-        formatter.output( fieldNames= [ "_id", "groups", "count" ], datemap=[ "_id.ts" ], limit=self._limit)
+        self.export( self.aggregate( agg, "groups" ), fieldNames=[ "_id.ts", "_id.batchID", "groups", "count" ], datemap=[ "_id.ts" ], limit=self._limit )
     
-        if filename != "-":
-            self._files.append( filename )
             
     def get_group_names( self, region_arg ):
         
@@ -311,36 +400,44 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "groups_view" )
             
-        formatter = CursorFormatter( agg, self._filename, self._format )
-        filename = formatter.output( fieldNames= [ "urlname", "members", "founded" ], datemap=[ "founded" ], limit=self._limit )
+        self.export( self.aggregate( agg, "groups" ), fieldNames=[ "urlname", "members", "founded" ], datemap=[ "founded" ], limit=self._limit )
+        
+            
+    def group_totals_agg(self, urls, newAgg=Agg ):
+    
+        if self.useRollups():
+            agg = self._rollups.find( "group_totals", self._batchID, { "group" : { "$in" : urls }}, newAgg=newAgg )
+            agg.addProject( { "_id" : 0, "group" : 1, "year" : 1, "event_count" : 1, "rsvp_count" : 1 } )
+            collection_name = "rollup_group_totals"
+        else:
+            agg = newAgg( self._mdb.pastEventsCollection())
         
-        if self._filename != "-":
-            self._files.append( self._filename )
+            agg.addMatch({ "batchID"             : self._batchID,
+                           "event.status"        : "past",
+                           "event.group.urlname" : { "$in" : urls }} )
             
+            if self._start_date or self._end_date :
+                agg.addRangeMatch( "groups.founded_date", self._start_date, self._end_date )
+                
+            agg.addGroup( { "_id" : { "urlname" : "$event.group.urlname", 
+                                      "year"    : { "$year" : "$event.time"}},
+                            "event_count" : { "$sum" : 1 },
+                            "rsvp_count"  : { "$sum" : "$event.yes_rsvp_count" }})
+            
+            agg.addProject( { "_id" : 0,
+                              "group"   : "$_id.urlname",
+                              "year"    : "$_id.year",
+                              "event_count" : 1,
+                              "rsvp_count" : 1 } )
+            collection_name = "past_events"
+            
+        return ( agg, collection_name )
+    
     def get_group_totals( self, urls, filename=None ):
         '''
         get the total number of RSVPs by group.
         '''
-    
-        agg = Agg( self._mdb.pastEventsCollection())
-    
-        agg.addMatch({ "batchID"             : self._batchID,
-                       "event.status"        : "past",
-                       "event.group.urlname" : { "$in" : urls }} )
-        
-        if self._start_date or self._end_date :
-            agg.addRangeMatch( "groups.founded_date", self._start_date, self._end_date )
-            
-        agg.addGroup( { "_id" : { "urlname" : "$event.group.urlname", 
-                                  "year"    : { "$year" : "$event.time"}},
-                        "event_count" : { "$sum" : 1 },
-                        "rsvp_count"  : { "$sum" : "$event.yes_rsvp_count" }})
-        
-        agg.addProject( { "_id" : 0,
-                          "group"   : "$_id.urlname",
-                          "year"    : "$_id.year",
-                          "event_count" : 1,
-                          "rsvp_count" : 1 } )
+        ( agg, collection_name ) = self.group_totals_agg( urls )
         
         if self._sorter:
             agg.addSort( self._sorter )
@@ -352,15 +449,12 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "group_totals_view" )
             
-        formatter = CursorFormatter( agg, self._filename, self._format )
-        filename = formatter.output( fieldNames= [ "year", "group", "event_count", "rsvp_count"], limit=self._limit )
+        self.export( self.aggregate( agg, collection_name ), fieldNames=[ "year", "group", "event_count", "rsvp_count"], limit=self._limit )
         
-        if self._filename != "-":
-            self._files.append( self._filename )
         
-    def get_events(self, urls, filename=None):
+    def events_agg(self, urls, newAgg=Agg ):
     
-        agg = Agg( self._mdb.pastEventsCollection())
+        agg = newAgg( self._mdb.pastEventsCollection())
         
         agg.addMatch({ "batchID"      : self._batchID,
                        "event.status" : "past",
@@ -373,8 +467,14 @@ class MUG_Analytics( object ):
                           "group"        : u"$event.group.urlname", 
                           "name"         : u"$event.name",
                           "rsvp_count"   : "$event.yes_rsvp_count",
-                          "date"         :"$event.time" }) 
-     
+                          "date"         :"$event.time" })
+        collection_name = "past_events"
+            
+        return ( agg, collection_name )
+    
+    def get_events(self, urls, filename=None):
+        ( agg, collection_name ) = self.events_agg( urls )
+        
         if self._sorter:
             agg.addSort( self._sorter)
         
@@ -385,11 +485,8 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "events_view" )
             
-        formatter = CursorFormatter( agg, self._filename, self._format )
-        filename = formatter.output( fieldNames= [ "group", "name", "rsvp_count", "date" ], datemap=[ "date"], limit=self._limit)
+        self.export( self.aggregate( agg, "past_events" ), fieldNames=[ "group", "name", "rsvp_count", "date" ], datemap=[ "date"], limit=self._limit )
 
-        if self._filename != "-":
-            self._files.append( self._filename )
             
     def get_new_members( self, urls, filename=None ):
         '''
@@ -422,36 +519,44 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "new_members_view" )
             
-        formatter = CursorFormatter( agg, self._filename, self._format )
-        filename = formatter.output( fieldNames= [ "group", "name", "join_date" ], datemap=[ 'join_date'], limit=self._limit)
+        self.export( self.aggregate( agg, "members" ), fieldNames=[ "group", "name", "join_date" ], datemap=[ 'join_date'], limit=self._limit )
         
-        if self._filename != "-":
-            self._files.append( self._filename )
             
+    def rsvps_agg(self, urls, newAgg=Agg ):
+        if self.useRollups():
+            agg = self._rollups.find( "attendance", self._batchID, { "group" : { "$in" : urls }}, newAgg=newAgg )
+            agg.addProject( { "_id" : 0, "attendee" : 1, "group" : 1, "event_count" : 1 } )
+            collection_name = "rollup_attendance"
+        else:
+            agg = newAgg( self._mdb.attendeesCollection())
+            
+            agg.addMatch({ "batchID"            : self._batchID,
+                           "info.event.group.urlname" : { "$in" : urls }} )
+            
+            if self._start_date or self._end_date :
+                agg.addRangeMatch( "info.event_time", self._start_date, self._end_date )
+            
+            agg.addProject( { "_id"        : 0,
+                              "attendee"   : "$info.attendee.member.name", 
+                              "group"      : "$info.event.group.urlname",
+                              "event_name" : "$info.event.name" })
+            
+            agg.addGroup( { "_id" : {  "attendee": "$attendee", "group": "$group" },
+                            "event_count" : { "$sum" : 1 }})
+                            
+            agg.addProject( { "_id" : 0,
+                              "attendee" : "$_id.attendee",
+                              "group" : "$_id.group",
+                              "event_count" : 1 } )
+            collection_name = "attendees"
+            
+        return ( agg, collection_name )
+    
     def get_rsvps( self, urls, filename=None):   
         '''
         Lookup RSVPs by user. So for each user collect how many events they RSVPed to.
         '''
-        agg = Agg( self._mdb.attendeesCollection())
-        
-        agg.addMatch({ "batchID"            : self._batchID,
-                       "info.event.group.urlname" : { "$in" : urls }} )
-        
-        if self._start_date or self._end_date :
-            agg.addRangeMatch( "info.event_time", self._start_date, self._end_date )
-        
-        agg.addProject( { "_id"        : 0,
-                          "attendee"   : "$info.attendee.member.name", 
-                          "group"      : "$info.event.group.urlname",
-                          "event_name" : "$info.event.name" })
-        
-        agg.addGroup( { "_id" : {  "attendee": "$attendee", "group": "$group" },
-                        "event_count" : { "$sum" : 1 }})
-                        
-        agg.addProject( { "_id" : 0,
-                          "attendee" : "$_id.attendee",
-                          "group" : "$_id.group",
-                          "event_count" : 1 } )
+        ( agg, collection_name ) = self.rsvps_agg( urls )
         
         if self._sorter :
             agg.addSort( self._sorter)
@@ -463,25 +568,33 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "rsvps_view" )
             
-        formatter = CursorFormatter( agg, self._filename, self._format )
-        filename = formatter.output( fieldNames= [ "attendee", "group", "event_count" ], limit=self._limit )
+        self.export( self.aggregate( agg, collection_name ), fieldNames=[ "attendee", "group", "event_count" ], limit=self._limit )
 
-        if self._filename != "-":
-            self._files.append( self._filename )
             
-    def get_rsvp_by_event(self, urls, filename="rsvp_events"):
-        
-        agg = Agg( self._mdb.pastEventsCollection())
-        
-        agg.addMatch({ "batchID"             : self._batchID,
-                       "event.group.urlname" : { "$in" : urls }})
+    def rsvp_by_event_agg(self, urls, newAgg=Agg ):
         
-        if self._start_date or self._end_date :
-            agg.addRangeMatch( "event.time", self._start_date, self._end_date )
+        if self.useRollups():
+            agg = self._rollups.find( "group_rsvps", self._batchID, { "group" : { "$in" : urls }}, newAgg=newAgg )
+            agg.addProject( { "_id" : "$group", "rsvp_count" : 1 } )
+            collection_name = "rollup_group_rsvps"
+        else:
+            agg = newAgg( self._mdb.pastEventsCollection())
             
-        agg.addGroup( { "_id" : "$event.group.urlname",
-                        "rsvp_count" : { "$sum" : "$event.yes_rsvp_count" }})
-
+            agg.addMatch({ "batchID"             : self._batchID,
+                           "event.group.urlname" : { "$in" : urls }})
+            
+            if self._start_date or self._end_date :
+                agg.addRangeMatch( "event.time", self._start_date, self._end_date )
+                
+            agg.addGroup( { "_id" : "$event.group.urlname",
+                            "rsvp_count" : { "$sum" : "$event.yes_rsvp_count" }})
+            collection_name = "past_events"
+            
+        return ( agg, collection_name )
+    
+    def get_rsvp_by_event(self, urls, filename="rsvp_events"):
+        ( agg, collection_name ) = self.rsvp_by_event_agg( urls )
+        
         if self._sorter :
             agg.addSort( self._sorter)
             
@@ -491,33 +604,44 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "rsvps_by_event_view" )
             
-        formatter = CursorFormatter( agg.aggregate(), self._filename, self._format )
-        filename = formatter.output( fieldNames= [ "_id", "rsvp_count" ], limit=self._limit )
+        self.export( self.aggregate( agg, collection_name ), fieldNames=[ "_id", "rsvp_count" ], limit=self._limit )
+        
         
-        if self._filename != "-":
-            self._files.append( self._filename )
+    def active_users_agg(self, urls, newAgg=Agg ):
+        if self.useRollups():
+            agg = self._rollups.find( "attendance", self._batchID, { "group"     : { "$in" : urls },
+                                                                     "yes_count" : { "$gt" : 0 }}, newAgg=newAgg )
+            agg.addGroup( { "_id"    : "$attendee",
+                            "count"  : { "$sum": "$yes_count" },
+                            "groups" : { "$addToSet" : "$group" }} )
+            collection_name = "rollup_attendance"
+        else:
+            agg = newAgg( self._mdb.attendeesCollection())
+            
+            agg.addMatch({ "batchID"            : self._batchID,
+                           "info.event.group.urlname" : { "$in" : urls },
+                           "info.attendee.rsvp.response" : "yes" } )
+            
+            if self._start_date or self._end_date :
+                agg.addRangeMatch( "info.event_time", self._start_date, self._end_date )
+            
+        #     agg.addProject( { "_id" : 0,
+        #                       "name" : "$info.attendee.member.name",
+        #                       "urlname" : "$info.event.group.urlname",
+        #                       "event_name" : "$info.event.name" })
         
+            agg.addGroup( { "_id"    : "$info.attendee.member.name",
+                            "count"  : { "$sum": 1 },
+                            "groups" : { "$addToSet" : "$info.event.group.urlname" }} )
+            collection_name = "attendees"
+            
+        return ( agg, collection_name )
+    
     def get_active_users( self, urls, filename=None ):
         '''
         We define an active user as somebody who has rsvp'd to at least one event in the last six months.
         '''
-        agg = Agg( self._mdb.attendeesCollection())
-        
-        agg.addMatch({ "batchID"            : self._batchID,
-                       "info.event.group.urlname" : { "$in" : urls },
-                       "info.attendee.rsvp.response" : "yes" } )
-        
-        if self._start_date or self._end_date :
-            agg.addRangeMatch( "info.event_time", self._start_date, self._end_date )
-        
-    #     agg.addProject( { "_id" : 0,
-    #                       "name" : "$info.attendee.member.name",
-    #                       "urlname" : "$info.event.group.urlname",
-    #                       "event_name" : "$info.event.name" })
-    
-        agg.addGroup( { "_id"    : "$info.attendee.member.name",
-                        "count"  : { "$sum": 1 },
-                        "groups" : { "$addToSet" : "$info.event.group.urlname" }} )
+        ( agg, collection_name ) = self.active_users_agg( urls )
         
         if self._sorter :
             agg.addSort( self._sorter)
@@ -529,12 +653,55 @@ class MUG_Analytics( object ):
         if self._view :
             agg.create_view( self._mdb.database(), "active_users_view" )
             
-        formatter = CursorFormatter( agg, self._filename, self._format )
-        filename = formatter.output( fieldNames= [ "_id", "count", "groups" ], limit=self._limit )
+        self.export( self.aggregate( agg, collection_name ), fieldNames=[ "_id", "count", "groups" ], limit=self._limit )
 
-        if self._filename != "-":
-            self._files.append( self._filename )
        
+    def run_individually(self, stat, urls, filename ):
+        ( _, report, suffix, _, _ ) = self.COMBINABLE[ stat ]
+        getattr( self, report )( urls, filename=filename( suffix ))
+        
+    def get_combined(self, stats, urls, filename ):
+        '''
+        Run the COMBINABLE stats with one $facet aggregation for each collection they
+        read instead of one aggregation each. filename is a Filename. Stats that
+        are alone on their collection, or that need a sort or a view, are run
+        individually as is any collection whose $facet fails (e.g. because the
+        combined result is bigger than 16MB).
+        '''
+        stats = [ i for i in stats if i in self.COMBINABLE ]
+        
+        if self._sorter or self._view :
+            for stat in stats :
+                self.run_individually( stat, urls, filename )
+            return
+        
+        byCollection = {}
+        for stat in stats :
+            ( agg, collection_name ) = getattr( self, self.COMBINABLE[ stat ][ 0 ] )( urls, newAgg=Pipeline )
+            byCollection.setdefault( collection_name, [] ).append( ( stat, agg ))
+        
+        for ( collection_name, entries ) in byCollection.iteritems() :
+            if len( entries ) == 1 :
+                self.run_individually( entries[ 0 ][ 0 ], urls, filename )
+                continue
+            
+            facet = Facet( entries[ 0 ][ 1 ].collection())
+            for ( stat, agg ) in entries :
+                facet.add( stat, agg )
+            
+            try:
+                results = facet.results( list( self.aggregate( facet, collection_name )))
+            except OperationFailure, e :
+                print( "Combined aggregation on '%s' failed, running %s individually : %s" % ( collection_name, facet.names(), e ))
+                for stat in facet.names() :
+                    self.run_individually( stat, urls, filename )
+                continue
+            
+            for stat in facet.names() :
+                ( _, _, suffix, fieldNames, datemap ) = self.COMBINABLE[ stat ]
+                self._filename = filename( suffix )
+                self.export( iter( results[ stat ] ), fieldNames=fieldNames, datemap=datemap, limit=self._limit )
+                
  
     def get_totals(self, urls, countries=EU_COUNTRIES ):
         '''
@@ -546,7 +713,13 @@ class MUG_Analytics( object ):
        
         members = Members( self._mdb )
 
-        if countries is None:
+        if self.useRollups():
+            if countries is None:
+                agg = self._rollups.find( "country_totals", self._batchID )
+            else:
+                agg = self._rollups.find( "country_totals", self._batchID, { "country" : { "$in" : countries }} )
+            member_count = sum( i[ "members" ] for i in agg.aggregate())
+        elif countries is None:
             member_count = members.get_all_members().count()
         else:
             member_count = members.get_all_members( { "member.country" : { "$in" : countries }}).count()
@@ -574,7 +747,7 @@ def convert_direction( arg ):
     
 def get_batches( mdb, start, end, limit=None ):
     
-    audit = Audit( mdb )
+    audit = mdb.audit()
     
     c = CursorFormatter( audit.getCurrentValidBatches( start, end ))
     c.output( [ "batchID" , "end", "start" ], datemap=[ "start", "end" ], limit=limit)
@@ -588,6 +761,52 @@ def all_collection_stats( mdb ):
     for i in mdb.collection_names():
         yield collection_stats( mdb, i )
     
+#
+# The reports that only write their own output file and so can run in
+# parallel : ( stat, MUG_Analytics method, file suffix ).
+#
+REPORTS = [ ( "grouptotals",   "get_group_totals",   "grouptotals" ),
+            ( "groups",        "get_groups",         "groups" ),
+            ( "newmembers",    "get_new_members",    "members" ),
+            ( "events",        "get_events",         "events" ),
+            ( "rsvps",         "get_rsvps",          "rsvps" ),
+            ( "activeusers",   "get_active_users",   "active" ),
+            ( "memberhistory", "get_member_history", "memberhistory" ),
+            ( "rsvphistory",   "get_RSVP_history",   "rsvphistory" ),
+            ( "rsvpevents",    "get_rsvp_by_event",  "rsvpevents" ) ]
+
+def run_report( job ):
+    '''
+    Run one report job ( name, analytics, method, kwargs ) and return
+    ( name, files written, elapsed seconds ).
+    '''
+    ( name, analytics, method, kwargs ) = job
+    start = time.time()
+    getattr( analytics, method )( **kwargs )
+    return ( name, analytics.files(), time.time() - start )
+
+def run_reports( analytics, jobs, parallel=1 ):
+    '''
+    Run the jobs ( name, method, kwargs ) each on its own copy of analytics, parallel
+    at a time. Returns [ ( name, files, elapsed ) ] in job order.
+    '''
+    jobs = [ ( name, analytics.copy(), method, kwargs ) for ( name, method, kwargs ) in jobs ]
+    
+    if parallel > 1 and len( jobs ) > 1 :
+        pool = ThreadPool( min( parallel, len( jobs )))
+        try:
+            results = pool.map( run_report, jobs )
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [ run_report( i ) for i in jobs ]
+        
+    for ( _, files, _ ) in results :
+        analytics.files().extend( files )
+        
+    return results
+
 def main( args ):
     
 #if __name__ == '__main__':
@@ -634,6 +853,22 @@ def main( args ):
     
     parser.add_argument( "--batchid", type=int, help="Use this batch to satisfy the query")
     
+    parser.add_argument( "--buildrollups", action="store_true", default=False, 
+                         help="(Re)build the rollups for the batch before reporting [default: %(default)s]")
+    
+    parser.add_argument( "--cachedir", help="Keep query results for completed batches in this directory between runs" )
+    
+    parser.add_argument( "--gzip", action="store_true", default=False, help="gzip the output files [default: %(default)s]" )
+    
+    parser.add_argument( "--batchsize", type=int, default=1000,
+                         help="Number of documents to fetch from the server at a time when writing output [default: %(default)s]" )
+    
+    parser.add_argument( "--parallel", type=int, default=1,
+                         help="Run up to this many reports at the same time, ignored if --output is '-' [default: %(default)s]")
+    
+    parser.add_argument( "--combined", action="store_true", default=False,
+                         help="Compute grouptotals, events, rsvps, activeusers and rsvpevents with one $facet aggregation per collection [default: %(default)s]")
+    
     args = parser.parse_args()
     
     output = args.output
@@ -651,7 +886,27 @@ def main( args ):
     formatter = args.format.lower()
     
     mdb = MUGAlyserMongoDB( uri=args.host )
+    mdb.setQueryCache( QueryCache( path=args.cachedir ))
+    audit = mdb.audit()
+    
+    if args.batchid:
+        batchID =  args.batchid
+    else:
+        batchID = audit.getCurrentValidBatchID()
+        
+    #
+    # Pin the batch so every query in this run sees the same batch, even if a
+    # new batch completes while we are running.
+    #
+    if args.buildrollups :
+        print( "Building rollups for batch %i" % batchID )
+        Rollups( mdb ).build( batchID )
         
+    with audit.pin( batchID ):
+        report( mdb, args, batchID, output, prefix, formatter )
+        
+def report( mdb, args, batchID, output, prefix, formatter ):
+    
     groups = Groups( mdb )
     
     urls=[]
@@ -677,14 +932,10 @@ def main( args ):
             args.end = None
             args.start = None
                 
-    if args.batchid:
-        batchID =  args.batchid
-    else:
-        batchID = None
-        
     print( "Processing : %s" % urls )
     analytics = MUG_Analytics( mdb, output, formatter, batchID = batchID, limit=args.limit, view=args.createview )
     analytics.setRange(args.start, args.end )
+    analytics.setExport( compress=args.gzip, batchSize=args.batchsize )
     
     filename = Filename( prefix=prefix, name=args.output, ext=formatter)
     
@@ -704,33 +955,33 @@ def main( args ):
         analytics.setSort( sorter )
     
     #print( "Current batch ID: %i" % Audit( mdb ).getCurrentBatchID())
-
-    if "grouptotals" in args.stats :
-        analytics.get_group_totals( urls, filename=filename( "grouptotals" ))
-        
-    if "groups" in args.stats :
-        analytics.get_groups( urls, filename=filename( "groups" ))
     
-    if "newmembers" in args.stats :
-        analytics.get_new_members( urls, filename=filename( "members" ))
-
-    if "events" in args.stats:
-        analytics.get_events( urls, filename=filename( "events" ))
-        
-    if "rsvps" in args.stats:
-        analytics.get_rsvps( urls, filename=filename( "rsvps" ))
-        
-    if "activeusers" in args.stats:
-        analytics.get_active_users(  urls, filename=filename( "active" ))
-        
-    if "memberhistory" in args.stats :
-        analytics.get_member_history(urls,  filename=filename( "memberhistory"))
-        
-    if "rsvphistory" in args.stats :
-        analytics.get_RSVP_history(urls, filename=filename( "rsvphistory" ))
-        
-    if "rsvpevents" in args.stats:
-        analytics.get_rsvp_by_event(urls, filename=filename( "rsvpevents" ))
+    jobs = []
+    stats = args.stats
+    if args.combined :
+        jobs.append( ( "combined", "get_combined", { "stats"    : stats, 
+                                                     "urls"     : urls,
+                                                     "filename" : Filename( prefix=prefix, name=args.output, ext=formatter ) } ))
+        stats = [ i for i in stats if i not in MUG_Analytics.COMBINABLE ]
+        
+    for ( stat, method, suffix ) in REPORTS :
+        if stat in stats :
+            jobs.append( ( stat, method, { "urls" : urls, "filename" : filename( suffix ) } ))
+    
+    #
+    # Reports written to stdout would interleave so only run in parallel when
+    # each report has its own file.
+    #
+    parallel = args.parallel
+    if parallel > 1 and args.output == "-" :
+        print( "--output is '-' (stdout), running reports sequentially" )
+        parallel = 1
+        
+    timings = run_reports( analytics, jobs, parallel )
+    
+    if args.parallel > 1 :
+        for ( name, _, elapsed ) in timings :
+            print( "{:16} {:8.2f}s".format( name, elapsed ))
         
     if "totals" in args.stats:
         analytics.get_totals( urls, countries=countries )
@@ -744,6 +995,8 @@ def main( args ):
         elif args.output == "-" :
             print( "--output is '-' (stdout), ignoring --upload" )
             print( "Please specify a --output filename to upload files")
+        elif args.gzip :
+            print( "--gzip output can't be converted to a gsheet, ignoring --upload" )
         else:
             drive = GDrive()
             drive.get_credentials()
@@ -15,6 +15,8 @@ if __name__ == '__main__':
     
     args = parser.parse_args()
     mugdb = MUGAlyserMongoDB( args.host )
+    mugdb.ensureSchema()
+    mugdb.audit().migrate()
     db = mugdb.database()
     result = db.command( { "ismaster" : 1 })
     pprint.pprint( result )
\ No newline at end of file
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+'''
+Created on 18 Oct 2026
+
+Explain the standard MUGAlyser queries against a database and report the
+ones that do a COLLSCAN or examine too many index keys. Exits with status 1
+if any query is flagged.
+
+@author: jdrumgoole
+'''
+
+import sys
+from argparse import ArgumentParser
+
+from mugalyser.mongodb import MUGAlyserMongoDB
+from mugalyser.explain import explain_templates
+
+def main():
+
+    parser = ArgumentParser()
+    parser.add_argument( '--host', default="mongodb://localhost:27017/MUGS", help='URI to connect to : [default: %(default)s]')
+    parser.add_argument( '--ratio', type=int, default=10,
+                         help="Flag queries that examine more than this many keys per returned document [default: %(default)s]")
+
+    args = parser.parse_args()
+    mdb = MUGAlyserMongoDB( args.host )
+
+    flagged = 0
+    for ( name, collection_name, a ) in explain_templates( mdb, args.ratio ):
+        if a[ "flagged" ] :
+            flagged = flagged + 1
+            status = "FLAGGED: %s" % a[ "flagged" ]
+        elif a[ "expected" ] :
+            status = "expected: %s" % a[ "expected" ]
+        else:
+            status = "ok"
+
+        print( "{:36} {:16} {:28} keys: {:8} docs: {:8} returned: {:8} {}".format( name, collection_name,
+                                                                                   "/".join( a[ "stages" ] ),
+                                                                                   a[ "keys" ], a[ "docs" ], a[ "returned" ],
+                                                                                   status ))
+    print( "%i queries flagged" % flagged )
+
+    if flagged > 0 :
+        sys.exit( 1 )
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,7 @@ mugalyser_main -- Grab MUG Stats and stuff them into a MongoDB Database
 '''
 
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from argparse import ArgumentParser
 import logging
 import os
@@ -19,9 +19,10 @@ import pymongo
 
 from mugalyser.apikey import get_meetup_key
 from mugalyser.meetup_api import MeetupAPI
-from mugalyser.audit import Audit
 from mugalyser.mongodb import MUGAlyserMongoDB
 from mugalyser.meetup_writer import MeetupWriter
+from mugalyser.ratelimiter import RateLimiter, FileRateLimiter
+from mugalyser.delta import deltaChain
 
 __programName__ = "MUGAlyser"
 __version__ = "0.8 beta"
@@ -102,6 +103,45 @@ access to the admin APIs.
         
         parser.add_argument( '--apikey', default=None, help='Default API key for meetup')
         
+        parser.add_argument( '--poolsize', type=int, default=10, 
+                             help="Maximum number of pooled HTTP connections to the Meetup API [default: %(default)s]")
+        parser.add_argument( '--nokeepalive', default=False, action="store_true", 
+                             help="Close HTTP connections after each request [default: %(default)s]")
+        
+        parser.add_argument( '--ratelimitfile', default=None,
+                             help="Share the Meetup API rate limit with other processes using this file [default: %(default)s]")
+        parser.add_argument( '--workers', type=int, default=1, 
+                             help="Number of groups to capture in parallel [default: %(default)s]")
+        
+        parser.add_argument( '--attendeeworkers', type=int, default=1, 
+                             help="Number of events per group to fetch attendees for in parallel [default: %(default)s]")
+        parser.add_argument( '--unorderedattendees', default=False, action="store_true", 
+                             help="Write attendees as they arrive rather than in event order [default: %(default)s]")
+        
+        parser.add_argument( '--incremental', default=False, action="store_true", 
+                             help="Link unchanged past events and final attendance from the last valid batch instead of fetching them again [default: %(default)s]")
+        parser.add_argument( '--window', type=int, default=7, 
+                             help="Days of recent events whose details and attendance are refetched in --incremental mode [default: %(default)s]")
+        
+        parser.add_argument( '--resume', type=int, default=None,
+                             help="Finish an incomplete batch, skipping the groups and phases it has already completed [default: %(default)s]")
+        
+        parser.add_argument( '--writelimit', type=int, default=500, 
+                             help="Maximum number of documents per bulk write [default: %(default)s]")
+        parser.add_argument( '--flushinterval', type=float, default=5.0, 
+                             help="Maximum number of seconds between bulk writes [default: %(default)s]")
+        
+        parser.add_argument( '--writers', type=int, default=0, 
+                             help="Number of background writer threads, 0 writes inline with fetching [default: %(default)s]")
+        
+        parser.add_argument( '--dedup', default=False, action="store_true", 
+                             help="Store documents unchanged since an earlier batch once and link them to this batch [default: %(default)s]")
+        
+        parser.add_argument( '--delta', default=False, action="store_true", 
+                             help="Only record changes since the last valid batch [default: %(default)s]")
+        parser.add_argument( '--snapshotevery', type=int, default=7, 
+                             help="In --delta mode write a full batch after this many delta batches [default: %(default)s]")
+        
         parser.add_argument( '--urlfile', 
                              help="File containing a list of MUG URLs to be used to parse data [ default: %(default)s]")
         # Process arguments
@@ -143,16 +183,45 @@ access to the admin APIs.
             
         mdb = MUGAlyserMongoDB( args.host )
         
-        audit = Audit( mdb )
+        audit = mdb.audit()
+        audit.migrate()
         
-        batchID = audit.startBatch( { "args"    : vars( args ), 
-                                      "version" : __programName__ + " " + __version__,
-                                      "pro_account" : args.pro },
-                                      trial=args.trialrun,
-                                      apikey=apikey )
+        if args.delta and ( args.incremental or args.resume ):
+            print( "--delta can't be combined with --incremental or --resume" )
+            sys.exit( 1 )
+            
+        #
+        # A delta batch records a delete for every entity of the previous batch it doesn't
+        # see, so it has to capture every group and phase.
+        #
+        if args.delta and ( args.mugs or args.phases != [ "all" ] ):
+            print( "--delta can't be combined with --mugs or --phases" )
+            sys.exit( 1 )
+            
+        storage = "full"
+        if args.delta :
+            try:
+                ( base, deltas ) = deltaChain( audit, audit.getCurrentValidBatchID())
+                if base is not None and len( deltas ) < args.snapshotevery :
+                    storage = "delta"
+            except ValueError :
+                pass
+            
+        if args.resume :
+            batchID = audit.resumeBatch( args.resume )
+            completed = audit.getCheckpoints( batchID )
+            logging.info( "Resuming batch ID: %i (%i phases already complete)", batchID, len( completed ))
+        else:
+            batchID = audit.startBatch( { "args"    : vars( args ), 
+                                          "version" : __programName__ + " " + __version__,
+                                          "pro_account" : args.pro,
+                                          "storage"     : storage },
+                                          trial=args.trialrun,
+                                          apikey=apikey )
+            completed = None
 
         start = datetime.utcnow()
-        logging.info( "Started MUG processing for batch ID: %i", batchID )
+        logging.info( "Started MUG processing for batch ID: %i (%s)", batchID, storage )
         logging.info( "Writing to database : '%s'", mdb.database().name )
         if nopro:
             logging.info( "Using standard API calls (no pro account API key)")
@@ -164,12 +233,32 @@ access to the admin APIs.
         else:
             logging.info( "Using pro API calls (pro account API key)")
             
+        if args.ratelimitfile :
+            rate_limiter = FileRateLimiter( args.ratelimitfile )
+        else:
+            rate_limiter = RateLimiter()
+            
+        api = MeetupAPI( apikey, 
+                         pool_maxsize=max( args.poolsize, args.workers * args.attendeeworkers ), 
+                         keep_alive=not args.nokeepalive,
+                         rate_limiter=rate_limiter )
+        
         if nopro:
             logging.info( "Processing %i MUG URLS", len( mugList ))
         else:
-            mugList = list( MeetupAPI().get_pro_group_names())
+            mugList = list( api.get_pro_group_names())
         
-        writer = MeetupWriter( audit, mdb, mugList,  apikey )
+        writer = MeetupWriter( audit, mdb, mugList,  apikey, meetup_api=api,
+                               attendee_workers=args.attendeeworkers,
+                               ordered_attendees=not args.unorderedattendees,
+                               incremental=args.incremental,
+                               incremental_window=timedelta( days=args.window ),
+                               completed=completed,
+                               write_limit=args.writelimit,
+                               flush_interval=args.flushinterval,
+                               pipeline_writers=args.writers,
+                               dedup=args.dedup,
+                               delta=( storage == "delta" ))
             
         if "all" in args.phases :
             phases = [ "groups", "members", "upcomingevents", "pastevents"]
@@ -180,22 +269,27 @@ access to the admin APIs.
         
         if  "groups" in phases :
             logging.info( "processing group info for %i groups: nopro=%s", len( mugList), nopro )
-            writer.processGroups( nopro )
+            writer.run_phase( "groups", None, writer.processGroups, nopro )
             phases.remove( "groups")
         if "members" in phases :
             logging.info( "processing members info for %i groups: nopro=%s", len( mugList), nopro )
-            writer.processMembers( nopro )
+            writer.run_phase( "members", None, writer.processMembers, nopro )
             phases.remove( "members")
             
-        for i in mugList :
-            writer.capture_snapshot( i, args.admin, phases )
-        
-        audit.endBatch( batchID )
+        writer.capture_snapshots( mugList, args.admin, phases, args.workers )
+        #
+        # Delta batches are materialized here, before the batch ends, so readers only
+        # ever see complete batches and the rollups can be built from them.
+        #
+        writer.finish()
+        audit.endBatch( batchID, rollup=not args.trialrun )
         end = datetime.utcnow()
     
         elapsed = end - start
             
         logging.info( "MUG processing took %s for BatchID : %i", elapsed, batchID )
+        writer.write_stats().report()
+        api.close()
 
     except KeyboardInterrupt:
         print("Keyboard interrupt : Exiting...")
@@ -12,11 +12,12 @@ from argparse import ArgumentParser
 import sys
 from pprint import pprint
 from dateutil.parser import parse
-from mugalyser.audit import Audit
 from mugalyser.mongodb import MUGAlyserMongoDB
 from mugalyser.members import Members, Organizers
 from mugalyser.events import UpcomingEvents, PastEvents
 from mugalyser.groups import Groups
+from mugalyser.mugdata import makeProjection
+from mugalyser.querycache import QueryCache
 from mugalyser.generator_utils import printCount
 from datetime import datetime
 from utils.query import Query
@@ -69,12 +70,15 @@ def main( argv=None ) :
         parser.add_argument( "--start", help="Range used for fields in which ranges relevant" )
         parser.add_argument( "--finish", help="Range used for fields in which ranges relevant" )
          
+        parser.add_argument( "--cachedir", help="Keep query results for completed batches in this directory between runs" )
+        
         parser.add_argument( "-f", "--format_type", choices=[ "oneline", "summary", "full" ], default="oneline", help="type of output")
         # Process arguments
 
         args = parser.parse_args()
 
         mdb = MUGAlyserMongoDB( uri=args.host )
+        mdb.setQueryCache( QueryCache( path=args.cachedir ))
              
         members = Members( mdb )
         
@@ -83,7 +87,7 @@ def main( argv=None ) :
             sys.exit( 2 )
             
         if args.curbatch :
-            audit = Audit( mdb )
+            audit = mdb.audit()
             curbatch = audit.getCurrentValidBatchID()
             print ( "current batch ID = {'batchID': %i}" % curbatch )
             
@@ -105,7 +109,7 @@ def main( argv=None ) :
         for i in args.hasgroup:
     
             groups = Groups( mdb )
-            if groups.get_group( i ) :
+            if groups.get_group( i, { "_id" : 1 } ) :
                 print( "{:40} :is a MongoDB MUG".format( i ))
             else:
                 print( "{:40} :is not a MongoDB MUG".format( i ))
@@ -131,7 +135,7 @@ def main( argv=None ) :
             if not args.host:
                 print( "Need to specify --host for batchIDs")
                 sys.exit( 2 )
-            audit = Audit( mdb )
+            audit = mdb.audit()
             batchIDs = audit.getBatchIDs()
             for b in batchIDs :
                 print( b )
@@ -148,22 +152,27 @@ def main( argv=None ) :
             elif args.start and args.finish :
                 q.add_range( "member.join_time", parse( args.start ), parse( args.finish )) 
                 
+            #
+            # Only fetch the fields we print, for pro and non pro member formats.
+            #
+            projection = makeProjection( [ "member.member_name", "member.member_id", 
+                                           "member.name", "member.id", "member.country" ] )
             if "all" in args.members : 
-                it = members.get_all_members( q )
+                it = members.get_all_members( q, projection )
             else:
-                it = members.get_many_group_members( args.members )
+                it = members.get_many_group_members( args.members, q, projection )
                 
-                for i in it :
-                    count = count + 1
-                    #
-                    # sometimes country is not defined.
-                    #
-                    country = i[ "member" ].pop( "country", "Undefined")
-        
-                    if "member_id" in i["member"] : # PRO API member format
-                        print( u"{:30}, {:20}, {:20}".format( i["member"][ "member_name"], country, i["member"][ "member_id"]) )
-                    else:
-                        print( u"{:30}, {:20}, {:20}".format( i["member"][ "name"], country, i["member"][ "id"]) )
+            for i in it :
+                count = count + 1
+                #
+                # sometimes country is not defined.
+                #
+                country = i[ "member" ].pop( "country", "Undefined")
+    
+                if "member_id" in i["member"] : # PRO API member format
+                    print( u"{:30}, {:20}, {:20}".format( i["member"][ "member_name"], country, i["member"][ "member_id"]) )
+                else:
+                    print( u"{:30}, {:20}, {:20}".format( i["member"][ "name"], country, i["member"][ "id"]) )
                 
             print( "%i total" % count )
     
@@ -180,15 +189,15 @@ def main( argv=None ) :
             
         if args.upcomingevents:
             events = UpcomingEvents( mdb )
-            events.count_print( events.get_all_group_events(args.upcomingevents ), args.format_type )
+            events.count_print( events.get_all_group_events(args.upcomingevents, events.projection( args.format_type )), args.format_type )
 
         if args.pastevents:
             events = PastEvents( mdb )
-            events.count_print( events.get_all_group_events( args.pastevents ), args.format_type)
+            events.count_print( events.get_all_group_events( args.pastevents, events.projection( args.format_type )), args.format_type)
             
         if "all" in args.organizer  :
             organizers = Organizers( mdb )
-            members = organizers.get_organizers()
+            members = organizers.get_organizers( organizers.projection( args.format_type ))
             organizers.count_print( members, args.format_type )
         else:
             organizers = Organizers( mdb )
@@ -0,0 +1,90 @@
+'''
+Created on 18 Oct 2026
+
+AsyncMeetupAPI mirrors the calls in MeetupAPI but runs them for many groups
+at once. Each call takes a list of groups and returns a generator that yields
+( url_name, doc ) pairs as the pages arrive. At most concurrency paginators
+are in flight at any one time and they all share the pooled HTTP session of
+the underlying MeetupAPI object.
+
+@author: jdrumgoole
+'''
+
+from mugalyser.apikey import get_meetup_key
+from mugalyser.meetup_api import MeetupAPI
+from mugalyser.generator_utils import concurrent_generate
+
+
+class AsyncMeetupAPI( object ):
+    '''
+    Concurrent version of the MeetupAPI interface.
+    '''
+
+    def __init__(self, apikey = get_meetup_key(), items=100, concurrency=8, ordered=False, meetup_api=None, rate_limiter=None ):
+        '''
+        Constructor
+
+        concurrency : the maximum number of requests in flight at once.
+        ordered     : if True results are yielded group by group in the order the groups
+                      were passed in. Otherwise they are yielded as they arrive.
+        
+        All the concurrent requests are paced by a single rate_limiter (see MeetupAPI).
+        '''
+
+        if meetup_api is None:
+            self._api = MeetupAPI( apikey, items, pool_maxsize=concurrency, rate_limiter=rate_limiter )
+        else:
+            self._api = meetup_api
+
+        self._concurrency = concurrency
+        self._ordered = ordered
+
+    def api(self):
+        return self._api
+
+    def close(self):
+        self._api.close()
+
+    def _gather(self, func, keys ):
+        tasks = [ ( k, ( lambda k=k : func( k ))) for k in keys ]
+        return concurrent_generate( tasks, workers=self._concurrency, ordered=self._ordered )
+
+    def _background(self, func ):
+        for ( _, doc ) in concurrent_generate( [ ( None, func ) ], workers=1 ):
+            yield doc
+
+    def get_group(self, url_names ):
+        return self._gather( lambda url_name : [ self._api.get_group( url_name ) ], url_names )
+
+    def get_members(self, url_names ):
+        return self._gather( self._api.get_members, url_names )
+
+    def get_past_events(self, url_names ):
+        return self._gather( self._api.get_past_events, url_names )
+
+    def get_upcoming_events(self, url_names ):
+        return self._gather( self._api.get_upcoming_events, url_names )
+
+    def get_event_attendees(self, events ):
+        '''
+        events is a list of ( eventID, url_name ) pairs. Yields ( ( eventID, url_name ), attendee ).
+        '''
+        return self._gather( lambda event : self._api.get_event_attendees( event[ 0 ], event[ 1 ] ), events )
+
+    def get_member_by_id(self, member_ids ):
+        return self._gather( lambda member_id : [ self._api.get_member_by_id( member_id ) ], member_ids )
+
+    def get_pro_groups(self ):
+        '''
+        Pro calls are a single paginated request so they can't be split across groups. Instead
+        we fetch the pages in the background so the next page is retrieved while the caller
+        processes the current one.
+        '''
+        return self._background( self._api.get_pro_groups )
+
+    def get_pro_members(self ):
+        return self._background( self._api.get_pro_members )
+
+    def get_pro_group_names(self ):
+        for i in self.get_pro_groups() :
+            yield i[ "urlname" ]
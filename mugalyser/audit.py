@@ -52,50 +52,142 @@ have an end date field.
 '''
 
 import pymongo
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from mugalyser.version import __programName__, __version__, __schemaVersion__
 from mongodb_utils.agg import Agg, Sorter
 from mugalyser.apikey import get_meetup_key
 
+class BatchIDCache( object ):
+    '''
+    Remembers the current valid batch ID for each audit collection so that we don't
+    run a sorted query on the audit collection for every query on the data. The cached
+    value goes stale when a batch ends. endBatch invalidates it in this process, other
+    processes (e.g. the webgui while mugalyser_main runs) see the new batch once the
+    entry is ttl seconds old.
+    
+    A batch ID can also be pinned, in which case every lookup returns the pinned ID
+    until the pin is released. Pins nest, are seen by every thread and never expire.
+    '''
+    
+    def __init__(self, ttl=30, clock=time.time ):
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        self._clock = clock
+        self._valid = {}
+        self._pinned = {}
+        
+    def get(self, key, func ):
+        with self._lock :
+            if key in self._pinned :
+                return self._pinned[ key ][ -1 ]
+            if key in self._valid :
+                ( value, expires ) = self._valid[ key ]
+                if self._clock() < expires :
+                    return value
+            
+        value = func()
+        
+        with self._lock :
+            self._valid[ key ] = ( value, self._clock() + self._ttl )
+        return value
+    
+    def pinned(self, key ):
+        with self._lock :
+            if key in self._pinned :
+                return self._pinned[ key ][ -1 ]
+            else:
+                return None
+            
+    def invalidate(self, key=None ):
+        with self._lock :
+            if key is None :
+                self._valid.clear()
+            else:
+                self._valid.pop( key, None )
+    
+    @contextmanager
+    def pin(self, key, batchID ):
+        with self._lock :
+            self._pinned.setdefault( key, [] ).append( batchID )
+        try:
+            yield batchID
+        finally:
+            with self._lock :
+                self._pinned[ key ].pop()
+                if len( self._pinned[ key ] ) == 0 :
+                    del self._pinned[ key ]
+                    
+batchIDCache = BatchIDCache()
+
 class Audit( object ):
     
     name="audit"
     
     def __init__(self, mdb ):
-        
+        '''
+        Constructing an Audit object doesn't touch the database. Use mdb.audit() to
+        share one Audit object per database connection and call migrate() once
+        (mugalyser_main and mug_db_setup do this) to bring the Current Batch document
+        up to the current schema.
+        '''
         self._mdb = mdb
         self._auditCollection = mdb.auditCollection()
-        self._currentBatch = self._auditCollection.find_one( { "name" : "Current Batch"})
-        
-        if self._currentBatch is None:
-            self._currentBatch = {}
-            self._currentBatch[ "name"] = "Current Batch"
-            self._currentBatch[ "currentID" ] = 0
-            self._currentBatch[ "batchID" ] = 0
-            self._currentBatch[ 'valid'] = False
-            self._currentBatch[ "schemaVersion" ] = __version__
-            self._auditCollection.insert_one( self._currentBatch )
-        else:
-            # Migrate schema from version 0.7 to 0.8
-            if self._currentBatch.has_key( "ID" ):
-                self._auditCollection.update( { "_id" : self._currentBatch[ "_id"]},
-                                              { "$rename" : { "ID" : "currentID" }})
-                
-                curid = self._currentBatch[ "ID"]
-                del self._currentBatch[ "ID"]
-                self._currentBatch[ "currentID" ]= curid
-                
-            if not "batchID" in self._currentBatch :
-                self._auditCollection.update( { "_id" : self._currentBatch[ "_id"]},
-                                              { "$set" : { "batchID" : 0 }})
-            
-                self._currentBatch[ "batchID" ] = 0
-            
-            self._auditCollection.update( { "_id" : self._currentBatch[ "_id"]},
-                                          { "$set" : { "schemaVersion" : __schemaVersion__  }})
-
         self._currentBatchID = None
+        self._finished = set()
+        
+    def migrate(self ):
+        '''
+        Create the Current Batch document if it doesn't exist and migrate an old one
+        to the current schema version.
+        '''
+        currentBatch = self._auditCollection.find_one( { "name" : "Current Batch"})
+        
+        if currentBatch is None:
+            self._auditCollection.update_one( { "name" : "Current Batch" },
+                                              { "$setOnInsert" : self._currentBatchDoc() },
+                                              upsert=True )
+            return
+        
+        # Migrate schema from version 0.7 to 0.8
+        if currentBatch.has_key( "ID" ):
+            self._auditCollection.update( { "_id" : currentBatch[ "_id"]},
+                                          { "$rename" : { "ID" : "currentID" }})
+            
+        if not "batchID" in currentBatch :
+            self._auditCollection.update( { "_id" : currentBatch[ "_id"]},
+                                          { "$set" : { "batchID" : 0 }})
         
+        if currentBatch.get( "schemaVersion" ) != __schemaVersion__ :
+            self._auditCollection.update( { "_id" : currentBatch[ "_id"]},
+                                          { "$set" : { "schemaVersion" : __schemaVersion__  }})
+            
+    @staticmethod
+    def _currentBatchDoc():
+        return { "currentID"     : 0,
+                 "batchID"       : 0,
+                 "valid"         : False,
+                 "schemaVersion" : __schemaVersion__ }
+    
+    def _cacheKey(self ):
+        return ( self._mdb.uri(), self._auditCollection.full_name, get_meetup_key())
+    
+    def pin(self, batchID ):
+        '''
+        Context manager that makes batchID the current valid batch for every query made
+        through an Audit object on this database until it exits. Use it to run a set of
+        queries against one consistent batch.
+        '''
+        return batchIDCache.pin( self._cacheKey(), batchID )
+    
+    def pinned(self ):
+        '''
+        The pinned batch ID or None.
+        '''
+        return batchIDCache.pinned( self._cacheKey())
+    
     def collection(self):
         return self._auditCollection
         
@@ -151,10 +243,16 @@ class Audit( object ):
         #
         # We can have multiple batches running in parallel as long as each has a unique
         # batch ID. Find And Modify ensures that each batch ID is unique.
+        # The upsert creates the Current Batch document the first time round.
+        #
+        setOnInsert = self._currentBatchDoc()
+        del setOnInsert[ "currentID" ]
         curBatch = self._auditCollection.find_and_modify( { "name" : "Current Batch" },
                                                           update= { "$inc" : { "currentID" : 1 },
-                                                                    "$set" : { "timestamp" : datetime.now() }},
-                                                         new = True )
+                                                                    "$set" : { "timestamp" : datetime.now() },
+                                                                    "$setOnInsert" : setOnInsert },
+                                                          upsert = True,
+                                                          new = True )
         
         return curBatch[ "currentID" ]
 #         self._currentBatch[ "currentID" ] = self.getCurrentBatchID()  + 1
@@ -181,30 +279,148 @@ class Audit( object ):
         
         return thisBatchID
         
+    def linkBatch(self, collection, query, fromBatchID, toBatchID=None ):
+        '''
+        Make the documents in collection that match query in batch fromBatchID part of
+        batch toBatchID (the current batch by default) without copying them. 
+        
+        The batchID field of the linked documents becomes an array of batch IDs. Queries
+        of the form { "batchID" : X } and { "batchID" : { "$in" : [...] }} still work
+        as MongoDB matches an array field on any of its elements.
+        
+        Returns the number of documents linked.
+        '''
+        if toBatchID is None:
+            toBatchID = self.getCurrentBatchID()
+            
+        batchQuery = dict( query )
+        batchQuery[ "batchID" ] = fromBatchID
+        
+        scalarQuery = dict( batchQuery )
+        scalarQuery[ "batchID.0" ] = { "$exists" : False }
+        collection.update_many( scalarQuery, { "$set" : { "batchID" : [ fromBatchID ] }} )
+        
+        result = collection.update_many( batchQuery, { "$addToSet" : { "batchID" : toBatchID }} )
+        return result.modified_count
+    
+    def unlinkBatch(self, collection, query, batchID ):
+        '''
+        The reverse of linkBatch. Remove the documents in collection that match query from
+        batch batchID. Documents that only belong to batchID are deleted, documents linked
+        from other batches just lose batchID from their batchID array.
+        '''
+        batchQuery = dict( query )
+        batchQuery[ "batchID" ] = batchID
+        
+        scalarQuery = dict( batchQuery )
+        scalarQuery[ "batchID.0" ] = { "$exists" : False }
+        collection.delete_many( scalarQuery )
+        
+        onlyQuery = dict( query )
+        onlyQuery[ "batchID" ] = [ batchID ]
+        collection.delete_many( onlyQuery )
+        
+        collection.update_many( batchQuery, { "$pull" : { "batchID" : batchID }} )
+        
+    def checkpoint(self, batchID, phase, url_name=None ):
+        '''
+        Record that phase has been completed for url_name (None for phases like groups and
+        members that cover all groups) in batch batchID.
+        '''
+        self._auditCollection.update_one( { "batchID" : batchID },
+                                          { "$addToSet" : { "checkpoints" : { "phase" : phase,
+                                                                              "group" : url_name }}} )
+        
+    def getCheckpoints(self, batchID ):
+        '''
+        Return the set of ( phase, url_name ) pairs completed for batchID.
+        '''
+        batch = self.getBatch( batchID )
+        if batch is None or not "checkpoints" in batch :
+            return set()
+        else:
+            return set( ( i[ "phase" ], i[ "group" ] ) for i in batch[ "checkpoints" ] )
+        
+    def resumeBatch(self, batchID ):
+        '''
+        Make an incomplete batch the current batch again so that a failed run can be finished.
+        '''
+        batch = self.getBatch( batchID )
+        
+        if batch is None or batchID == 0 :
+            raise ValueError( "No such batch: %s" % batchID )
+        elif batch[ "end" ] is not None :
+            raise ValueError( "Batch %i has already completed" % batchID )
+        
+        self._currentBatchID = batchID
+        
+        return batchID
+    
+    def isFinished(self, batchID ):
+        '''
+        True if batchID is a single batch that has ended. A batch can't be restarted
+        once it has ended so we only go to the database until we have seen it end.
+        '''
+        if not isinstance( batchID, ( int, long )):
+            return False
+        
+        if batchID in self._finished :
+            return True
+        
+        batch = self.getBatch( batchID )
+        if batch is not None and batch.get( "end" ) is not None :
+            self._finished.add( batchID )
+            return True
+        else:
+            return False
+        
+    def validBatchIDs(self, batchIDs ):
+        '''
+        The set of batchIDs that are complete, non trial batches, in one query.
+        '''
+        if len( batchIDs ) == 0 :
+            return set()
+        return set( i[ "batchID" ] for i in self._auditCollection.find( { "batchID" : { "$in" : list( batchIDs ) },
+                                                                           "end"     : { "$type" : "date" },
+                                                                           "trial"   : False }, 
+                                                                         { "batchID" : 1 } ))
+        
     def getBatch(self, batchID ):
         return self._auditCollection.find_one( { "batchID" : batchID })
     
     def incomplete(self, batchID ):
         return self.getBatch( batchID )[ "end" ] == None
         
-    def endBatch(self, batchID ):
+    def endBatch(self, batchID, rollup=False ):
+        '''
+        Mark batchID as complete. If rollup is True build the analytics rollups for
+        the batch (see mugalyser.rollups).
+        '''
         self._auditCollection.update( { "batchID" : batchID },
                                       { "$set" : { "end"  : datetime.now(), 
                                                   "valid" : True }})
         
         self._currentBatchID = None
+        batchIDCache.invalidate( self._cacheKey())
+        
+        if rollup :
+            from mugalyser.rollups import Rollups
+            Rollups( self._mdb ).build( batchID )
         
     def auditCollection(self):
         return self._auditCollection
     
     def getLastBatchID(self):
         curBatch = self._auditCollection.find_one( { "name" : 'Current Batch'} )
-        if curBatch[ "currentID" ] < 2 :
+        if curBatch is None or curBatch[ "currentID" ] < 2 :
             raise ValueError( "No valid last batch")
         else:
             return curBatch[ "currentID"] - 1
     
     def getCurrentValidBatchID( self ):
+        return batchIDCache.get( self._cacheKey(), self._findCurrentValidBatchID )
+    
+    def _findCurrentValidBatchID( self ):
         curBatch = self._auditCollection.find( { "apikey" : get_meetup_key(),
                                                  "end"    : { "$type" : "date" }, #17 BSON type for timestamp
                                                  "trial"  : False } ).sort( "batchID", pymongo.DESCENDING ).limit( 1 )
@@ -218,6 +434,15 @@ class Audit( object ):
             except StopIteration :
                 raise ValueError( "Have you set a valid API key? (APIKEY='%s')" % get_meetup_key())
             
+    def getValidBatchesBefore( self, batchID ):
+        '''
+        Return a cursor of the valid batch documents up to and including batchID, newest first.
+        '''
+        return self._auditCollection.find( { "apikey"  : get_meetup_key(),
+                                             "end"     : { "$type" : "date" },
+                                             "trial"   : False,
+                                             "batchID" : { "$gt" : 0, "$lte" : batchID }} ).sort( "batchID", pymongo.DESCENDING )
+            
     def getCurrentValidBatches( self, start=None, end=None ):
         
         agg = Agg( self._auditCollection )
@@ -248,7 +473,7 @@ class Audit( object ):
         else:
             curBatch = self._auditCollection.find_one( { "name" : 'Current Batch'} )
             
-            if curBatch[ "currentID" ] == 0 :
+            if curBatch is None or curBatch[ "currentID" ] == 0 :
                 raise ValueError( "No batches in database" )
             else:
                 return curBatch[ "currentID" ]
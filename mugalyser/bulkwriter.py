@@ -0,0 +1,294 @@
+'''
+Created on 18 Oct 2026
+
+BulkWriter accumulates documents and writes them to a collection with
+insert_many. A batch is flushed when it reaches writeLimit documents,
+byteLimit bytes of BSON or when flushInterval seconds have passed since
+the last flush, whichever comes first. close() always flushes whatever
+is left.
+
+PipelinedWriter has the same interface but hands documents to one or more
+writer threads through a bounded queue, so the caller can carry on fetching
+from the Meetup API while earlier documents are being written.
+
+With dedup=True documents are stored by content. Each document is hashed
+(ignoring its batchID and timestamp) and written as an upsert on the hash.
+A document that is byte for byte the same as one already stored is not
+stored again, instead the current batchID is added to the batchID array of
+the existing document. As MongoDB matches array fields element by element
+queries on { "batchID" : X } still see the complete batch.
+
+WriteStats collects the number of documents and flush times for each
+collection so we can report docs/sec and flush latency at the end of a run.
+
+@author: jdrumgoole
+'''
+
+import threading
+import logging
+import time
+import Queue
+import sys
+import json
+import hashlib
+from datetime import datetime
+
+from bson import BSON
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+def _jsonDefault( o ):
+    #
+    # Dates read back from MongoDB are timezone aware, the ones from the API are not.
+    #
+    if isinstance( o, datetime ) :
+        return o.replace( tzinfo=None ).isoformat()
+    else:
+        return str( o )
+    
+def contentHash( doc ):
+    '''
+    A hash of doc that ignores the fields that change on every batch.
+    '''
+    content = dict( ( k, v ) for ( k, v ) in doc.items() if not k in ( "_id", "batchID", "timestamp", "contentHash" ))
+    return hashlib.sha1( json.dumps( content, sort_keys=True, default=_jsonDefault )).hexdigest()
+
+def dedupUpdate( doc ):
+    h = contentHash( doc )
+    payload = dict( ( k, v ) for ( k, v ) in doc.items() if k != "batchID" )
+    return UpdateOne( { "contentHash" : h },
+                      { "$addToSet"    : { "batchID" : doc[ "batchID" ] },
+                        "$setOnInsert" : payload },
+                      upsert=True )
+
+
+class WriteStats( object ):
+
+    def __init__(self ):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, docs, elapsed ):
+        with self._lock :
+            if not name in self._stats :
+                self._stats[ name ] = { "docs"    : 0,
+                                        "flushes" : 0,
+                                        "elapsed" : 0.0,
+                                        "max"     : 0.0,
+                                        "start"   : time.time() - elapsed }
+            s = self._stats[ name ]
+            s[ "docs" ]    = s[ "docs" ] + docs
+            s[ "flushes" ] = s[ "flushes" ] + 1
+            s[ "elapsed" ] = s[ "elapsed" ] + elapsed
+            s[ "max" ]     = max( s[ "max" ], elapsed )
+            s[ "end" ]     = time.time()
+
+    def stats(self, name ):
+        '''
+        Return a summary for collection name:
+        docs, flushes, docs_per_sec (over the wall clock time from first to last flush),
+        avg_flush and max_flush (seconds).
+        '''
+        with self._lock :
+            s = dict( self._stats[ name ] )
+
+        duration = s[ "end" ] - s[ "start" ]
+        if duration > 0 :
+            rate = s[ "docs" ] / duration
+        else:
+            rate = 0.0
+
+        return { "docs"         : s[ "docs" ],
+                 "flushes"      : s[ "flushes" ],
+                 "docs_per_sec" : rate,
+                 "avg_flush"    : s[ "elapsed" ] / s[ "flushes" ],
+                 "max_flush"    : s[ "max" ] }
+
+    def names(self ):
+        with self._lock :
+            return sorted( self._stats.keys())
+
+    def report(self ):
+        for name in self.names() :
+            s = self.stats( name )
+            logging.info( "%-16s: %8i docs, %6i flushes, %8.1f docs/sec, flush avg %.3fs max %.3fs",
+                          name, s[ "docs" ], s[ "flushes" ], s[ "docs_per_sec" ], s[ "avg_flush" ], s[ "max_flush" ] )
+
+
+class BulkWriter( object ):
+
+    def __init__(self, collection, processFunc=None, newFieldName=None, orderedWrites=False,
+                 writeLimit=500, byteLimit=8 * 1024 * 1024, flushInterval=5.0, stats=None, dedup=False ):
+        '''
+        If processFunc is not None each document is transformed by processFunc( newFieldName, doc )
+        before it is written. orderedWrites=False lets the server apply each insert_many in
+        any order and carry on past individual failures. If dedup is True documents are
+        stored by content hash (see above).
+        '''
+        self._collection = collection
+        self._processFunc = processFunc
+        self._newFieldName = newFieldName
+        self._ordered = orderedWrites
+        self._writeLimit = writeLimit
+        self._byteLimit = byteLimit
+        self._flushInterval = flushInterval
+        self._dedup = dedup
+        if stats is None :
+            self._stats = WriteStats()
+        else:
+            self._stats = stats
+
+        self._buffer = []
+        self._bytes = 0
+        self._lastFlush = time.time()
+
+    def stats(self ):
+        return self._stats
+
+    def send(self, doc ):
+        if self._processFunc :
+            doc = self._processFunc( self._newFieldName, doc )
+
+        self._buffer.append( doc )
+        self._bytes = self._bytes + len( BSON.encode( doc ))
+
+        if ( len( self._buffer ) >= self._writeLimit or
+             self._bytes >= self._byteLimit or
+             time.time() - self._lastFlush >= self._flushInterval ) :
+            self.flush()
+
+    def flush(self ):
+        if len( self._buffer ) > 0 :
+            start = time.time()
+            if self._dedup :
+                self.upsert( [ dedupUpdate( i ) for i in self._buffer ] )
+            else:
+                self._collection.insert_many( self._buffer, ordered=self._ordered )
+            elapsed = time.time() - start
+            self._stats.record( self._collection.name, len( self._buffer ), elapsed )
+            self._buffer = []
+            self._bytes = 0
+
+        self._lastFlush = time.time()
+
+    def upsert(self, updates ):
+        '''
+        Two writers can race to insert the same new content, in which case the unique
+        index on contentHash fails one of them. Retrying turns that upsert into an update.
+        '''
+        try:
+            self._collection.bulk_write( updates, ordered=self._ordered )
+        except BulkWriteError, e :
+            retries = [ updates[ i[ "index" ]] for i in e.details[ "writeErrors" ] if i[ "code" ] == 11000 ]
+            if len( retries ) < len( e.details[ "writeErrors" ] ) :
+                raise
+            self._collection.bulk_write( retries, ordered=self._ordered )
+            
+    def close(self ):
+        self.flush()
+
+    def __enter__(self ):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback ):
+        self.close()
+        return False
+
+
+_STOP = object()
+
+class PipelinedWriter( object ):
+
+    def __init__(self, collection, processFunc=None, newFieldName=None, orderedWrites=False,
+                 writeLimit=500, byteLimit=8 * 1024 * 1024, flushInterval=5.0, stats=None,
+                 writers=1, queueSize=1000, dedup=False ):
+        '''
+        Documents are transformed by processFunc in the calling thread and put on a queue
+        of at most queueSize documents. writers threads each drain the queue into their
+        own BulkWriter. When the queue is full send() blocks, so memory use stays flat
+        however far the producer gets ahead. A writer that sees no documents for
+        flushInterval seconds flushes what it has.
+        
+        An exception in a writer thread is re-raised by the next call to send() or close().
+        '''
+        self._processFunc = processFunc
+        self._newFieldName = newFieldName
+        self._flushInterval = flushInterval
+        if stats is None :
+            self._stats = WriteStats()
+        else:
+            self._stats = stats
+            
+        self._queue = Queue.Queue( queueSize )
+        self._errors = []
+        self._threads = []
+        
+        for _ in range( writers ):
+            bw = BulkWriter( collection, 
+                             orderedWrites=orderedWrites,
+                             writeLimit=writeLimit,
+                             byteLimit=byteLimit,
+                             flushInterval=flushInterval,
+                             stats=self._stats,
+                             dedup=dedup )
+            t = threading.Thread( target=self._drain, args=( bw, ))
+            t.daemon = True
+            t.start()
+            self._threads.append( t )
+            
+    def stats(self ):
+        return self._stats
+    
+    def _drain(self, bw ):
+        failed = False
+        while True :
+            try:
+                doc = self._queue.get( timeout=self._flushInterval )
+            except Queue.Empty :
+                doc = None
+                
+            if doc is _STOP :
+                break
+            elif failed :
+                continue # keep draining so the producer is never blocked
+            
+            try:
+                if doc is None :
+                    bw.flush()
+                else:
+                    bw.send( doc )
+            except Exception :
+                self._errors.append( sys.exc_info())
+                failed = True
+                
+        if not failed :
+            try:
+                bw.close()
+            except Exception :
+                self._errors.append( sys.exc_info())
+                
+    def _raiseErrors(self ):
+        if len( self._errors ) > 0 :
+            ( exc_type, exc_value, exc_traceback ) = self._errors[ 0 ]
+            raise exc_type, exc_value, exc_traceback
+        
+    def send(self, doc ):
+        self._raiseErrors()
+        if self._processFunc :
+            doc = self._processFunc( self._newFieldName, doc )
+        self._queue.put( doc )
+        
+    def close(self ):
+        for _ in self._threads :
+            self._queue.put( _STOP )
+        for t in self._threads :
+            t.join()
+        self._threads = []
+        self._raiseErrors()
+        
+    def __enter__(self ):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback ):
+        self.close()
+        return False
@@ -10,7 +10,6 @@ import sys
 from argparse import ArgumentParser
 from mongodb import MUGAlyserMongoDB
 from members import Members
-from audit import Audit
 import pprint
 try:
     from apikey import get_meetup_key
@@ -29,13 +28,13 @@ if __name__ == '__main__':
     mdb = MUGAlyserMongoDB( "mongodb://localhost" )
     
     members = Members( mdb, get_meetup_key()).collection()
-    audit = Audit( mdb ).collection() 
+    audit = mdb.audit().collection() 
     
     count = 0
     notFoundCount = 0
     foundCount = 0
     csvmembers={}
-    lastBatchID = Audit( mdb ).getLastBatchID()
+    lastBatchID = mdb.audit().getLastBatchID()
     
     print( "Processing batch ID: %i" % lastBatchID )
     with open( args.file, "rb") as csvdata :
@@ -0,0 +1,221 @@
+'''
+Created on 18 Oct 2026
+
+Delta batches record only what changed since the previous valid batch.
+
+A full batch writes every document into the normal collections. A delta
+batch writes nothing to them, instead each collection has a companion
+<collection>_deltas collection holding documents of the form
+
+{ "batchID"     : 14,
+  "key"         : <entity key>,
+  "op"          : "insert" | "update" | "delete",
+  "contentHash" : <hash of the entity>,
+  <field>       : <entity>,               # not present for deletes
+  "timestamp"   : <capture time> }
+
+The state of a collection for any batch is rebuilt by taking the most recent
+full batch at or before it and applying the deltas of the valid delta batches
+that follow it in batchID order (see reconstruct).
+
+Queries on a batch go to the normal collections, so at the end of a delta
+batch, before it is ended, the writer makes its documents part of them (see
+materialize). Unchanged documents are shared with the previous batch, only
+the changed entities take up new space. Readers never write.
+
+Whether a batch is full or delta is recorded as info.storage in its audit
+document.
+
+@author: jdrumgoole
+'''
+
+import threading
+import logging
+
+from pymongo import ReplaceOne
+
+from mugalyser.bulkwriter import contentHash
+
+def memberKey( member ):
+    #
+    # Pro members are unique by member_id. Without a pro account the same member
+    # is returned once per group so we use the group join time to tell them apart.
+    #
+    if "member_id" in member :
+        return member[ "member_id" ]
+    else:
+        return "%s/%s" % ( member.get( "id" ), member.get( "joined" ))
+
+def attendeeKey( info ):
+    return "%s/%s" % ( info[ "attendee" ][ "member" ][ "id" ], info[ "event" ][ "id" ] )
+
+ENTITIES = { "groups"          : ( "group",  lambda g : g[ "urlname" ] ),
+             "members"         : ( "member", memberKey ),
+             "past_events"     : ( "event",  lambda e : e[ "id" ] ),
+             "upcoming_events" : ( "event",  lambda e : e[ "id" ] ),
+             "attendees"       : ( "info",   attendeeKey ) }
+
+def entityKey( collection_name, doc ):
+    ( field, keyFunc ) = ENTITIES[ collection_name ]
+    return keyFunc( doc[ field ] )
+
+def isDeltaBatch( batch ):
+    return ( batch is not None and
+             "info" in batch and
+             type( batch[ "info" ] ) is dict and
+             batch[ "info" ].get( "storage" ) == "delta" )
+
+def deltaChain( audit, batchID ):
+    '''
+    Return ( base, deltas ) where base is the full batch that batchID is built on and
+    deltas is the list of delta batch IDs to apply to it in order. base is None if
+    there is no full batch to start from.
+    '''
+    deltas = []
+    for batch in audit.getValidBatchesBefore( batchID ):
+        if isDeltaBatch( batch ):
+            deltas.append( batch[ "batchID" ] )
+        else:
+            deltas.reverse()
+            return ( batch[ "batchID" ], deltas )
+
+    deltas.reverse()
+    return ( None, deltas )
+
+def reconstruct( mdb, collection_name, batchID ):
+    '''
+    Yield the documents of collection_name as they were in batchID.
+    '''
+
+    audit = mdb.audit()
+    collection = mdb.make_collection( collection_name )
+
+    if not isDeltaBatch( audit.getBatch( batchID )) :
+        for doc in collection.find( { "batchID" : batchID } ):
+            yield doc
+        return
+
+    ( base, deltas ) = deltaChain( audit, batchID )
+    if base is None :
+        raise ValueError( "No full batch to reconstruct batch %i from" % batchID )
+
+    ( field, _ ) = ENTITIES[ collection_name ]
+    state = {}
+    for doc in collection.find( { "batchID" : base } ):
+        state[ entityKey( collection_name, doc ) ] = doc
+
+    deltaCollection = mdb.deltasCollection( collection_name )
+    for deltaBatchID in deltas :
+        for delta in deltaCollection.find( { "batchID" : deltaBatchID } ).sort( "_id", 1 ):
+            if delta[ "op" ] == "delete" :
+                state.pop( delta[ "key" ], None )
+            else:
+                state[ delta[ "key" ]] = { field       : delta[ field ],
+                                           "timestamp" : delta[ "timestamp" ] }
+
+    for doc in state.itervalues():
+        doc = dict( ( k, v ) for ( k, v ) in doc.items() if not k in ( "_id", "contentHash" ))
+        doc[ "batchID" ] = batchID
+        yield doc
+
+def materialize( mdb, collection_name, batchID, previousBatchID ):
+    '''
+    Make the documents of delta batch batchID part of collection_name so the normal
+    batch queries can see it. The documents of previousBatchID for entities that didn't
+    change are linked into batchID rather than copied (see Audit.linkBatch). Inserted and
+    updated entities are upserted with an _id made from batchID and their key, so running
+    it again doesn't duplicate anything.
+
+    The writer calls this before the batch is ended, readers never do.
+    Returns ( linked, written ).
+    '''
+    collection = mdb.make_collection( collection_name )
+    ( field, _ ) = ENTITIES[ collection_name ]
+
+    changed = {}
+    for delta in mdb.deltasCollection( collection_name ).find( { "batchID" : batchID } ).sort( "_id", 1 ):
+        changed[ delta[ "key" ]] = delta
+
+    linked = 0
+    if previousBatchID is not None :
+        excluded = [ doc[ "_id" ] for doc in collection.find( { "batchID" : previousBatchID }, { field : 1 } )
+                     if entityKey( collection_name, doc ) in changed ]
+        linked = mdb.audit().linkBatch( collection, { "_id" : { "$nin" : excluded }}, previousBatchID, batchID )
+
+    writes = [ ReplaceOne( { "_id" : "%i/%s" % ( batchID, k ) },
+                           { field       : d[ field ],
+                             "timestamp" : d[ "timestamp" ],
+                             "batchID"   : batchID },
+                           upsert=True ) for ( k, d ) in changed.iteritems() if d[ "op" ] != "delete" ]
+    if len( writes ) > 0 :
+        collection.bulk_write( writes, ordered=False )
+
+    logging.info( "Materialized delta batch %i of '%s': %i linked, %i written",
+                  batchID, collection_name, linked, len( writes ))
+    return ( linked, len( writes ))
+
+
+class DeltaTracker( object ):
+    '''
+    Tracks the entities of one collection seen in the current delta batch and compares
+    them with the state of the previous valid batch.
+    '''
+
+    def __init__(self, mdb, collection_name, previousBatchID ):
+        self._mdb = mdb
+        self._collection_name = collection_name
+        self._deltas = mdb.deltasCollection( collection_name )
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._previous = {}
+
+        if previousBatchID is not None :
+            for doc in reconstruct( mdb, collection_name, previousBatchID ):
+                self._previous[ entityKey( collection_name, doc ) ] = contentHash( doc )
+
+        logging.info( "delta tracking %i '%s' documents from batch %s",
+                      len( self._previous ), collection_name, previousBatchID )
+
+    def deltaCollection(self ):
+        return self._deltas
+
+    def delta(self, doc ):
+        '''
+        Turn a processed document into a delta document, or None if it is unchanged.
+        '''
+        key = entityKey( self._collection_name, doc )
+        h = contentHash( doc )
+
+        with self._lock :
+            self._seen.add( key )
+
+        if not key in self._previous :
+            op = "insert"
+        elif self._previous[ key ] != h :
+            op = "update"
+        else:
+            return None
+
+        delta = dict( doc )
+        delta[ "key" ] = key
+        delta[ "op" ] = op
+        delta[ "contentHash" ] = h
+        return delta
+
+    def deltas(self, retrievalGenerator, processFunc, newFieldName ):
+        for i in retrievalGenerator :
+            delta = self.delta( processFunc( newFieldName, i ))
+            if delta is not None :
+                yield delta
+
+    def deletions(self, batchID, timestamp ):
+        '''
+        Delete deltas for every entity of the previous batch we haven't seen in this one.
+        '''
+        with self._lock :
+            missing = [ k for k in self._previous if not k in self._seen ]
+
+        return [ { "batchID"   : batchID,
+                   "key"       : k,
+                   "op"        : "delete",
+                   "timestamp" : timestamp } for k in missing ]
@@ -7,8 +7,8 @@ Created on 31 Oct 2016
 from audit import Audit
 from feedback import Feedback
 from pprint import pprint
-from mugdata import MUGData
-import itertools
+from mugdata import MUGData, Format
+import pymongo
 from utils.query import Query
 
 class Events(MUGData):
@@ -16,23 +16,40 @@ class Events(MUGData):
     classdocs
     '''
     
+    FIELDS = { Format.oneline : [ "event.name", "event.time", "event.group.urlname" ],
+               Format.summary : [ "event.name", "event.time", "event.group.urlname", "event.yes_rsvp_count" ],
+               Format.full    : None }
+    
     def __init__(self, mdb, collection_name  ):
         '''
         Constructor
         '''
         super( Events, self ).__init__( mdb, collection_name ) 
     
-    def get_all_events(self, query ={}):
-        return self.find( query )
-    def get_all_group_events(self, groups=[ "all" ] ):
+    def get_all_events(self, query ={}, projection=None ):
+        return self.find( query, projection )
+    
+    def get_all_group_events(self, groups=[ "all" ], projection=None ):
+        '''
+        returns a MongoDB cursor over the events of groups ordered by group. "all" 
+        returns the events of every group.
+        '''
+        return self.find_group_events( groups, {}, projection )
         
+    def find_group_events(self, groups, query, projection=None ):
+        '''
+        One query for the events matching query for all of groups, ordered by group
+        so the results come back in index order.
+        '''
+        q = dict( query )
         if "all" in groups:
-            return self.find()
+            return self.find( q, projection )
         else:
-            return itertools.chain( *[ self.get_group_events( i )  for i in groups ] )
+            q[ "event.group.urlname" ] = { "$in" : list( groups ) }
+            return self.find( q, projection ).sort( "event.group.urlname", pymongo.ASCENDING )
         
-    def get_group_events(self, url_name ):
-        return self.find( { "event.group.urlname" : url_name } )
+    def get_group_events(self, url_name, projection=None ):
+        return self.find( { "event.group.urlname" : url_name }, projection )
     
 #     def get_groups_events(self, groups=[] ):
 #         # Groups should be an iterator
@@ -64,16 +81,13 @@ class PastEvents(Events):
         '''
         super( PastEvents, self ).__init__( mdb, "past_events")
         
-    def get_all_group_events(self, groups=[ "all" ] ):
+    def get_all_group_events(self, groups=[ "all" ], projection=None ):
         
-        if "all" in groups:
-            return self.find({ "event.status" : "past"})
-        else:
-            return itertools.chain( *[ self.get_group_events( i )  for i in groups ] )
+        return self.find_group_events( groups, { "event.status" : "past" }, projection )
         
-    def get_group_events(self, url_name ):
+    def get_group_events(self, url_name, projection=None ):
         return self.find( { "event.group.urlname" : url_name,
-                            "event.status" : "past" } )
+                            "event.status" : "past" }, projection )
     
 class UpcomingEvents(Events):
     '''
@@ -87,13 +101,10 @@ class UpcomingEvents(Events):
         '''
         super( UpcomingEvents, self ).__init__( mdb, "upcoming_events")
         
-    def get_all_group_events(self, groups=[ "all" ] ):
+    def get_all_group_events(self, groups=[ "all" ], projection=None ):
         
-        if "all" in groups:
-            return self.find( { "event.status" : "ucpoming"})
-        else:
-            return itertools.chain( *[ self.get_group_events( i )  for i in groups ] )
+        return self.find_group_events( groups, { "event.status" : "upcoming" }, projection )
         
-    def get_group_events(self, url_name ):
+    def get_group_events(self, url_name, projection=None ):
         return self.find({ "event.group.urlname" : url_name,
-                           "event.status"        : "upcoming" } )
\ No newline at end of file
+                           "event.status"        : "upcoming" }, projection )
\ No newline at end of file
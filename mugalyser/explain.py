@@ -0,0 +1,168 @@
+'''
+Created on 18 Oct 2026
+
+Run explain on the queries that Members, Groups, Events and mug_analytics_main
+make and flag the ones that don't make good use of an index. A query is
+flagged if its winning plan contains a COLLSCAN or if it examines more than
+ratio index keys for each document it returns.
+
+Each template is ( name, collection name, query function, sort, expected ).
+The query function is passed a dict of sample values taken from the current
+valid batch (batchID, urlname, urls, country and member_id) and returns the
+query filter. For aggregations the filter is the leading $match of the
+pipeline as that is the only stage that can use an index. sort is the
+pymongo sort the query is run with or None. expected is the reason a
+template is known to be flagged ( e.g. "COLLSCAN" for queries that read
+every batch ) or None. Queries flagged for the expected reason are reported
+but not counted as failures.
+
+Keep the templates in step with the query builders they name.
+
+@author: jdrumgoole
+'''
+
+from bson.son import SON
+
+TEMPLATES = [
+    ( "Members.get_group_members", "members",
+      lambda s : { "batchID" : s[ "batchID" ], "member.chapters" : { "$elemMatch" : { "urlname" : s[ "urlname" ] }}},
+      None, None ),
+    ( "Members.get_many_group_members", "members",
+      lambda s : { "batchID" : s[ "batchID" ], "member.chapters.urlname" : { "$in" : s[ "urls" ] }},
+      None, None ),
+    ( "Members.group_member_counts", "members",
+      lambda s : { "batchID" : s[ "batchID" ], "member.chapters.urlname" : { "$in" : s[ "urls" ] }},
+      None, None ),
+    ( "Members.get_by_ID", "members",
+      lambda s : { "batchID" : s[ "batchID" ], "member.member_id" : s[ "member_id" ] },
+      None, None ),
+    ( "Members.get_by_IDs", "members",
+      lambda s : { "batchID" : s[ "batchID" ], "member.member_id" : { "$in" : [ s[ "member_id" ]] }},
+      None, None ),
+    ( "Groups.get_group", "groups",
+      lambda s : { "batchID" : s[ "batchID" ], "group.urlname" : s[ "urlname" ] },
+      None, None ),
+    ( "Groups.get_groups", "groups",
+      lambda s : { "batchID" : s[ "batchID" ], "group.urlname" : { "$in" : s[ "urls" ] }},
+      [ ( "group.urlname", 1 ) ], None ),
+    ( "Groups.get_all_groups(region)", "groups",
+      lambda s : { "batchID" : s[ "batchID" ], "group.country" : { "$in" : [ s[ "country" ]] }},
+      None, None ),
+    ( "PastEvents.get_group_events", "past_events",
+      lambda s : { "batchID" : s[ "batchID" ], "event.group.urlname" : s[ "urlname" ], "event.status" : "past" },
+      None, None ),
+    ( "PastEvents.find_group_events", "past_events",
+      lambda s : { "batchID" : s[ "batchID" ], "event.group.urlname" : { "$in" : s[ "urls" ] }, "event.status" : "past" },
+      [ ( "event.group.urlname", 1 ) ], None ),
+    ( "UpcomingEvents.get_group_events", "upcoming_events",
+      lambda s : { "batchID" : s[ "batchID" ], "event.group.urlname" : s[ "urlname" ], "event.status" : "upcoming" },
+      None, None ),
+    ( "UpcomingEvents.find_group_events", "upcoming_events",
+      lambda s : { "batchID" : s[ "batchID" ], "event.group.urlname" : { "$in" : s[ "urls" ] }, "event.status" : "upcoming" },
+      [ ( "event.group.urlname", 1 ) ], None ),
+    ( "MUG_Analytics.getMembers", "groups",
+      lambda s : { "batchID" : { "$in" : [ s[ "batchID" ]] }, "group.urlname" : { "$in" : s[ "urls" ] }},
+      None, None ),
+    ( "MUG_Analytics.get_groups", "groups",
+      lambda s : { "batchID" : s[ "batchID" ], "group.urlname" : { "$in" : s[ "urls" ] }},
+      None, None ),
+    #
+    # The RSVP history covers every batch so it is a collection scan by design.
+    #
+    ( "MUG_Analytics.get_RSVP_history", "past_events",
+      lambda s : { "event.group.urlname" : { "$in" : s[ "urls" ] }},
+      None, "COLLSCAN" ),
+    ( "MUG_Analytics.get_events", "past_events",
+      lambda s : { "batchID" : s[ "batchID" ], "event.status" : "past", "event.group.urlname" : { "$in" : s[ "urls" ] }},
+      None, None ),
+    ( "MUG_Analytics.get_rsvp_by_event", "past_events",
+      lambda s : { "batchID" : s[ "batchID" ], "event.group.urlname" : { "$in" : s[ "urls" ] }},
+      None, None ),
+    ( "MUG_Analytics.get_new_members", "members",
+      lambda s : { "batchID" : s[ "batchID" ] },
+      None, None ),
+    ( "MUG_Analytics.get_rsvps", "attendees",
+      lambda s : { "batchID" : s[ "batchID" ], "info.event.group.urlname" : { "$in" : s[ "urls" ] }},
+      None, None ),
+    ( "MUG_Analytics.get_active_users", "attendees",
+      lambda s : { "batchID" : s[ "batchID" ], "info.event.group.urlname" : { "$in" : s[ "urls" ] },
+                   "info.attendee.rsvp.response" : "yes" },
+      None, None ) ]
+
+def samples( mdb ):
+    '''
+    Sample values for the query templates taken from the current valid batch.
+    '''
+    batchID = mdb.audit().getCurrentValidBatchID()
+    groups = list( mdb.groupsCollection().find( { "batchID" : batchID }, { "group.urlname" : 1, "group.country" : 1 } ))
+    if len( groups ) == 0 :
+        raise ValueError( "No groups in batch %i" % batchID )
+    member = mdb.membersCollection().find_one( { "batchID" : batchID, "member.member_id" : { "$exists" : True }},
+                                               { "member.member_id" : 1 } )
+
+    return { "batchID"   : batchID,
+             "urlname"   : groups[ 0 ][ "group" ][ "urlname" ],
+             "country"   : groups[ 0 ][ "group" ][ "country" ],
+             "urls"      : [ g[ "group" ][ "urlname" ] for g in groups ],
+             "member_id" : member[ "member" ][ "member_id" ] if member else None }
+
+def stages( plan ):
+    '''
+    All the stage names in a query plan.
+    '''
+    yield plan[ "stage" ]
+    if "inputStage" in plan :
+        for i in stages( plan[ "inputStage" ] ):
+            yield i
+    for child in plan.get( "inputStages", [] ):
+        for i in stages( child ):
+            yield i
+
+def explain( collection, query, sort=None ):
+    '''
+    Run explain with executionStats verbosity for a find on collection.
+    '''
+    find = SON( [ ( "find", collection.name ), ( "filter", query ) ] )
+    if sort :
+        find[ "sort" ] = SON( sort )
+    return collection.database.command( SON( [ ( "explain", find ),
+                                               ( "verbosity", "executionStats" ) ] ))
+
+def analyse( result, ratio=10, expected=None ):
+    '''
+    Summarise an explain result. flagged is the reason the query was flagged or None.
+    A query flagged for the expected reason is reported in expected rather than flagged.
+    '''
+    planStages = list( stages( result[ "queryPlanner" ][ "winningPlan" ] ))
+    execution = result[ "executionStats" ]
+    keys = execution[ "totalKeysExamined" ]
+    docs = execution[ "totalDocsExamined" ]
+    returned = execution[ "nReturned" ]
+
+    if "COLLSCAN" in planStages :
+        flagged = "COLLSCAN"
+    elif keys > ratio * max( returned, 1 ) :
+        flagged = "IXSCAN examined %i keys for %i documents" % ( keys, returned )
+    else:
+        flagged = None
+
+    if expected is not None and flagged is not None and flagged.startswith( expected ):
+        ( flagged, expected ) = ( None, flagged )
+    else:
+        expected = None
+
+    return { "stages"   : planStages,
+             "keys"     : keys,
+             "docs"     : docs,
+             "returned" : returned,
+             "flagged"  : flagged,
+             "expected" : expected }
+
+def explain_templates( mdb, ratio=10, templates=TEMPLATES ):
+    '''
+    Yield ( name, collection name, analysis ) for each template.
+    '''
+    s = samples( mdb )
+    for ( name, collection_name, query, sort, expected ) in templates :
+        result = explain( mdb.make_collection( collection_name ), query( s ), sort )
+        yield ( name, collection_name, analyse( result, ratio, expected ))
@@ -0,0 +1,176 @@
+'''
+Created on 18 Oct 2026
+
+Exporter streams the documents from a cursor to a CSV or JSON lines file
+one row at a time, so memory use doesn't grow with the size of the report.
+
+Each row is made of fieldNames, which may be dotted paths into nested
+documents ("info.event.name"). The paths are split once into accessor
+functions for each output() rather than for every row. Missing
+fields are written as empty values. Dates at the datemap paths are formatted
+with DATE_FORMAT. A datemap path can be a field name or a path inside one
+("_id.ts" formats the ts field of the _id field). Nested values are written
+as JSON.
+
+The file is written through a buffer of bufferSize bytes and is gzipped if
+compress is True (".gz" is added to the filename). A filename of "-" writes
+to stdout uncompressed. pymongo cursors have their batch_size set to
+batchSize so the server returns fewer, larger batches.
+
+output() returns the number of rows written and reports the rows/sec on
+stderr.
+
+@author: jdrumgoole
+'''
+
+import sys
+import csv
+import gzip
+import json
+import time
+import datetime
+from collections import OrderedDict
+
+from bson import json_util
+from pymongo.cursor import Cursor
+from pymongo.command_cursor import CommandCursor
+
+
+def accessor( field ):
+    '''
+    A function that returns the value of the dotted field name in a document or
+    None if any part of the path is missing.
+    '''
+    keys = field.split( "." )
+
+    if len( keys ) == 1 :
+        return lambda doc : doc.get( field )
+
+    def get( doc ):
+        for k in keys :
+            if isinstance( doc, dict ) and k in doc :
+                doc = doc[ k ]
+            else:
+                return None
+        return doc
+
+    return get
+
+def formatDate( value, keys, dateFormat ):
+    '''
+    Format the datetime at the path keys inside value. Dicts on the path are copied
+    rather than changed.
+    '''
+    if len( keys ) == 0 :
+        if isinstance( value, datetime.datetime ):
+            return value.strftime( dateFormat )
+        return value
+
+    if isinstance( value, dict ) and keys[ 0 ] in value :
+        value = dict( value )
+        value[ keys[ 0 ]] = formatDate( value[ keys[ 0 ]], keys[ 1: ], dateFormat )
+    return value
+
+
+class Exporter( object ):
+
+    DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, filename="-", format="json", compress=False, bufferSize=1024 * 1024, batchSize=1000 ):
+        self._format = format.lower()
+        if self._format not in [ "json", "csv" ] :
+            raise ValueError( "Unknown export format: '%s'" % format )
+
+        self._compress = compress and filename != "-"
+        if self._compress and not filename.endswith( ".gz" ):
+            filename = filename + ".gz"
+        self._filename = filename
+        self._bufferSize = bufferSize
+        self._batchSize = batchSize
+
+    def filename(self ):
+        return self._filename
+
+    def _open(self ):
+        '''
+        Returns ( file to write to, underlying file ).
+        '''
+        if self._filename == "-" :
+            return ( sys.stdout, sys.stdout )
+        raw = open( self._filename, "wb", self._bufferSize )
+        if self._compress :
+            return ( gzip.GzipFile( fileobj=raw, mode="wb" ), raw )
+        return ( raw, raw )
+
+    @staticmethod
+    def _encode( v ):
+        if v is None :
+            return ""
+        elif isinstance( v, unicode ):
+            return v.encode( "utf-8" )
+        elif isinstance( v, ( list, dict )):
+            return json.dumps( v, default=json_util.default )
+        else:
+            return v
+
+    def rows(self, cursor, fieldNames, datemap=None, limit=None ):
+        '''
+        Yield a list of the values of fieldNames for each document in cursor.
+        '''
+        getters = [ accessor( f ) for f in fieldNames ]
+
+        #
+        # For each field the paths of the dates to format inside its value, [] being
+        # the value itself.
+        #
+        dates = []
+        for f in fieldNames :
+            paths = []
+            for d in ( datemap or [] ):
+                if d == f :
+                    paths.append( [] )
+                elif d.startswith( f + "." ):
+                    paths.append( d[ len( f ) + 1: ].split( "." ))
+            dates.append( paths )
+
+        count = 0
+        for doc in cursor :
+            if limit and count >= limit :
+                break
+            row = [ g( doc ) for g in getters ]
+            for i in xrange( len( row )):
+                for path in dates[ i ] :
+                    row[ i ] = formatDate( row[ i ], path, self.DATE_FORMAT )
+            yield row
+            count = count + 1
+
+    def output(self, cursor, fieldNames, datemap=None, limit=None ):
+        if isinstance( cursor, ( Cursor, CommandCursor )):
+            cursor.batch_size( self._batchSize )
+
+        start = time.time()
+        count = 0
+        ( f, raw ) = self._open()
+        try:
+            if self._format == "csv" :
+                writer = csv.writer( f )
+                writer.writerow( fieldNames )
+                for row in self.rows( cursor, fieldNames, datemap, limit ):
+                    writer.writerow( [ self._encode( v ) for v in row ] )
+                    count = count + 1
+            else:
+                for row in self.rows( cursor, fieldNames, datemap, limit ):
+                    f.write( json.dumps( OrderedDict( zip( fieldNames, row )), default=json_util.default ))
+                    f.write( "\n" )
+                    count = count + 1
+        finally:
+            if raw is sys.stdout :
+                raw.flush()
+            else:
+                f.close()
+                raw.close()
+
+        elapsed = time.time() - start
+        sys.stderr.write( "Wrote %i rows to %s in %.2fs (%.0f rows/sec)\n" % ( count, self._filename, elapsed,
+                                                                               count / elapsed if elapsed > 0 else 0 ))
+        return count
@@ -0,0 +1,128 @@
+'''
+Created on 18 Oct 2026
+
+Run several aggregations over the same collection in a single pass with
+$facet.
+
+A Pipeline records the stages added to it with the same methods as a
+mongodb_utils Agg so the MUG_Analytics pipeline builders can make either.
+A Facet collects the named Pipelines for one collection. The leading $match
+conditions that all the pipelines share are hoisted in front of the $facet
+stage so the batchID/urlname indexes still select the documents, then each
+pipeline runs against those documents as one of the facets.
+
+$facet returns a single document so the combined results of all the
+pipelines must fit in 16MB. Callers should be ready to fall back to running
+the pipelines one at a time if the aggregation fails.
+
+@author: jdrumgoole
+'''
+
+from collections import OrderedDict
+
+
+class Pipeline( object ):
+
+    def __init__(self, collection ):
+        self._collection = collection
+        self._stages = []
+
+    def collection(self ):
+        return self._collection
+
+    def stages(self ):
+        return self._stages
+
+    def addMatch(self, match ):
+        self._stages.append( { "$match" : match } )
+        return self
+
+    def addRangeMatch(self, field, start, end ):
+        r = {}
+        if start :
+            r[ "$gte" ] = start
+        if end :
+            r[ "$lte" ] = end
+        return self.addMatch( { field : r } )
+
+    def addGroup(self, group ):
+        self._stages.append( { "$group" : group } )
+        return self
+
+    def addProject(self, project ):
+        self._stages.append( { "$project" : project } )
+        return self
+
+    def addUnwind(self, path ):
+        self._stages.append( { "$unwind" : path } )
+        return self
+
+    def addSort(self, sorter ):
+        raise ValueError( "Sorted reports can't be combined, run them individually" )
+
+
+class Facet( object ):
+
+    def __init__(self, collection ):
+        self._collection = collection
+        self._pipelines = OrderedDict()
+
+    def add(self, name, pipeline ):
+        if pipeline.collection().name != self._collection.name :
+            raise ValueError( "Pipeline '%s' is on '%s' not '%s'" % ( name, pipeline.collection().name, self._collection.name ))
+        self._pipelines[ name ] = pipeline
+
+    def names(self ):
+        return self._pipelines.keys()
+
+    def common_match(self ):
+        '''
+        The conditions in the leading $match of every pipeline that all of them share.
+        '''
+        matches = []
+        for p in self._pipelines.itervalues() :
+            stages = p.stages()
+            if len( stages ) == 0 or "$match" not in stages[ 0 ] :
+                return {}
+            matches.append( stages[ 0 ][ "$match" ] )
+
+        if len( matches ) == 0 :
+            return {}
+
+        return dict( ( k, v ) for ( k, v ) in matches[ 0 ].iteritems()
+                     if all( k in m and m[ k ] == v for m in matches[ 1: ] ))
+
+    def pipeline(self ):
+        common = self.common_match()
+        facets = {}
+        for ( name, p ) in self._pipelines.iteritems() :
+            stages = list( p.stages())
+            if common :
+                rest = dict( ( k, v ) for ( k, v ) in stages[ 0 ][ "$match" ].iteritems() if k not in common )
+                if rest or len( stages ) == 1 :
+                    stages[ 0 ] = { "$match" : rest }
+                else:
+                    stages = stages[ 1: ]
+            facets[ name ] = stages
+
+        pipeline = []
+        if common :
+            pipeline.append( { "$match" : common } )
+        pipeline.append( { "$facet" : facets } )
+        return pipeline
+
+    def aggregate(self ):
+        return self._collection.aggregate( self.pipeline(), allowDiskUse=True )
+
+    def results(self, docs ):
+        '''
+        Split the document returned by aggregate() into a dict of name : documents.
+        '''
+        results = dict( ( name, [] ) for name in self.names())
+        for d in docs :
+            for name in results :
+                results[ name ].extend( d.get( name, [] ))
+        return results
+
+    def __str__(self ):
+        return str( self.pipeline())
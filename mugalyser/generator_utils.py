@@ -4,6 +4,9 @@ Created on 22 Nov 2016
 @author: jdrumgoole
 '''
 from pprint import pprint
+import threading
+import Queue
+import sys
 
 def coroutine(func):
     def start( *args,**kwargs):
@@ -21,4 +24,132 @@ def printCount( iterator, printfunc=None ):
             pprint( i )
         else:
             printfunc( i )
-    print( "Total: %i" % count )
\ No newline at end of file
+    print( "Total: %i" % count )
+
+_DONE  = object()
+_ERROR = object()
+
+def _put( queue, item, stop ):
+    '''
+    Put item on a bounded queue, giving up if stop is set while we wait for space.
+    '''
+    while not stop.is_set():
+        try:
+            queue.put( item, timeout=0.1 )
+            return
+        except Queue.Full:
+            pass
+
+def _ordered_generate( tasks, workers, queue_size ):
+    '''
+    Each task gets its own queue of at most queue_size items. Workers take tasks in
+    order so the task being yielded is always running, and later tasks block once
+    their queue is full. At most workers * queue_size items are buffered.
+    '''
+    queues = [ Queue.Queue( queue_size ) for _ in tasks ]
+    nextTask = [ 0 ]
+    lock = threading.Lock()
+    stop = threading.Event()
+    
+    def worker():
+        while not stop.is_set():
+            with lock :
+                n = nextTask[ 0 ]
+                if n >= len( tasks ):
+                    return
+                nextTask[ 0 ] = n + 1
+            ( key, func ) = tasks[ n ]
+            try:
+                for i in func():
+                    _put( queues[ n ], ( key, i ), stop )
+                    if stop.is_set():
+                        break
+            except Exception :
+                _put( queues[ n ], ( _ERROR, sys.exc_info()), stop )
+            finally:
+                _put( queues[ n ], ( _DONE, None ), stop )
+                
+    threads = [ threading.Thread( target=worker ) for _ in range( min( workers, len( tasks ))) ]
+    for t in threads :
+        t.daemon = True
+        t.start()
+        
+    try:
+        for q in queues :
+            while True :
+                ( key, item ) = q.get()
+                if key is _DONE :
+                    break
+                elif key is _ERROR :
+                    raise item[ 0 ], item[ 1 ], item[ 2 ]
+                else:
+                    yield ( key, item )
+    finally:
+        stop.set()
+
+def concurrent_generate( tasks, workers=4, ordered=False, queue_size=1000 ):
+    '''
+    tasks is an iterable of ( key, func ) pairs where func is a callable that takes no
+    arguments and returns an iterable (usually a paginator generator). The funcs are run
+    on at most workers threads at a time and we yield ( key, item ) for every item they
+    produce.
+    
+    If ordered is False items are yielded as soon as they arrive and at most queue_size
+    items are buffered, so a slow consumer applies back pressure to the workers.
+    If ordered is True the items are yielded in the order of the tasks. The first task
+    is yielded as it is fetched while up to workers - 1 later tasks are fetched in the
+    background, each buffering at most queue_size items.
+    
+    An exception raised in a worker is re-raised in the consumer.
+    '''
+    
+    tasks = list( tasks )
+    
+    if ordered :
+        for i in _ordered_generate( tasks, workers, queue_size ):
+            yield i
+        return
+            
+    taskQueue = Queue.Queue()
+    for i in tasks:
+        taskQueue.put( i )
+        
+    results = Queue.Queue( queue_size )
+    stop = threading.Event()
+    
+    def put( item ):
+        _put( results, item, stop )
+            
+    def worker():
+        try:
+            while not stop.is_set():
+                try:
+                    ( key, func ) = taskQueue.get_nowait()
+                except Queue.Empty:
+                    break
+                for i in func():
+                    put( ( key, i ))
+                    if stop.is_set():
+                        break
+        except Exception :
+            put( ( _ERROR, sys.exc_info()))
+        finally:
+            put( ( _DONE, None ))
+            
+    threads = [ threading.Thread( target=worker ) for _ in range( min( workers, len( tasks ))) ]
+    for t in threads :
+        t.daemon = True
+        t.start()
+    
+    try:
+        running = len( threads )
+        while running > 0 :
+            ( key, item ) = results.get()
+            if key is _DONE :
+                running = running - 1
+            elif key is _ERROR :
+                raise item[ 0 ], item[ 1 ], item[ 2 ]
+            else:
+                yield ( key, item )
+    finally:
+        stop.set()
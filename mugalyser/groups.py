@@ -5,8 +5,8 @@ Created on 7 Oct 2016
 '''
 from pprint import pprint
 
-from mugalyser.mugdata import MUGData
-import itertools
+from mugalyser.mugdata import MUGData, chunks
+import pymongo
 
 NORDICS_COUNTRIES = [ "Denmark", 
                       "Faroe Islands", 
@@ -56,38 +56,52 @@ class Groups(MUGData):
         super( Groups, self ).__init__( mdb, "groups")  
 
         
-    def get_group(self, url_name ):
-        return self.find_one( { "group.urlname": url_name })
+    def get_group(self, url_name, projection=None ):
+        return self.find_one( { "group.urlname": url_name }, projection )
     
-    def get_all_groups(self, region=None):
+    def get_all_groups(self, region=None, projection=None ):
         if region:
             if type( region ) is list:
-                return self.find( { "group.country" : { "$in" : region }})
+                return self.find( { "group.country" : { "$in" : region }}, projection )
             else:
                 raise ValueError( "region parameter is not a list (type = %s)" % type( region ))
         else:
-            return self.find()
+            return self.find( None, projection )
  
-    def get_groups(self, group_names ):
-        
-        return itertools.chain( *[ self.get_group( i ) for i in group_names ] )
+    def get_groups(self, group_names, projection=None ):
+        '''
+        returns a MongoDB cursor over the groups in group_names ordered by urlname.
+        '''
+        return self.find( { "group.urlname" : { "$in" : list( group_names ) }}, 
+                          projection ).sort( "group.urlname", pymongo.ASCENDING )
     
     def get_country_group_urlnames(self, country ):
         return self.get_region_group_urlnames( [ country ])
     
     def get_country(self, urlname ):
         
-        group = self.find_one( { "group.urlname" : urlname } )
+        group = self.find_one( { "group.urlname" : urlname }, { "group.country" : 1 } )
         return group[ "group"][ "country"]
     
+    def get_countries(self, urlnames, chunk_size=1000 ):
+        '''
+        returns a dict of urlname : country for the groups in urlnames that exist.
+        Each chunk_size urlnames are looked up with a single $in query.
+        '''
+        countries = {}
+        for names in chunks( sorted( set( urlnames )), chunk_size ):
+            for g in self.find( { "group.urlname" : { "$in" : names }}, { "group.urlname" : 1, "group.country" : 1 } ):
+                countries[ g[ "group" ][ "urlname" ]] = g[ "group" ][ "country" ]
+        return countries
+    
     def get_region_group_urlnames(self, regions = None ):
         if regions:
             if type( regions ) is list:
-                return [ x[ "group"]["urlname" ] for x in self.find( {  "group.country" : { "$in" : regions }}) ]
+                return [ x[ "group"]["urlname" ] for x in self.find( {  "group.country" : { "$in" : regions }}, { "group.urlname" : 1 }) ]
             else:
                 raise ValueError( "regions parameter must be a list ( type=%s)" % type( regions ))  
         else:
-            return [ x[ "group"]["urlname" ] for x in self.find() ]
+            return [ x[ "group"]["urlname" ] for x in self.find( None, { "group.urlname" : 1 }) ]
 
             
 
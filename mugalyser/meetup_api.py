@@ -5,6 +5,7 @@ Created on 6 Sep 2016
 '''
 
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 import datetime
 import time
@@ -15,6 +16,38 @@ from copy import deepcopy
 from mugalyser.apikey import get_meetup_key
 
 from mugalyser.version import __programName__
+from mugalyser.ratelimiter import RateLimiter
+from mugalyser.generator_utils import concurrent_generate
+
+def makeSession( pool_connections=10, pool_maxsize=10, keep_alive=True, max_retries=0, pool_block=False ):
+    '''
+    Build a requests.Session backed by a connection pool so that successive requests
+    to the same host reuse an open TCP/TLS connection rather than paying for a new
+    handshake on every page.
+    
+    pool_connections : the number of per-host pools to cache (one per distinct host).
+    pool_maxsize     : the maximum number of connections kept open to any single host.
+    keep_alive       : if False we ask the server to close the connection after each request.
+    max_retries      : retries for failed connections (not for failed HTTP responses).
+    pool_block       : if True callers wait for a free connection rather than opening
+                       a new one when a host pool is exhausted. This caps the per-host
+                       connection count at pool_maxsize.
+    '''
+    
+    session = requests.Session()
+    adapter = HTTPAdapter( pool_connections=pool_connections, 
+                           pool_maxsize=pool_maxsize,
+                           max_retries=max_retries,
+                           pool_block=pool_block )
+    session.mount( "https://", adapter )
+    session.mount( "http://", adapter )
+    
+    if keep_alive :
+        session.headers[ "Connection" ] = "keep-alive"
+    else:
+        session.headers[ "Connection" ] = "close"
+        
+    return session
 
 def returnData( r ):
     #print( r.text )
@@ -24,15 +57,40 @@ def returnData( r ):
 
 class PaginatedRequest( object ):
     
-    def __init__(self, items=200 ):
+    def __init__(self, items=200, session=None, rate_limiter=None ):
 
         self._items = items
+        if session is None:
+            self._session = makeSession()
+        else:
+            self._session = session
+            
+        if rate_limiter is None:
+            self._rate_limiter = RateLimiter()
+        else:
+            self._rate_limiter = rate_limiter
         
+    def session(self):
+        return self._session
+    
+    def rate_limiter(self):
+        return self._rate_limiter
+    
+    def get(self, req, params ):
+        '''
+        Wait for the rate limiter to give us a slot, make the request and feed the
+        rate limit headers of the response back to the rate limiter.
+        '''
+        self._rate_limiter.acquire()
+        r = self._session.get( req, params=params )
+        self._rate_limiter.update( r.headers )
+        return r
+    
     def request(self, req,params ):
         logger = logging.getLogger( __programName__ )
         level = logger.getEffectiveLevel()
         logger.setLevel( logging.WARN )
-        r = requests.get( req, params )        
+        r = self.get( req, params )        
         logger.setLevel( level )
         
         return r
@@ -44,18 +102,18 @@ class PaginatedRequest( object ):
         one time and then give up.
         '''
         
-        r = requests.get( req, params )
+        r = self.get( req, params )
         #pprint.pprint( r.headers )
         if not "Content-Length" in r.headers:
             logging.info( "Empty content response, retrying")
             logging.info( "url: '%s'" % r.url )
             logging.debug( "Header: %s", r.headers )
-            r = requests.get( req, params )
+            r = self.get( req, params )
                         
         elif int( r.headers['Content-Length' ]) == 0 :
             logging.info( "Content-Length 0, retrying")
             logging.debug( "Header: %s", r.headers )
-            r = requests.get( req, params )
+            r = self.get( req, params )
         
             
  
@@ -68,15 +126,6 @@ class PaginatedRequest( object ):
         try:
 
             data = returnData( r )
-            '''
-            Rate limiting
-            '''
-            remaining = int( data[0][ "X-RateLimit-Remaining"] )
-            resetDelay = int( data[0][ "X-RateLimit-Reset"] )
-            if remaining <= 1 and resetDelay > 0 :
-                logging.debug( "Sleeping for : %i", resetDelay )
-                time.sleep( resetDelay )
-                
             
 #             for k,v in data[1].items():
 #     
@@ -209,6 +258,12 @@ class PaginatedRequest( object ):
 def epochToDatetime( ts ):
     return datetime.datetime.fromtimestamp( ts /1000 )
 
+def datetimeToEpoch( dt ):
+    '''
+    The inverse of epochToDatetime. Returns milliseconds since the epoch.
+    '''
+    return int( time.mktime( dt.timetuple())) * 1000
+
 class Reshaper( object ):
     
     def __init__(self ):
@@ -284,16 +339,39 @@ class MeetupAPI(object):
             
         return url
     
-    def __init__(self, apikey = get_meetup_key(), items=100):
+    def __init__(self, apikey = get_meetup_key(), items=100, session=None, 
+                 pool_connections=10, pool_maxsize=10, keep_alive=True, rate_limiter=None ):
         '''
         Constructor
+        
+        All requests made by this object share a single pooled HTTP session. Pass
+        in an existing session to share connections between MeetupAPI objects, otherwise
+        one is created using pool_connections, pool_maxsize and keep_alive (see makeSession).
+        
+        Requests are paced by rate_limiter. Pass in a shared RateLimiter (or a FileRateLimiter
+        to share across processes) when several MeetupAPI objects use the same API key.
         '''
         
         self._api = "https://api.meetup.com/"
         self._params = {}
         self._params[ "key" ] = apikey
         self._items = str( items )
-        self._requester = PaginatedRequest( self._items )
+        if session is None:
+            self._session = makeSession( pool_connections=pool_connections,
+                                         pool_maxsize=pool_maxsize,
+                                         keep_alive=keep_alive )
+        else:
+            self._session = session
+        self._requester = PaginatedRequest( self._items, self._session, rate_limiter )
+        
+    def session(self):
+        return self._session
+    
+    def rate_limiter(self):
+        return self._requester.rate_limiter()
+    
+    def close(self):
+        self._session.close()
             
     def get_group(self, url_name ):
         
@@ -301,13 +379,18 @@ class MeetupAPI(object):
         
         return Reshaper.reshapeGroupDoc( self._requester.makeRequest( self._api + url_name, params = params )[1] ) 
 
-    def get_past_events(self, url_name ) :
+    def get_past_events(self, url_name, since=None ) :
+        '''
+        If since is a datetime only events that start at or after since are returned.
+        '''
         
         params = deepcopy( self._params )
         
         params[ "status" ]       = "past"
         params[ "page" ]         = self._items
         params[ "group_urlname"] = url_name
+        if since :
+            params[ "time" ] = "%i," % datetimeToEpoch( since )
         
         return self._requester.paginatedRequest( self._api + "2/events", params, Reshaper.reshapeEventDoc )
 
@@ -321,11 +404,30 @@ class MeetupAPI(object):
         for group in groupsIterator :
             return self.get_attendees(group )
         
-    def get_attendees( self, url_name ):
+    def get_attendees( self, url_name, workers=1, ordered=True ):
+        '''
+        Yield ( attendee, event ) for every attendee of every past event of url_name.
         
-        for event in self.get_past_events( url_name ):
-            #pprint( event )
-            for attendee in self.get_event_attendees(event[ "id"], url_name ):
+        If workers is greater than one the attendance for up to workers events is fetched
+        at once. If ordered is True the attendees are still yielded event by event in
+        the order of the past events, otherwise they are yielded as they arrive.
+        '''
+        
+        return self.get_events_attendees( self.get_past_events( url_name ), url_name, workers, ordered )
+    
+    def get_events_attendees(self, events, url_name, workers=1, ordered=True ):
+        '''
+        Yield ( attendee, event ) for every attendee of each event in events. See get_attendees.
+        '''
+        
+        if workers <= 1 :
+            for event in events:
+                #pprint( event )
+                for attendee in self.get_event_attendees(event[ "id"], url_name ):
+                    yield ( attendee, event )
+        else:
+            tasks = [ ( event, ( lambda event=event : self.get_event_attendees( event[ "id" ], url_name ))) for event in events ]
+            for ( event, attendee ) in concurrent_generate( tasks, workers=workers, ordered=ordered ):
                 yield ( attendee, event )
     
             
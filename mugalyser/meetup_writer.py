@@ -4,14 +4,53 @@ Created on 21 Nov 2016
 @author: jdrumgoole
 '''
 
-from mugalyser.batchwriter import BatchWriter
+from mugalyser.bulkwriter import BulkWriter, PipelinedWriter, WriteStats
 from requests import HTTPError
+from multiprocessing.pool import ThreadPool
+from datetime import datetime, timedelta
 import logging
+import threading
+import pymongo
 import pprint
 from mugalyser.apikey import get_meetup_key
 from mugalyser.meetup_api import MeetupAPI
+from mugalyser.delta import DeltaTracker, ENTITIES, materialize
+from pymongo import UpdateOne
 
 
+def classifyAttendance( events, captured, finalCutoff ):
+    '''
+    Decide what to do with the attendees of each of events. An event is final if it
+    started before finalCutoff. captured is a dict of event id : batchID for the events
+    whose attendees are held by a valid batch.
+    
+    Returns ( final, carried, fetch ) where final is the ids of the final events, carried
+    is a dict of batchID : [ event id ] for final events whose attendees can be linked
+    from that batch and fetch is the list of events to get from the API.
+    '''
+    final = []
+    carried = {}
+    fetch = []
+    for event in events :
+        isFinal = event[ "time" ].replace( tzinfo=None ) < finalCutoff
+        if isFinal :
+            final.append( event[ "id" ] )
+        if isFinal and event[ "id" ] in captured :
+            carried.setdefault( captured[ event[ "id" ]], [] ).append( event[ "id" ] )
+        else:
+            fetch.append( event )
+            
+    return ( final, carried, fetch )
+    
+#
+# The run_phase phase that writes each collection.
+#
+PHASES = { "groups"          : "groups",
+           "members"         : "members",
+           "past_events"     : "pastevents",
+           "upcoming_events" : "upcomingevents",
+           "attendees"       : "attendees" }
+
 def mergeEvents( writer ):
     for attendee, event in writer:
         doc = { u"attendee" : attendee,
@@ -23,23 +62,88 @@ class MeetupWriter(object):
     A class that reads data about MUGS from the Meetup API using the MeetupAPI class and writes that
     data to a MongoDB collection. Supports pro and no pro APIs
     '''
-    def __init__(self, audit, mdb, urls, apikey= get_meetup_key(), unordered=True ):
+    def __init__(self, audit, mdb, urls, apikey= get_meetup_key(), unordered=True, meetup_api=None,
+                 attendee_workers=1, ordered_attendees=True, incremental=False, incremental_window=timedelta( days=7 ),
+                 completed=None, write_limit=500, byte_limit=8 * 1024 * 1024, flush_interval=5.0,
+                 pipeline_writers=0, queue_size=1000, dedup=False, delta=False ):
         '''
         Write contents of meetup API to MongoDB
+        
+        Pass in a MeetupAPI object to share its pooled HTTP session across all the
+        phases of a run. If meetup_api is None we create one for apikey.
+        
+        attendee_workers is the number of events whose attendance is fetched at once
+        in the attendees phase. If ordered_attendees is True attendees are still written
+        event by event in past event order.
+        
+        If incremental is True past events that were captured in the last valid batch
+        and that ended more than incremental_window before the newest captured event are
+        linked into this batch rather than fetched again (see processPastEvents). Attendees
+        for events that finished more than incremental_window ago are carried forward in the
+        same way (see processAttendees).
+        
+        completed is the set of ( phase, url_name ) checkpoints of a batch we are resuming.
+        Those phases are skipped and any partial data left by other phases is discarded
+        before they are run again (see run_phase).
+        
+        Documents are written in unordered insert_many batches of at most write_limit docs
+        or byte_limit bytes, and at least every flush_interval seconds (see BulkWriter).
+        If pipeline_writers is greater than zero the writes are done by that many background
+        threads fed through a queue of queue_size docs, so fetching and writing overlap
+        (see PipelinedWriter).
+        
+        If dedup is True documents that are unchanged since an earlier batch are stored
+        once and linked to each batch they appear in (see BulkWriter).
+        
+        If delta is True only the changes since the previous valid batch are written, to
+        the <collection>_deltas collections (see mugalyser.delta). Call finish() at the end
+        of the batch, before it is ended, to record deletions and make the batch queryable.
         '''
 
         self._mdb = mdb
-        self._meetup_api = MeetupAPI( apikey )
+        if meetup_api is None:
+            self._meetup_api = MeetupAPI( apikey )
+        else:
+            self._meetup_api = meetup_api
         self._audit = audit
         self._groups = self._mdb.groupsCollection()
         self._members = self._mdb.membersCollection()
         self._attendees = self._mdb.attendeesCollection()
+        self._attendanceIndex = self._mdb.attendanceIndexCollection()
         self._pastEvents = self._mdb.pastEventsCollection()
         self._upcomingEvents = self._mdb.upcomingEventsCollection()
         self._mugs = []
         self._unordered = unordered
         self._urls = urls
+        self._attendee_workers = attendee_workers
+        self._ordered_attendees = ordered_attendees
+        self._incremental = incremental
+        self._incremental_window = incremental_window
         
+        self._write_limit = write_limit
+        self._byte_limit = byte_limit
+        self._flush_interval = flush_interval
+        self._write_stats = WriteStats()
+        self._pipeline_writers = pipeline_writers
+        self._queue_size = queue_size
+        self._dedup = dedup
+        self._delta = delta
+        self._deltaFrom = self.previousBatchID() if delta else None
+        self._trackers = {}
+        self._trackerLock = threading.Lock()
+        
+        if completed is None:
+            self._completed = set()
+            self._resuming = False
+        else:
+            self._completed = completed
+            self._resuming = True
+        
+    def api(self):
+        return self._meetup_api
+    
+    def write_stats(self):
+        return self._write_stats
         
     def process(self, collection, retrievalGenerator, processFunc, newFieldName ):
         '''
@@ -48,24 +152,149 @@ class MeetupWriter(object):
         document into a new doc (it should take a doc and return a doc).
         Write the new doc using the newFieldName.
         
-        Write is done using a generator as well. The write receiver accumulates writes until a threshold
-        is reached and then writes them as a batch using BatchWriter.
+        The writer accumulates writes until a threshold is reached and then writes them as a 
+        batch using BulkWriter. Whatever is left is flushed when the generator is exhausted
+        (or raises).
         
         '''
-        bw = BatchWriter( collection, processFunc, newFieldName, orderedWrites=self._unordered )
-        writer = bw.bulkWrite( writeLimit=1)
+        dedup = self._dedup
+        if self._delta :
+            tracker = self.tracker( collection )
+            retrievalGenerator = tracker.deltas( retrievalGenerator, processFunc, newFieldName )
+            collection = tracker.deltaCollection()
+            processFunc = None
+            dedup = False
+            
+        if self._pipeline_writers > 0 :
+            bw = PipelinedWriter( collection, processFunc, newFieldName, 
+                                  orderedWrites=not self._unordered,
+                                  writeLimit=self._write_limit,
+                                  byteLimit=self._byte_limit,
+                                  flushInterval=self._flush_interval,
+                                  stats=self._write_stats,
+                                  writers=self._pipeline_writers,
+                                  queueSize=self._queue_size,
+                                  dedup=dedup )
+        else:
+            bw = BulkWriter( collection, processFunc, newFieldName, 
+                             orderedWrites=not self._unordered,
+                             writeLimit=self._write_limit,
+                             byteLimit=self._byte_limit,
+                             flushInterval=self._flush_interval,
+                             stats=self._write_stats,
+                             dedup=dedup )
         
-        for i in retrievalGenerator :
-            writer.send( i )
+        with bw :
+            for i in retrievalGenerator :
+                bw.send( i )
 
     
+    def tracker(self, collection ):
+        with self._trackerLock :
+            if not collection.name in self._trackers :
+                self._trackers[ collection.name ] = DeltaTracker( self._mdb, collection.name, self._deltaFrom )
+            return self._trackers[ collection.name ]
+        
+    def finish(self ):
+        '''
+        In delta mode record a delete for every entity of the previous batch that we did
+        not see in this one. Only collections written in this batch whose phase completed
+        for every group are considered.
+        
+        Then materialize every collection so the batch can be queried like a full one
+        once it is ended. Collections not written in this batch carry the previous
+        batch forward unchanged.
+        '''
+        if not self._delta :
+            return
+        
+        batchID = self._audit.getCurrentBatchID()
+        checkpoints = self._audit.getCheckpoints( batchID )
+        for ( collection_name, tracker ) in self._trackers.items():
+            phase = PHASES[ collection_name ]
+            if not ( ( phase, None ) in checkpoints or
+                     all( ( phase, url ) in checkpoints for url in self._urls )):
+                logging.warn( "phase '%s' did not complete for every group, no deletions recorded for '%s'",
+                              phase, collection_name )
+                continue
+            deletions = tracker.deletions( batchID, datetime.utcnow())
+            if len( deletions ) > 0 :
+                tracker.deltaCollection().insert_many( deletions, ordered=False )
+                
+        for collection_name in ENTITIES :
+            materialize( self._mdb, collection_name, batchID, self._deltaFrom )
+                
     def processAttendees( self, group ):
         
-        writer = self._meetup_api.get_attendees( group )
+        if self._incremental :
+            return self.processNewAttendees( group )
+        
+        writer = self._meetup_api.get_attendees( group, 
+                                                 workers=self._attendee_workers, 
+                                                 ordered=self._ordered_attendees )
         
         newWriter = mergeEvents( writer )
         self.process( self._attendees, newWriter, self._audit.addTimestamp, "info"  )
         
+    def group_past_events(self, url_name ):
+        '''
+        The past events for url_name. Use the events already captured in this batch
+        if there are any, otherwise ask the API.
+        '''
+        cursor = self._pastEvents.find( { "batchID" : self._audit.getCurrentBatchID(),
+                                          "event.group.urlname" : url_name } ).sort( "event.time", pymongo.ASCENDING )
+        events = [ i[ "event" ] for i in cursor ]
+        
+        if len( events ) == 0 :
+            events = list( self._meetup_api.get_past_events( url_name ))
+            
+        return events
+        
+    def processNewAttendees(self, url_name ):
+        '''
+        The attendance for an event is final once the event has been over for longer than
+        incremental_window. The attendance index records, for each final event, the batch
+        that holds its attendees. Those attendees are linked into the current batch and
+        we only go to the API for events that are new or still within the window.
+        
+        The index is written as each group is processed so it can name a batch that
+        never ended (a failed run) or the current batch (when resuming, its partial data
+        has been discarded). Only entries for valid batches are used, the attendees of
+        any other event are fetched again.
+        '''
+        
+        batchID = self._audit.getCurrentBatchID()
+        finalCutoff = datetime.now() - self._incremental_window
+        
+        indexed = dict( ( i[ "_id" ], i[ "batchID" ] ) for i in self._attendanceIndex.find( { "urlname" : url_name } ))
+        valid = self._audit.validBatchIDs( set( indexed.values()))
+        captured = dict( ( k, v ) for ( k, v ) in indexed.iteritems() if v in valid )
+        
+        ( final, carried, fetch ) = classifyAttendance( self.group_past_events( url_name ), captured, finalCutoff )
+                
+        for ( fromBatchID, eventIDs ) in carried.items():
+            linked = self._audit.linkBatch( self._attendees, { "info.event.id" : { "$in" : eventIDs }}, fromBatchID )
+            logging.info( "linked %i attendees of %i events for '%s' from batch %i", 
+                          linked, len( eventIDs ), url_name, fromBatchID )
+            
+        logging.info( "fetching attendees for %i events for '%s'", len( fetch ), url_name )
+        writer = self._meetup_api.get_events_attendees( fetch, url_name,
+                                                        workers=self._attendee_workers, 
+                                                        ordered=self._ordered_attendees )
+        self.process( self._attendees, mergeEvents( writer ), self._audit.addTimestamp, "info"  )
+        
+        #
+        # Carried events keep pointing at the valid batch they were linked from, which
+        # still holds their attendees. Only the final events fetched here are indexed
+        # against this batch, if it never ends they are fetched again next time.
+        #
+        finalIDs = set( final )
+        fetched = [ event[ "id" ] for event in fetch if event[ "id" ] in finalIDs ]
+        if len( fetched ) > 0 :
+            self._attendanceIndex.bulk_write( [ UpdateOne( { "_id" : i }, 
+                                                           { "$set" : { "urlname" : url_name, "batchID" : batchID }},
+                                                           upsert=True ) for i in fetched ], ordered=False )
+        
     def processGroup(self, url_name, groupName="group"):
         group = self._meetup_api.get_group( url_name )
         newDoc = self._audit.addTimestamp( groupName, group )
@@ -88,9 +317,59 @@ class MeetupWriter(object):
         for i in self._urls:
             yield self._meetup_api.get_group( i )
         
+    def previousBatchID(self ):
+        '''
+        The last valid batch we can link unchanged data from, or None if there isn't one.
+        '''
+        try:
+            return self._audit.getCurrentValidBatchID()
+        except ValueError :
+            return None
+        
     def processPastEvents(self, url_name ):
-        pastEvents = self._meetup_api.get_past_events( url_name )
+        
+        if self._incremental :
+            pastEvents = self.get_new_past_events( url_name )
+        else:
+            pastEvents = self._meetup_api.get_past_events( url_name )
+            
         self.process( self._pastEvents, pastEvents, self._audit.addTimestamp, "event" )
+        
+    def get_new_past_events(self, url_name ):
+        '''
+        Past events don't change once they are over. Find the newest event for url_name in
+        the previous valid batch, link every event that is more than incremental_window older
+        than it into the current batch and only ask the API for events after that.
+        '''
+        
+        prevBatchID = self.previousBatchID()
+        if prevBatchID is None :
+            return self._meetup_api.get_past_events( url_name )
+        
+        newest = self._pastEvents.find_one( { "batchID" : prevBatchID,
+                                              "event.group.urlname" : url_name },
+                                            sort=[ ( "event.time", pymongo.DESCENDING ) ] )
+        if newest is None:
+            return self._meetup_api.get_past_events( url_name )
+        
+        cutoff = newest[ "event" ][ "time" ] - self._incremental_window
+        
+        linked = self._audit.linkBatch( self._pastEvents, 
+                                        { "event.group.urlname" : url_name,
+                                          "event.time"          : { "$lt" : cutoff }},
+                                        prevBatchID )
+        
+        logging.info( "linked %i past events for '%s' from batch %i", linked, url_name, prevBatchID )
+        
+        known = set( self._pastEvents.find( { "batchID" : self._audit.getCurrentBatchID(),
+                                              "event.group.urlname" : url_name } ).distinct( "event.id" ))
+        
+        #
+        # Ask for a day before the cutoff to allow for timezone slop, we drop the
+        # events we already linked by ID.
+        #
+        events = self._meetup_api.get_past_events( url_name, since=cutoff - timedelta( days=1 ))
+        return ( e for e in events if e[ "id" ] not in known )
    
     def processUpcomingEvents(self, url_name ):
         upcomingEvents = self._meetup_api.get_upcoming_events( url_name )
@@ -117,6 +396,42 @@ class MeetupWriter(object):
         return self._mugs
     
     
+    def completed(self, phase, url_name=None ):
+        return ( phase, url_name ) in self._completed
+    
+    def discard(self, phase, url_name=None ):
+        '''
+        Remove any data written to the current batch by phase for url_name.
+        '''
+        batchID = self._audit.getCurrentBatchID()
+        
+        if phase == "groups" :
+            self._audit.unlinkBatch( self._groups, {}, batchID )
+        elif phase == "members" :
+            self._audit.unlinkBatch( self._members, {}, batchID )
+        elif phase == "pastevents" :
+            self._audit.unlinkBatch( self._pastEvents, { "event.group.urlname" : url_name }, batchID )
+        elif phase == "upcomingevents" :
+            self._audit.unlinkBatch( self._upcomingEvents, { "event.group.urlname" : url_name }, batchID )
+        elif phase == "attendees" :
+            self._audit.unlinkBatch( self._attendees, { "info.event.group.urlname" : url_name }, batchID )
+        
+    def run_phase(self, phase, url_name, func, *args ):
+        '''
+        Run func( *args ) for phase and record a checkpoint when it completes. If we are
+        resuming a batch, phases that have already completed are skipped and partial
+        data from a phase that was interrupted is discarded first.
+        '''
+        if self.completed( phase, url_name ) :
+            logging.info( "skipping completed phase '%s' for : '%s'", phase, url_name )
+            return
+        
+        if self._resuming :
+            self.discard( phase, url_name )
+            
+        func( *args )
+        self._audit.checkpoint( self._audit.getCurrentBatchID(), phase, url_name )
+        
     def capture_snapshot(self, url_name,  admin_arg, phases ):
 
         try :
@@ -124,14 +439,14 @@ class MeetupWriter(object):
             for i in phases:
                 if i == "pastevents" :
                     logging.info( "process past events for      : '%s'", url_name )
-                    self.processPastEvents( url_name )
+                    self.run_phase( i, url_name, self.processPastEvents, url_name )
                 elif i == "upcomingevents" :
                     logging.info( "process upcoming events for  : '%s'", url_name )
-                    self.processUpcomingEvents( url_name )
+                    self.run_phase( i, url_name, self.processUpcomingEvents, url_name )
                 elif i == "attendees" :
                     if admin_arg:
                         logging.info( "process attendees            : '%s'", url_name )
-                        self.processAttendees( url_name )
+                        self.run_phase( i, url_name, self.processAttendees, url_name )
                     else:
                         logging.warn( "You have not specified the admin arg")
                         logging.warn( "You must be a meetup admin user to request attendees")
@@ -148,3 +463,32 @@ class MeetupWriter(object):
 
 
 
+
+    
+    def capture_snapshots(self, url_names, admin_arg, phases, workers=1 ):
+        '''
+        Call capture_snapshot for each group in url_names. If workers is greater than one
+        the groups are captured in parallel using a pool of worker threads. Each worker
+        writes under the batchID of our audit object so all the groups end up in the same
+        batch. If any worker fails the pool is shut down and the exception is re-raised
+        to the caller, so the batch is never ended on a partial capture.
+        '''
+        
+        if workers <= 1 :
+            for i in url_names :
+                self.capture_snapshot( i, admin_arg, phases )
+            return
+        
+        logging.info( "capturing %i groups using %i workers", len( url_names ), workers )
+        pool = ThreadPool( workers )
+        try:
+            for _ in pool.imap_unordered( lambda url_name : self.capture_snapshot( url_name, admin_arg, phases ),
+                                          url_names ):
+                pass
+        except :
+            pool.terminate()
+            pool.join()
+            raise
+        else:
+            pool.close()
+            pool.join()
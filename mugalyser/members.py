@@ -4,13 +4,11 @@ Created on 11 Oct 2016
 @author: jdrumgoole
 '''
 
-from mugalyser.agg import Agg, Sorter
+from mongodb_utils.agg import Agg, Sorter
 from mugalyser.feedback import Feedback
-from mugalyser.mugdata import MUGData
-import itertools
+from mugalyser.mugdata import MUGData, Format, chunks
 import pymongo
 
-from mugalyser.audit import Audit
 from utils.query import Query
 
 class Members(MUGData):
@@ -18,6 +16,10 @@ class Members(MUGData):
     classdocs
     '''
     
+    FIELDS = { Format.oneline : [ "member.member_name", "member.member_id" ],
+               Format.summary : [ "member.member_name", "member.member_id", "member.country" ],
+               Format.full    : None }
+    
     def __init__(self, mdb ):
         '''
         Constructor
@@ -30,9 +32,8 @@ class Members(MUGData):
         self._membersAgg.addSort( Sorter( occurences = pymongo.DESCENDING  )) # largest first
         self._memberCount = 0
         self._feedback = Feedback()
-        self._audit = Audit( mdb )
         
-    def get_group_members(self, url_name, q=None ):
+    def get_group_members(self, url_name, q=None, projection=None ):
         '''
         returns a MongoDB cursor.
         '''
@@ -40,52 +41,85 @@ class Members(MUGData):
         if q :
             query.update( q )
 
-        return self.find( query )
+        return self.find( query, projection )
         
-    def get_many_group_members(self, groups, query=None):
+    def get_many_group_members(self, groups, query=None, projection=None ):
         '''
-        returns a generator
+        returns a MongoDB cursor over the members of any of groups. This is a single
+        query so a member of more than one of the groups is returned once.
         '''
-        
-        return itertools.chain( *[ self.get_group_members( i, query ) for i in groups ] )
+        q = { "member.chapters.urlname" : { "$in" : list( groups ) }}
+        if query :
+            q.update( query )
+            
+        return self.find( q, projection )
 
+    def group_member_counts(self, groups ):
+        '''
+        returns a dict of urlname : member count for groups from a single aggregation.
+        Groups with no members are included with a count of 0.
+        '''
+        groups = list( groups )
+        agg = Agg( self._collection )
+        agg.addMatch( { "batchID" : self.validBatchID(),
+                        "member.chapters.urlname" : { "$in" : groups }} )
+        agg.addUnwind( "$member.chapters" )
+        agg.addMatch( { "member.chapters.urlname" : { "$in" : groups }} )
+        agg.addGroup( { "_id" : "$member.chapters.urlname", "count" : { "$sum" : 1 }} )
+        
+        counts = dict( ( i, 0 ) for i in groups )
+        for i in agg.aggregate():
+            counts[ i[ "_id" ]] = i[ "count" ]
+        return counts
+    
     def count_members(self, groups ):
-        
-        total = 0 
-        for i in groups:
-            count = self.get_group_members( i ).count()
-            total = total + count
-            
-        return count
+        '''
+        The total of the member counts of groups. A member of two groups counts twice.
+        '''
+        return sum( self.group_member_counts( groups ).values())
     
-    def get_all_members(self, query=None ):
+    def get_all_members(self, query=None, projection=None ):
         '''
         Query meetup API for multiple groups.
         '''
-        return self.find( query )
+        return self.find( query, projection )
         
     def distinct_members(self ):
         return self._collection.distinct( "member.member_name")
     
-    def get_by_name(self, name ):
-        member = self.find_one( { "member.member_name" : name })
+    def get_by_name(self, name, projection=None ):
+        member = self.find_one( { "member.member_name" : name }, projection )
         
         if member is None:
             return None
         else:
             return member[ "member" ]
         
-    def get_by_ID(self, member_id):
-        val = self.find_one( { "member.member_id" : member_id })
+    def get_by_ID(self, member_id, projection=None ):
+        val = self.find_one( { "member.member_id" : member_id }, projection )
         
         if val is None:
             return val
         else:
             return val[ "member" ]
         
-    def get_by_join_date(self, start, end ):
+    def get_by_IDs(self, member_ids, projection=None, chunk_size=1000 ):
+        '''
+        returns a dict of member_id : member for the members in member_ids that exist.
+        Each chunk_size member_ids are looked up with a single $in query.
+        '''
+        if projection is not None and "member.member_id" not in projection :
+            projection = dict( projection, **{ "member.member_id" : 1 } )
+            
+        members = {}
+        for ids in chunks( sorted( set( member_ids )), chunk_size ):
+            for i in self.find( { "member.member_id" : { "$in" : ids }}, projection ):
+                members[ i[ "member" ][ "member_id" ]] = i[ "member" ]
+        return members
+        
+    def get_by_join_date(self, start, end, projection=None ):
 
-        return self.find( { "member.join_time" : { "$gte" : start, "$lte" : end  }})
+        return self.find( { "member.join_time" : { "$gte" : start, "$lte" : end  }}, projection )
         
     def joined_by_year(self):
         
@@ -117,13 +151,18 @@ class Members(MUGData):
         
 class Organizers( Members ):
     
-    def get_organizers(self):
-        return self.find( { "member.is_organizer" : True })
+    FIELDS = { Format.oneline : [ "member.member_name", "member.member_id" ],
+               Format.summary : [ "member.member_name", "member.member_id", "member.country", "member.chapters.urlname" ],
+               Format.full    : None }
+    
+    def get_organizers(self, projection=None ):
+        return self.find( { "member.is_organizer" : True }, projection )
     
     def get_mugs(self, organizer_name  ):
         
         doc = self.find_one( { "member.is_organizer" : True, 
-                               "member.member_name"  : organizer_name } )
+                               "member.member_name"  : organizer_name },
+                             { "member.chapters" : 1 } )
         
         return doc["member"][ "chapters" ]
         
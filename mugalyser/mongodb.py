@@ -5,6 +5,10 @@ Created on 22 Jun 2016
 '''
 
 import pymongo
+import threading
+
+from mugalyser.audit import Audit
+from mugalyser.version import __indexVersion__
 
 class MUGAlyserMongoDB( object ):
     
@@ -31,6 +35,10 @@ class MUGAlyserMongoDB( object ):
         self._pastEvents      = None
         self._upcomingEvents  = None
         self._attendees       = None
+        self._attendanceIndex = None
+        self._auditObject     = None
+        self._auditLock       = threading.Lock()
+        self._queryCache      = None
         
         
         if setup:
@@ -60,7 +68,31 @@ class MUGAlyserMongoDB( object ):
         self._upcomingEvents  = self._database[ "upcoming_events" ]
         self._audit           = self._database[ "audit" ]
         self._attendees       = self._database[ "attendees"]
+        self._attendanceIndex = self._database[ "attendance_index" ]
+        
+        #
+        # Creating the indexes is a round trip per index so we only do it when the
+        # database hasn't seen this version of the indexes.
+        #
+        version = self.indexVersion()
+        if version is None or version < __indexVersion__ :
+            self.ensureSchema()
+            
+    def indexVersion(self ):
+        '''
+        The version of the indexes recorded by ensureSchema, None for a new database.
+        '''
+        doc = self._audit.find_one( { "name" : "Index Version" } )
+        if doc is None :
+            return None
+        else:
+            return doc[ "indexVersion" ]
         
+    def ensureSchema(self ):
+        '''
+        Create all the indexes and record __indexVersion__ in the audit collection.
+        create_index is a no-op for indexes that already exist so this is safe to rerun.
+        '''
         self._audit.create_index( [("name", pymongo.ASCENDING )] )
         
         self._members.create_index([("member.location", pymongo.GEOSPHERE)])
@@ -74,7 +106,49 @@ class MUGAlyserMongoDB( object ):
         self._pastEvents.create_index([( "batchID", pymongo.ASCENDING )])
         self._upcomingEvents.create_index([( "batchID", pymongo.ASCENDING )])
         self._attendees.create_index([( "batchID", pymongo.ASCENDING )])
+        self._attendees.create_index([( "info.event.id", pymongo.ASCENDING )])
+        self._attendanceIndex.create_index([( "urlname", pymongo.ASCENDING )])
+        
+        #
+        # Almost every query is for one batch and one or more groups. Run bin/mug_explain_main.py
+        # to check the query templates in mugalyser.explain against these.
+        #
+        # member.chapters is an array and so is batchID for linked or deduplicated
+        # documents. A compound index can't contain two arrays so the chapters are
+        # indexed on their own (index version 4 drops the old compound index).
+        #
+        if "batchID_1_member.chapters.urlname_1" in self._members.index_information() :
+            self._members.drop_index( "batchID_1_member.chapters.urlname_1" )
+        self._members.create_index([( "member.chapters.urlname", pymongo.ASCENDING )])
+        self._members.create_index([( "batchID", pymongo.ASCENDING ), 
+                                    ( "member.member_id", pymongo.ASCENDING )])
+        self._groups.create_index([( "batchID", pymongo.ASCENDING ), 
+                                   ( "group.urlname", pymongo.ASCENDING )])
+        self._groups.create_index([( "batchID", pymongo.ASCENDING ), 
+                                   ( "group.country", pymongo.ASCENDING )])
+        for i in [ self._pastEvents, self._upcomingEvents ] :
+            i.create_index([( "batchID", pymongo.ASCENDING ), 
+                            ( "event.group.urlname", pymongo.ASCENDING ),
+                            ( "event.status", pymongo.ASCENDING )])
+        self._attendees.create_index([( "batchID", pymongo.ASCENDING ), 
+                                      ( "info.event.group.urlname", pymongo.ASCENDING )])
+        
+        for i in [ self._groups, self._members, self._pastEvents, self._upcomingEvents, self._attendees ] :
+            i.create_index([( "contentHash", pymongo.ASCENDING )], unique=True, sparse=True )
+            self.deltasCollection( i.name ).create_index([( "batchID", pymongo.ASCENDING )])
+            
+        for ( name, field ) in [ ( "group_totals", "group" ), ( "group_rsvps", "group" ), 
+                                 ( "attendance", "group" ), ( "country_totals", "country" ) ] :
+            self._database[ "rollup_" + name ].create_index([( "batchID", pymongo.ASCENDING ), 
+                                                             ( field, pymongo.ASCENDING )])
+            
+        self._audit.update_one( { "name" : "Index Version" },
+                                { "$set" : { "indexVersion" : __indexVersion__ }},
+                                upsert=True )
         
+    def uri(self):
+        return self._uri
+    
     def client(self):
         return self._client
     
@@ -99,11 +173,42 @@ class MUGAlyserMongoDB( object ):
     def auditCollection(self):
         return self._audit
     
+    def audit(self):
+        '''
+        The Audit object shared by everything using this connection.
+        '''
+        with self._auditLock :
+            if self._auditObject is None :
+                self._auditObject = Audit( self )
+            return self._auditObject
+    
     def membersCollection(self):
         return self._members
     
     def attendeesCollection(self):
         return self._attendees
     
+    def attendanceIndexCollection(self):
+        '''
+        One document per event whose attendance has been captured and is final:
+        { "_id" : <event id>, "urlname" : <group>, "batchID" : <batch holding the attendees> }
+        '''
+        return self._attendanceIndex
+    
+    def queryCache(self):
+        '''
+        The QueryCache used by MUGData for queries on finished batches or None.
+        '''
+        return self._queryCache
+    
+    def setQueryCache(self, cache ):
+        self._queryCache = cache
+        
+    def deltasCollection(self, collection_name ):
+        '''
+        The collection holding the changes recorded by delta batches for collection_name.
+        '''
+        return self._database[ collection_name + "_deltas" ]
+    
     def collection_names(self ):
         return [ "groups" , "members", "attendees", "past_events" , "upcoming_events" ]
\ No newline at end of file
@@ -4,9 +4,11 @@ Created on 23 Nov 2016
 @author: jdrumgoole
 '''
 
-from audit import Audit
 from feedback import Feedback
+from delta import reconstruct
+from querycache import QueryCache, CachedCursor, CachedResult
 import pprint
+from pymongo.cursor import Cursor
 
 from enum import Enum
 
@@ -15,6 +17,41 @@ class Format( Enum ):
     summary = 2
     full = 3
     
+def toFormat( format_type ):
+    '''
+    Map a format name ( "oneline", "summary", "full" ) or None to a Format. None
+    and unknown names are Format.full.
+    '''
+    if isinstance( format_type, Format ):
+        return format_type
+    elif format_type in Format.__members__ :
+        return Format[ format_type ]
+    else:
+        return Format.full
+    
+def makeProjection( fields ):
+    '''
+    A pymongo projection for a list of dotted field names. None means all fields.
+    '''
+    if fields is None :
+        return None
+    else:
+        return dict( ( f, 1 ) for f in fields )
+    
+def chunks( iterable, size=1000 ):
+    '''
+    Yield lists of up to size items from iterable. Used to keep $in queries to a
+    reasonable size when looking up many keys.
+    '''
+    chunk = []
+    for i in iterable :
+        chunk.append( i )
+        if len( chunk ) == size :
+            yield chunk
+            chunk = []
+    if chunk :
+        yield chunk
+    
 def printCursor( c, filterField=None, filterList=None ):
     count = 0 
     for i in c :
@@ -28,9 +65,17 @@ def printCursor( c, filterField=None, filterList=None ):
     
 class MUGData( object ):
     
+    #
+    # The fields each output format needs. Subclasses override this so that
+    # only these fields are read from the database, None means the whole document.
+    #
+    FIELDS = { Format.oneline : None,
+               Format.summary : None,
+               Format.full    : None }
+    
     def __init__( self, mdb, collection_name ):
         self._mdb = mdb
-        self._audit = Audit( mdb )
+        self._audit = mdb.audit()
         self._feedback = Feedback()
         self._collection = mdb.make_collection( collection_name )
 
@@ -43,36 +88,84 @@ class MUGData( object ):
             if i[ selector ] in values:
                 yield i
         
-    def find_one(self, query=None ):
-        batch_query = { "batchID" : self._audit.getCurrentBatchID() }
+    def projection(self, format_type=None ):
+        '''
+        The projection for format_type, None for the full document.
+        '''
+        return makeProjection( self.FIELDS[ toFormat( format_type ) ] )
+    
+    def validBatchID(self ):
+        '''
+        The current valid batch ID.
+        '''
+        return self._audit.getCurrentValidBatchID()
+        
+    def find_one(self, query=None, projection=None ):
+        batchID = self._audit.pinned()
+        if batchID is None :
+            batchID = self._audit.getCurrentBatchID()
+        batch_query = { "batchID" : batchID }
         if query is not None:
             batch_query.update( query )
         
-        #pprint.pprint( batch_query )
-        return self._collection.find_one( batch_query )
+        cache = self._mdb.queryCache()
+        if cache is None or not self._audit.isFinished( batch_query[ "batchID" ] ):
+            return self._collection.find_one( batch_query, projection )
+        
+        key = QueryCache.key( self._mdb.uri(), self._collection.full_name, "find_one", batch_query, projection )
+        docs = list( CachedResult( cache, key, 
+                                   lambda : filter( None, [ self._collection.find_one( batch_query, projection ) ] )))
+        return docs[ 0 ] if docs else None
         
     def find(self, q=None, *args, **kwargs ):
         
-        query = { "batchID" : self._audit.getCurrentValidBatchID() } 
+        '''
+        Find q in the current valid batch. Any other arguments (projection, sort etc.)
+        are passed through to pymongo's find.
+        '''
+        query = { "batchID" : self.validBatchID() } 
         if q :
             query.update( q )
             
-        if args and kwargs :
-            return self._collection.find( query, args, kwargs )
-        elif args :
-            return self._collection.find( query, args )
-        elif kwargs:
-            return self._collection.find( query, kwargs )
+        cursor = self._collection.find( query, *args, **kwargs )
+        
+        cache = self._mdb.queryCache()
+        if cache is None or not self._audit.isFinished( query[ "batchID" ] ):
+            return cursor
         else:
-            return self._collection.find( query )
+            return CachedCursor( cache, cursor, self._mdb.uri(), self._collection.full_name, query, args, kwargs )
 
     
+    def reconstruct(self, batchID ):
+        '''
+        Yield the documents of this collection as they were in batchID. For a delta batch
+        they are rebuilt from the last full batch and the deltas since.
+        '''
+        return reconstruct( self._mdb, self._collection.name, batchID )
+    
+                    
     def count(self, g ):
+        '''
+        Count the results of g. A pymongo cursor is counted on the server, anything
+        else is counted by iterating over it.
+        '''
+        if isinstance( g, ( Cursor, CachedCursor )):
+            return g.count( with_limit_and_skip=True )
+        
         count = 0
         for _ in g:
             count = count + 1
         return count
     
+    def count_documents(self, q=None ):
+        '''
+        Server side count of the documents matching q in the current valid batch.
+        '''
+        query = { "batchID" : self.validBatchID() } 
+        if q :
+            query.update( q )
+        return self._collection.count( query )
+    
     def generator(self, cursor ):
         
         for i in cursor:
@@ -88,9 +181,10 @@ class MUGData( object ):
         pass
     
     def doc_print(self, doc, format_type = None  ):
-        if format_type == "summary" :
+        format_type = toFormat( format_type )
+        if format_type is Format.summary :
             print( self.summary( doc ))
-        elif format_type == "oneline" :
+        elif format_type is Format.oneline :
             print( self.one_line( doc ))
         else:
             pprint.pprint( doc )
@@ -0,0 +1,245 @@
+'''
+Created on 18 Oct 2026
+
+A cache for the results of queries and aggregations on completed batches.
+
+A batch never changes once it has ended so the results of a query against
+it can be kept for as long as we like. The cache is keyed on the deployment
+(the MongoDB URI), the collection, the normalised query or pipeline and any
+cursor modifiers (the batchID is part of the query). The URI matters because
+batchIDs are only unique within one deployment and a cache directory can be
+shared by runs against different ones. Queries on a batch that is still being written are not
+cached, MUGData checks this with Audit.isFinished before using the cache.
+
+Results are kept in memory in least recently used order up to maxBytes of
+BSON. If path is set results are also written to that directory so they
+survive between runs of the command line tools. Each file holds the BSON of
+the documents one after another. The directory may be shared, so it is only
+ever decoded as data, never unpickled. The disk tier is not size limited,
+delete the directory to clear it.
+
+Results larger than maxBytes are never cached.
+
+@author: jdrumgoole
+'''
+
+import os
+import threading
+import hashlib
+import copy
+import logging
+from collections import OrderedDict
+
+from bson import BSON, decode_all, json_util
+from bson.errors import InvalidBSON
+
+
+class QueryCache( object ):
+
+    def __init__(self, maxBytes=64 * 1024 * 1024, path=None ):
+        self._maxBytes = maxBytes
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+        if path and not os.path.isdir( path ):
+            os.makedirs( path )
+
+    @staticmethod
+    def key( *parts ):
+        return hashlib.sha1( json_util.dumps( parts, sort_keys=True )).hexdigest()
+
+    def maxBytes(self ):
+        return self._maxBytes
+
+    def _filename(self, key ):
+        return os.path.join( self._path, key + ".bson" )
+
+    def get(self, key ):
+        '''
+        The list of documents cached for key or None.
+        '''
+        with self._lock :
+            if key in self._entries :
+                ( docs, size ) = self._entries.pop( key )
+                self._entries[ key ] = ( docs, size )
+                self._hits = self._hits + 1
+                return docs
+
+        if self._path and os.path.isfile( self._filename( key )):
+            try:
+                with open( self._filename( key ), "rb" ) as f :
+                    data = f.read()
+                docs = decode_all( data )
+            except ( IOError, InvalidBSON ), e :
+                logging.warning( "Ignoring unreadable cache file %s : %s", self._filename( key ), e )
+            else:
+                self._store( key, docs, len( data ))
+                with self._lock :
+                    self._hits = self._hits + 1
+                return docs
+
+        with self._lock :
+            self._misses = self._misses + 1
+        return None
+
+    def put(self, key, docs, size=None ):
+        if size is None :
+            size = sum( len( BSON.encode( d )) for d in docs )
+
+        if size > self._maxBytes :
+            return
+
+        self._store( key, docs, size )
+
+        if self._path :
+            tmp = self._filename( key ) + ".%i.tmp" % os.getpid()
+            with open( tmp, "wb" ) as f :
+                for d in docs :
+                    f.write( BSON.encode( d ))
+            os.rename( tmp, self._filename( key ))
+
+    def _store(self, key, docs, size ):
+        with self._lock :
+            if key in self._entries :
+                self._bytes = self._bytes - self._entries.pop( key )[ 1 ]
+            self._entries[ key ] = ( docs, size )
+            self._bytes = self._bytes + size
+            while self._bytes > self._maxBytes :
+                ( _, ( _, evicted )) = self._entries.popitem( last=False )
+                self._bytes = self._bytes - evicted
+
+    def clear(self ):
+        with self._lock :
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self ):
+        with self._lock :
+            return { "entries" : len( self._entries ),
+                     "bytes"   : self._bytes,
+                     "hits"    : self._hits,
+                     "misses"  : self._misses }
+
+
+class CachedResult( object ):
+    '''
+    Iterates over the cached documents for key if there are any. Otherwise it
+    iterates over producer() and caches the documents as they go past.
+    
+    Callers get their own copy of each document so they can modify it without
+    changing what is cached.
+    '''
+
+    def __init__(self, cache, key, producer ):
+        self._cache = cache
+        self._key = key
+        self._producer = producer
+        self._iterator = None
+
+    def key(self ):
+        return self._key
+
+    def _generate(self ):
+        docs = self._cache.get( self.key())
+        if docs is not None :
+            for d in docs :
+                yield copy.deepcopy( d )
+            return
+
+        docs = []
+        size = 0
+        for d in self._producer() :
+            if docs is not None :
+                size = size + len( BSON.encode( d ))
+                if size > self._cache.maxBytes() :
+                    docs = None
+                else:
+                    docs.append( copy.deepcopy( d ))
+            yield d
+
+        if docs is not None :
+            self._cache.put( self.key(), docs, size )
+
+    def __iter__(self ):
+        return self
+
+    def next(self ):
+        if self._iterator is None :
+            self._iterator = self._generate()
+        return self._iterator.next()
+
+
+class CachedCursor( CachedResult ):
+    '''
+    Wraps a pymongo cursor. sort, skip and limit are passed on to the cursor and
+    become part of the cache key. Any other cursor method is passed on too but
+    stops the results being cached as we don't know how it changes them.
+    '''
+
+    def __init__(self, cache, cursor, *parts ):
+        super( CachedCursor, self ).__init__( cache, None, lambda : self._cursor )
+        self._cursor = cursor
+        self._parts = list( parts )
+        self._cacheable = True
+
+    def key(self ):
+        return QueryCache.key( *self._parts )
+
+    def _generate(self ):
+        if self._cacheable :
+            return super( CachedCursor, self )._generate()
+        else:
+            return iter( self._cursor )
+
+    def sort(self, key_or_list, direction=None ):
+        self._parts.append( ( "sort", key_or_list, direction ))
+        self._cursor.sort( key_or_list, direction )
+        return self
+
+    def skip(self, skip ):
+        self._parts.append( ( "skip", skip ))
+        self._cursor.skip( skip )
+        return self
+
+    def limit(self, limit ):
+        self._parts.append( ( "limit", limit ))
+        self._cursor.limit( limit )
+        return self
+
+    def count(self, with_limit_and_skip=False ):
+        return self._cursor.count( with_limit_and_skip )
+
+    def __getattr__(self, name ):
+        if name.startswith( "_" ):
+            raise AttributeError( name )
+        self._cacheable = False
+        return getattr( self._cursor, name )
+
+
+class CachedAgg( object ):
+    '''
+    Wraps a mongodb_utils Agg so that aggregate() results are cached. The key is parts
+    (the deployment and collection) and the pipeline as printed by the Agg. Everything
+    else is passed on to the Agg.
+    '''
+
+    def __init__(self, cache, agg, *parts ):
+        self._cache = cache
+        self._agg = agg
+        self._parts = list( parts )
+
+    def aggregate(self ):
+        key = QueryCache.key( *( self._parts + [ str( self._agg ) ] ))
+        return CachedResult( self._cache, key, self._agg.aggregate )
+
+    def __str__(self ):
+        return str( self._agg )
+
+    def __getattr__(self, name ):
+        if name.startswith( "_" ):
+            raise AttributeError( name )
+        return getattr( self._agg, name )
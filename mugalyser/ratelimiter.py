@@ -0,0 +1,139 @@
+'''
+Created on 18 Oct 2026
+
+The Meetup API tells us how much of our request quota is left in the
+current window with every response:
+
+X-RateLimit-Limit     : the number of requests allowed in a window
+X-RateLimit-Remaining : the number of requests left in this window
+X-RateLimit-Reset     : the number of seconds until the window resets
+
+RateLimiter uses these values to spread the remaining requests evenly over
+the rest of the window rather than running flat out until the quota is gone
+and then sleeping for the whole reset period. Callers call acquire() before
+each request and update() with the headers of each response.
+
+RateLimiter can be shared between threads. FileRateLimiter keeps its state
+in a locked file so that it can also be shared between processes.
+
+@author: jdrumgoole
+'''
+
+import threading
+import logging
+import time
+import json
+import os
+import fcntl
+from contextlib import contextmanager
+
+
+class RateLimiter( object ):
+
+    def __init__(self, limit=30, window=10, margin=1 ):
+        '''
+        limit  : requests per window assumed until the first response tells us otherwise.
+        window : length of a rate limit window in seconds.
+        margin : number of requests we keep in reserve at the end of each window.
+        '''
+        self._limit = limit
+        self._window = window
+        self._margin = margin
+        self._lock = threading.Lock()
+        self._shared = self._initialState()
+
+    def _initialState(self ):
+        return { "limit"     : self._limit,
+                 "remaining" : self._limit,
+                 "reset"     : time.time() + self._window,
+                 "next"      : 0.0 }
+
+    @contextmanager
+    def _state(self ):
+        with self._lock :
+            yield self._shared
+
+    def acquire(self ):
+        '''
+        Block until it is our turn to make a request.
+        '''
+        while True :
+            with self._state() as state :
+                now = time.time()
+                if now >= state[ "reset" ] :
+                    state[ "remaining" ] = state[ "limit" ]
+                    state[ "reset" ] = now + self._window
+
+                if state[ "remaining" ] > self._margin :
+                    interval = ( state[ "reset" ] - now ) / ( state[ "remaining" ] - self._margin )
+                    slot = max( now, state[ "next" ] )
+                    state[ "next" ] = slot + interval
+                    state[ "remaining" ] = state[ "remaining" ] - 1
+                    delay = slot - now
+                else:
+                    slot = None
+                    delay = state[ "reset" ] - now
+
+            if delay > 0 :
+                if slot is None :
+                    logging.debug( "Rate limit quota used, sleeping for : %.2f", delay )
+                time.sleep( delay )
+
+            if slot is not None:
+                return
+
+    def update(self, headers ):
+        '''
+        Update our view of the quota from the headers of a response.
+        '''
+        try:
+            remaining = int( headers[ "X-RateLimit-Remaining" ] )
+            reset = time.time() + int( headers[ "X-RateLimit-Reset" ] )
+            limit = int( headers.get( "X-RateLimit-Limit", self._limit ))
+        except ( KeyError, ValueError ) :
+            return
+
+        with self._state() as state :
+            state[ "limit" ] = limit
+            if reset > state[ "reset" ] + 1 :
+                # A new window, the server count is authoritative.
+                state[ "remaining" ] = remaining
+            else:
+                # Same window, other requests may still be in flight so
+                # only ever lower our count.
+                state[ "remaining" ] = min( state[ "remaining" ], remaining )
+            state[ "reset" ] = reset
+
+
+class FileRateLimiter( RateLimiter ):
+    '''
+    A RateLimiter whose state lives in a file so that several processes
+    using the same API key can share one quota.
+    '''
+
+    def __init__(self, path, limit=30, window=10, margin=1 ):
+        self._path = path
+        super( FileRateLimiter, self ).__init__( limit, window, margin )
+
+    def path(self):
+        return self._path
+
+    @contextmanager
+    def _state(self ):
+        with self._lock :
+            fd = os.open( self._path, os.O_RDWR | os.O_CREAT, 0o644 )
+            with os.fdopen( fd, "r+" ) as f :
+                fcntl.flock( f, fcntl.LOCK_EX )
+                try:
+                    data = f.read()
+                    if data :
+                        state = json.loads( data )
+                    else:
+                        state = self._initialState()
+                    yield state
+                    f.seek( 0 )
+                    f.truncate()
+                    f.write( json.dumps( state ))
+                    f.flush()
+                finally:
+                    fcntl.flock( f, fcntl.LOCK_UN )
@@ -0,0 +1,122 @@
+'''
+Created on 18 Oct 2026
+
+Rollups are per batch summaries of the raw data that mug_analytics_main
+would otherwise compute from past_events, attendees and members every time
+it runs. They are built once when a batch ends (see Audit.endBatch) or on
+demand with mug_analytics_main --buildrollups and stored in rollup_<name>
+collections, one set of documents per batchID:
+
+rollup_group_totals   : { batchID, group, year, event_count, rsvp_count }
+                        past events by group and year.
+rollup_group_rsvps    : { batchID, group, rsvp_count }
+                        RSVPs for all the events of a group.
+rollup_attendance     : { batchID, attendee, group, event_count, yes_count }
+                        events each member RSVP'd to for each group, and how
+                        many of those RSVPs were a yes.
+rollup_country_totals : { batchID, country, members }
+                        members by member country.
+
+The batch audit document records when its rollups were built in its
+"rollups" field.
+
+@author: jdrumgoole
+'''
+
+from datetime import datetime
+import logging
+
+from mongodb_utils.agg import Agg
+from mugalyser.bulkwriter import BulkWriter
+
+ROLLUPS = [ "group_totals", "group_rsvps", "attendance", "country_totals" ]
+
+class Rollups( object ):
+
+    def __init__(self, mdb ):
+        self._mdb = mdb
+        self._audit = mdb.audit()
+
+    def collection(self, name ):
+        return self._mdb.make_collection( "rollup_" + name )
+
+    def exists(self, batchID ):
+        batch = self._audit.getBatch( batchID )
+        return batch is not None and batch.get( "rollups" ) is not None
+
+    def _group_totals(self, batchID ):
+        agg = Agg( self._mdb.pastEventsCollection())
+        agg.addMatch({ "batchID"      : batchID,
+                       "event.status" : "past" } )
+        agg.addGroup( { "_id" : { "urlname" : "$event.group.urlname",
+                                  "year"    : { "$year" : "$event.time"}},
+                        "event_count" : { "$sum" : 1 },
+                        "rsvp_count"  : { "$sum" : "$event.yes_rsvp_count" }})
+        agg.addProject( { "_id"         : 0,
+                          "group"       : "$_id.urlname",
+                          "year"        : "$_id.year",
+                          "event_count" : 1,
+                          "rsvp_count"  : 1 } )
+        return agg
+
+    def _group_rsvps(self, batchID ):
+        agg = Agg( self._mdb.pastEventsCollection())
+        agg.addMatch({ "batchID" : batchID } )
+        agg.addGroup( { "_id"        : "$event.group.urlname",
+                        "rsvp_count" : { "$sum" : "$event.yes_rsvp_count" }})
+        agg.addProject( { "_id"        : 0,
+                          "group"      : "$_id",
+                          "rsvp_count" : 1 } )
+        return agg
+
+    def _attendance(self, batchID ):
+        agg = Agg( self._mdb.attendeesCollection())
+        agg.addMatch({ "batchID" : batchID } )
+        agg.addGroup( { "_id" : { "attendee" : "$info.attendee.member.name",
+                                  "group"    : "$info.event.group.urlname" },
+                        "event_count" : { "$sum" : 1 },
+                        "yes_count"   : { "$sum" : { "$cond" : [ { "$eq" : [ "$info.attendee.rsvp.response", "yes" ] }, 1, 0 ] }}})
+        agg.addProject( { "_id"         : 0,
+                          "attendee"    : "$_id.attendee",
+                          "group"       : "$_id.group",
+                          "event_count" : 1,
+                          "yes_count"   : 1 } )
+        return agg
+
+    def _country_totals(self, batchID ):
+        agg = Agg( self._mdb.membersCollection())
+        agg.addMatch({ "batchID" : batchID } )
+        agg.addGroup( { "_id"     : "$member.country",
+                        "members" : { "$sum" : 1 }})
+        agg.addProject( { "_id"     : 0,
+                          "country" : "$_id",
+                          "members" : 1 } )
+        return agg
+
+    def build(self, batchID ):
+        '''
+        (Re)build all the rollups for batchID.
+        '''
+        for name in ROLLUPS :
+            collection = self.collection( name )
+            collection.delete_many( { "batchID" : batchID } )
+            agg = getattr( self, "_" + name )( batchID )
+            with BulkWriter( collection ) as writer :
+                for doc in agg.aggregate() :
+                    doc[ "batchID" ] = batchID
+                    writer.send( doc )
+            logging.info( "Built rollup '%s' for batch %i", name, batchID )
+
+        self._audit.auditCollection().update_one( { "batchID" : batchID },
+                                                  { "$set" : { "rollups" : datetime.utcnow() }} )
+
+    def find(self, name, batchID, query=None, newAgg=Agg ):
+        '''
+        An Agg (made by newAgg) that matches the documents of rollup name for batchID and query.
+        '''
+        match = { "batchID" : batchID }
+        if query :
+            match.update( query )
+        agg = newAgg( self.collection( name ))
+        agg.addMatch( match )
+        return agg
@@ -4,7 +4,6 @@ Created on 11 Oct 2016
 @author: jdrumgoole
 '''
 
-from .audit import Audit
 
 class UpcomingEventsx(object):
     '''
@@ -17,7 +16,7 @@ class UpcomingEventsx(object):
         '''
         self._mdb = mdb 
         self._events= mdb.upcomingEventsCollection()
-        self._audit = Audit( mdb )
+        self._audit = mdb.audit()
         
     def upcoming( self ):
         
@@ -10,3 +10,11 @@ __programName__   = "MUGAlyser"
 # Schema version 1.1 : Date mapped the new Group fields so they appear as date time.
 #
 __schemaVersion__ = "1.1"
+#
+# Index version 1 : The indexes created by MUGAlyserMongoDB.ensureSchema. Bump this
+# whenever ensureSchema changes so existing databases pick up the new indexes.
+# Index version 2 : Compound batchID indexes for the per group queries (see mugalyser.explain).
+# Index version 3 : Indexes for the rollup collections.
+# Index version 4 : Replace the members batchID/member.chapters.urlname index, both can be arrays.
+#
+__indexVersion__ = 4
@@ -56,6 +56,7 @@ You can analyse the data with apps/mug_analytics_main.py
                  "bin/meetup_info_main.py",
                  "bin/mug_analytics_main.py",
                  "bin/mug_db_setup.py",
+                 "bin/mug_explain_main.py",
                  "bin/mugalyser_main.py",
                  "bin/muginfo_main.py",
                  "bin/mugs.sh",
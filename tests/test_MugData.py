@@ -5,7 +5,8 @@ Created on 6 Jan 2017
 '''
 import unittest
 from mugalyser.mongodb import MUGAlyserMongoDB
-from mugalyser.mugdata import MUGData
+from mugalyser.mugdata import MUGData, Format, toFormat, makeProjection, chunks
+from mugalyser.members import Members
 class Test(unittest.TestCase):
 
 
@@ -22,6 +23,31 @@ class Test(unittest.TestCase):
         cursor = self._mugData.find( {  "group.country" : { "$in" : [ 'USA' ] }})
         self.assertEqual( len( list( cursor )), 41 )
 
+    def testProjection(self):
+        cursor = self._mugData.find( {  "group.country" : "USA" }, { "group.urlname" : 1, "_id" : 0 } )
+        for i in cursor :
+            self.assertEqual( [ "group" ], i.keys())
+            self.assertEqual( [ "urlname" ], i[ "group" ].keys())
+            
+        doc = self._mugData.find_one( {  "group.country" : "USA" }, { "group.country" : 1 } )
+        self.assertEqual( [ "country" ], doc[ "group" ].keys())
+        
+    def testChunks(self):
+        self.assertEqual( [ [ 0, 1 ], [ 2, 3 ], [ 4 ] ], list( chunks( range( 5 ), 2 )))
+        self.assertEqual( [], list( chunks( [], 2 )))
+
+    def testFormat(self):
+        self.assertEqual( Format.summary, toFormat( "summary" ))
+        self.assertEqual( Format.full, toFormat( None ))
+        self.assertEqual( None, makeProjection( None ))
+        
+        members = Members( self._mdb )
+        self.assertEqual( None, members.projection( "full" ))
+        projection = members.projection( "oneline" )
+        self.assertEqual( { "member.member_name" : 1, "member.member_id" : 1 }, projection )
+        for i in members.get_all_members( None, projection ).limit( 10 ) :
+            members.one_line( i )
+            
     def testCombine(self):
         pass
         
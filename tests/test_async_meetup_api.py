@@ -0,0 +1,29 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+from mugalyser.async_meetup_api import AsyncMeetupAPI
+
+class Test_async_meetup_api(unittest.TestCase):
+
+    def setUp(self):
+        self._api = AsyncMeetupAPI( concurrency=4 )
+
+    def tearDown(self):
+        self._api.close()
+
+    def test_get_group(self):
+        groups = dict( self._api.get_group( [ "DublinMUG", "London-MongoDB-User-Group" ] ))
+        self.assertEqual( groups[ "DublinMUG" ][ "city" ], u"Dublin" )
+        self.assertEqual( groups[ "London-MongoDB-User-Group" ][ "urlname" ], u"London-MongoDB-User-Group" )
+        
+    def test_get_past_events(self):
+        events = list( self._api.get_past_events( [ "DublinMUG", "London-MongoDB-User-Group" ] ))
+        dublin = [ e for ( g, e ) in events if g == "DublinMUG" ]
+        self.assertGreaterEqual( len( dublin ), 29 )
+        self.assertGreater( len( events ), len( dublin ))
+        
+if __name__ == "__main__":
+    unittest.main()
@@ -5,9 +5,9 @@ Created on 16 Oct 2016
 '''
 
 from mugalyser.mongodb import MUGAlyserMongoDB
-from mugalyser.audit import Audit
+from mugalyser.audit import Audit, BatchIDCache, batchIDCache
 import unittest
-from mugalyser.version import __programName__, __version__
+from mugalyser.version import __programName__, __version__, __schemaVersion__
 from mugalyser.apikey import get_meetup_key
 
 class Test_audit(unittest.TestCase):
@@ -20,8 +20,32 @@ class Test_audit(unittest.TestCase):
 
     def tearDown(self):
         self._mdb.client().drop_database( "TEST_AUDIT" )
-        pass
+        batchIDCache.invalidate()
     
+    def test_construction(self):
+        self._mdb.client().drop_database( "TEST_AUDIT" )
+        audit = Audit( self._mdb )
+        self.assertEqual( self._mdb.auditCollection().count(), 0 )
+        self.assertRaises( ValueError, audit.getCurrentBatchID )
+        self.assertRaises( ValueError, audit.getLastBatchID )
+        self.assertTrue( self._mdb.audit() is self._mdb.audit())
+        
+        self.assertEqual( audit.incrementBatchID(), 1 )
+        curBatch = audit.getCurrentBatch()
+        self.assertEqual( curBatch[ "batchID" ], 0 )
+        self.assertEqual( curBatch[ "schemaVersion" ], __schemaVersion__ )
+        
+    def test_migrate(self):
+        self._mdb.client().drop_database( "TEST_AUDIT" )
+        self._mdb.auditCollection().insert_one( { "name" : "Current Batch", "ID" : 5 } )
+        self._audit.migrate()
+        self._audit.migrate()
+        curBatch = self._audit.getCurrentBatch()
+        self.assertEqual( curBatch[ "currentID" ], 5 )
+        self.assertEqual( curBatch[ "batchID" ], 0 )
+        self.assertEqual( curBatch[ "schemaVersion" ], __schemaVersion__ )
+        self.assertFalse( "ID" in curBatch )
+        
     #@unittest.skip
     def test_incrementID(self):
         batchID = self._audit.incrementBatchID()
@@ -93,6 +117,101 @@ class Test_audit(unittest.TestCase):
         self._audit.endBatch( batchID )
         self.assertFalse( self._audit.incomplete( batchID ))
         
+    def test_linkBatch(self):
+        collection = self._mdb.database()[ "TEST_LINK" ]
+        first = self._audit.startBatch( {} )
+        collection.insert_many( [ self._audit.addTimestamp( "event", { "id" : i } ) for i in range( 10 ) ] )
+        self._audit.endBatch( first )
+        
+        second = self._audit.startBatch( {} )
+        linked = self._audit.linkBatch( collection, { "event.id" : { "$lt" : 5 }}, first )
+        self.assertEqual( linked, 5 )
+        self._audit.endBatch( second )
+        
+        self.assertEqual( collection.count( { "batchID" : first } ), 10 )
+        self.assertEqual( collection.count( { "batchID" : second } ), 5 )
+        self.assertEqual( collection.count(), 10 )
+        
+        # linking twice is harmless
+        self.assertEqual( self._audit.linkBatch( collection, { "event.id" : { "$lt" : 5 }}, first, second ), 0 )
+        
+    def test_checkpoints(self):
+        batchID = self._audit.startBatch( {} )
+        self.assertEqual( self._audit.getCheckpoints( batchID ), set())
+        self._audit.checkpoint( batchID, "groups" )
+        self._audit.checkpoint( batchID, "pastevents", "DublinMUG" )
+        self._audit.checkpoint( batchID, "pastevents", "DublinMUG" )
+        self.assertEqual( self._audit.getCheckpoints( batchID ), 
+                          set( [ ( "groups", None ), ( "pastevents", "DublinMUG" ) ] ))
+        
+        audit = Audit( self._mdb )
+        self.assertEqual( audit.resumeBatch( batchID ), batchID )
+        self.assertEqual( audit.getCurrentBatchID(), batchID )
+        audit.endBatch( batchID )
+        self.assertRaises( ValueError, audit.resumeBatch, batchID )
+        self.assertRaises( ValueError, audit.resumeBatch, batchID + 1 )
+        
+    def test_unlinkBatch(self):
+        collection = self._mdb.database()[ "TEST_LINK" ]
+        first = self._audit.startBatch( {} )
+        collection.insert_many( [ self._audit.addTimestamp( "event", { "id" : i } ) for i in range( 10 ) ] )
+        self._audit.endBatch( first )
+        
+        second = self._audit.startBatch( {} )
+        self._audit.linkBatch( collection, { "event.id" : { "$lt" : 5 }}, first )
+        collection.insert_many( [ self._audit.addTimestamp( "event", { "id" : i } ) for i in range( 5, 10 ) ] )
+        self.assertEqual( collection.count( { "batchID" : second } ), 10 )
+        
+        self._audit.unlinkBatch( collection, {}, second )
+        self.assertEqual( collection.count( { "batchID" : second } ), 0 )
+        self.assertEqual( collection.count( { "batchID" : first } ), 10 )
+        self.assertEqual( collection.count(), 10 )
+        
+    def test_batchIDCache(self):
+        first = self._audit.startBatch( {}, trial=False, apikey=get_meetup_key())
+        self._audit.endBatch( first )
+        self.assertEqual( first, self._audit.getCurrentValidBatchID())
+        
+        # A second Audit object sees the cached value and endBatch invalidates it
+        second = Audit( self._mdb ).startBatch( {}, trial=False, apikey=get_meetup_key())
+        self.assertEqual( first, self._audit.getCurrentValidBatchID())
+        Audit( self._mdb ).endBatch( second )
+        self.assertEqual( second, self._audit.getCurrentValidBatchID())
+        
+    def test_batchIDCache_ttl(self):
+        now = [ 0 ]
+        cache = BatchIDCache( ttl=30, clock=lambda : now[ 0 ] )
+        latest = [ 1 ]
+        self.assertEqual( 1, cache.get( "k", lambda : latest[ 0 ] ))
+        
+        # Another process ends batch 2, we keep the cached value until it expires
+        latest[ 0 ] = 2
+        now[ 0 ] = 29
+        self.assertEqual( 1, cache.get( "k", lambda : latest[ 0 ] ))
+        now[ 0 ] = 30
+        self.assertEqual( 2, cache.get( "k", lambda : latest[ 0 ] ))
+        
+        # Pins don't expire
+        with cache.pin( "k", 1 ):
+            now[ 0 ] = 1000
+            self.assertEqual( 1, cache.get( "k", lambda : latest[ 0 ] ))
+        
+    def test_pin(self):
+        first = self._audit.startBatch( {}, trial=False, apikey=get_meetup_key())
+        self._audit.endBatch( first )
+        second = self._audit.startBatch( {}, trial=False, apikey=get_meetup_key())
+        self._audit.endBatch( second )
+        
+        with self._audit.pin( first ):
+            self.assertEqual( first, Audit( self._mdb ).getCurrentValidBatchID())
+            self.assertEqual( first, self._audit.pinned())
+            with self._audit.pin( second ):
+                self.assertEqual( second, self._audit.getCurrentValidBatchID())
+            self.assertEqual( first, self._audit.getCurrentValidBatchID())
+            
+        self.assertEqual( None, self._audit.pinned())
+        self.assertEqual( second, self._audit.getCurrentValidBatchID())
+        
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,76 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+
+from mugalyser.mongodb import MUGAlyserMongoDB
+from mugalyser.bulkwriter import BulkWriter, PipelinedWriter
+
+class Test_bulkwriter(unittest.TestCase):
+
+    def setUp(self):
+        self._mdb = MUGAlyserMongoDB( uri="mongodb://localhost/TEST_BULKWRITER" )
+        self._collection = self._mdb.database()[ "TEST_WRITE"]
+
+    def tearDown(self):
+        self._mdb.client().drop_database( "TEST_BULKWRITER" )
+
+    def test_writeLimit(self):
+        with BulkWriter( self._collection, lambda x,y: { x : y }, "test", writeLimit=1000 ) as writer :
+            for i in range( 17000  ):
+                writer.send( { "value" : i })
+                
+        self.assertEqual( self._collection.count(), 17000 )
+        stats = writer.stats().stats( "TEST_WRITE" )
+        self.assertEqual( stats[ "docs" ], 17000 )
+        self.assertEqual( stats[ "flushes" ], 17 )
+        
+    def test_byteLimit(self):
+        writer = BulkWriter( self._collection, writeLimit=1000, byteLimit=1024 )
+        for i in range( 100 ):
+            writer.send( { "value" : "x" * 100 })
+        self.assertGreaterEqual( self._collection.count(), 90 )
+        writer.close()
+        self.assertEqual( self._collection.count(), 100 )
+        
+    def test_final_flush(self):
+        try:
+            with BulkWriter( self._collection ) as writer :
+                for i in range( 10 ):
+                    writer.send( { "value" : i })
+                raise ValueError( "stop" )
+        except ValueError :
+            pass
+        self.assertEqual( self._collection.count(), 10 )
+            
+    def test_pipelined(self):
+        with PipelinedWriter( self._collection, lambda x,y: { x : y }, "test", 
+                              writeLimit=100, writers=2, queueSize=10 ) as writer :
+            for i in range( 5000 ):
+                writer.send( { "value" : i })
+                
+        self.assertEqual( self._collection.count(), 5000 )
+        self.assertEqual( writer.stats().stats( "TEST_WRITE" )[ "docs" ], 5000 )
+        
+    def test_pipelined_error(self):
+        self._collection.insert_one( { "_id" : 1 } )
+        writer = PipelinedWriter( self._collection, orderedWrites=True, writeLimit=1 )
+        writer.send( { "_id" : 1 } )
+        self.assertRaises( Exception, writer.close )
+        
+    def test_dedup(self):
+        for batchID in [ 1, 2 ] :
+            with BulkWriter( self._collection, dedup=True ) as writer :
+                for i in range( 10 ):
+                    writer.send( { "test" : { "value" : i }, "batchID" : batchID, "timestamp" : batchID })
+                writer.send( { "test" : { "value" : batchID * 100 }, "batchID" : batchID, "timestamp" : batchID })
+                
+        self.assertEqual( self._collection.count(), 12 )
+        self.assertEqual( self._collection.count( { "batchID" : 1 } ), 11 )
+        self.assertEqual( self._collection.count( { "batchID" : 2 } ), 11 )
+        self.assertEqual( self._collection.find_one( { "test.value" : 200 } )[ "batchID" ], [ 2 ] )
+        
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+from datetime import datetime
+
+from mugalyser.mongodb import MUGAlyserMongoDB
+from mugalyser.audit import Audit
+from mugalyser.apikey import get_meetup_key
+from mugalyser.delta import deltaChain, reconstruct, DeltaTracker, isDeltaBatch
+from mugalyser.groups import Groups
+from mugalyser import delta
+
+
+class Test_delta(unittest.TestCase):
+
+    def setUp(self):
+        self._mdb = MUGAlyserMongoDB( uri="mongodb://localhost/TEST_DELTA" )
+        self._audit = Audit( self._mdb )
+
+    def tearDown(self):
+        self._mdb.client().drop_database( "TEST_DELTA" )
+
+    def batch(self, storage ):
+        batchID = self._audit.startBatch( { "storage" : storage }, trial=False, apikey=get_meetup_key())
+        self._audit.endBatch( batchID )
+        return batchID
+
+    def group(self, batchID, urlname, members ):
+        return { "batchID"   : batchID,
+                 "timestamp" : datetime.utcnow(),
+                 "group"     : { "urlname" : urlname, "members" : members }}
+
+    def test_isDeltaBatch(self):
+        self.assertFalse( isDeltaBatch( None ))
+        self.assertFalse( isDeltaBatch( { "info" : { "storage" : "full" }} ))
+        self.assertTrue( isDeltaBatch( { "info" : { "storage" : "delta" }} ))
+
+    def test_reconstruct(self):
+        base = self.batch( "full" )
+        groups = self._mdb.groupsCollection()
+        groups.insert_many( [ self.group( base, "a", 10 ),
+                              self.group( base, "b", 20 ),
+                              self.group( base, "c", 30 ) ] )
+
+        batchID = self._audit.startBatch( { "storage" : "delta" }, trial=False, apikey=get_meetup_key())
+        tracker = DeltaTracker( self._mdb, "groups", base )
+        deltas = [ tracker.delta( self.group( batchID, "a", 10 )),   # unchanged
+                   tracker.delta( self.group( batchID, "b", 21 )),   # updated
+                   tracker.delta( self.group( batchID, "d", 5 )) ]   # inserted
+        self.assertEqual( None, deltas[ 0 ] )
+        self.assertEqual( "update", deltas[ 1 ][ "op" ] )
+        self.assertEqual( "insert", deltas[ 2 ][ "op" ] )
+
+        deletions = tracker.deletions( batchID, datetime.utcnow())
+        self.assertEqual( [ "c" ], [ i[ "key" ] for i in deletions ] )
+
+        tracker.deltaCollection().insert_many( deltas[ 1: ] + deletions )
+        self._audit.endBatch( batchID )
+
+        self.assertEqual( ( base, [ batchID ] ), deltaChain( self._audit, batchID ))
+
+        docs = dict( ( i[ "group" ][ "urlname" ], i ) for i in reconstruct( self._mdb, "groups", batchID ))
+        self.assertEqual( [ "a", "b", "d" ], sorted( docs.keys()))
+        self.assertEqual( 21, docs[ "b" ][ "group" ][ "members" ] )
+        self.assertEqual( batchID, docs[ "a" ][ "batchID" ] )
+
+    def test_materialize(self):
+        base = self.batch( "full" )
+        groups = self._mdb.groupsCollection()
+        groups.insert_many( [ self.group( base, "a", 10 ),
+                              self.group( base, "b", 20 ),
+                              self.group( base, "c", 30 ) ] )
+
+        batchID = self._audit.startBatch( { "storage" : "delta" }, trial=False, apikey=get_meetup_key())
+        tracker = DeltaTracker( self._mdb, "groups", base )
+        tracker.delta( self.group( batchID, "a", 10 ))
+        tracker.deltaCollection().insert_many( [ tracker.delta( self.group( batchID, "b", 21 )),
+                                                 tracker.delta( self.group( batchID, "d", 5 )) ] +
+                                               tracker.deletions( batchID, datetime.utcnow()))
+
+        self.assertEqual( ( 1, 2 ), delta.materialize( self._mdb, "groups", batchID, base ))
+        # Running it again changes nothing
+        delta.materialize( self._mdb, "groups", batchID, base )
+        self._audit.endBatch( batchID )
+
+        g = Groups( self._mdb )
+        self.assertEqual( batchID, self._mdb.audit().getCurrentValidBatchID())
+        docs = dict( ( i[ "group" ][ "urlname" ], i ) for i in g.find())
+        self.assertEqual( [ "a", "b", "d" ], sorted( docs.keys()))
+        self.assertEqual( 21, docs[ "b" ][ "group" ][ "members" ] )
+        self.assertEqual( 3, g.count_documents())
+
+        # "a" is shared with the base batch, which is unchanged
+        self.assertEqual( 5, groups.count())
+        self.assertEqual( 3, groups.count( { "batchID" : base } ))
+        self.assertEqual( [ "a", "b", "c" ], sorted( i[ "group" ][ "urlname" ] for i in reconstruct( self._mdb, "groups", base )))
+
+        # Reading doesn't write
+        g.find_one( { "group.urlname" : "a" } )
+        self.assertEqual( 5, groups.count())
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -23,6 +23,17 @@ class Test(unittest.TestCase):
     def test_get_group_events(self):
         events = self._past.get_group_events( "DublinMUG"  )
         self.assertGreaterEqual( len( list( events )), 29 )
+        
+    def test_get_all_group_events(self):
+        groups = [ "London-MongoDB-User-Group", "DublinMUG" ]
+        events = list( self._past.get_all_group_events( groups, { "event.group.urlname" : 1 } ))
+        dublin = len( list( self._past.get_group_events( "DublinMUG" )))
+        london = len( list( self._past.get_group_events( "London-MongoDB-User-Group" )))
+        self.assertEqual( len( events ), dublin + london )
+        
+        urlnames = [ e[ "event" ][ "group" ][ "urlname" ] for e in events ]
+        self.assertEqual( urlnames, sorted( urlnames ))
+        self.assertEqual( [ "event" ], [ k for k in events[ 0 ].keys() if k != "_id" ] )
 
 
 if __name__ == "__main__":
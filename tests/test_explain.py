@@ -0,0 +1,56 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+
+from mugalyser.explain import analyse, stages, TEMPLATES
+
+
+def result( plan, keys, docs, returned ):
+    return { "queryPlanner"   : { "winningPlan" : plan },
+             "executionStats" : { "totalKeysExamined" : keys,
+                                  "totalDocsExamined" : docs,
+                                  "nReturned"         : returned }}
+
+class Test_explain(unittest.TestCase):
+
+    def test_stages(self):
+        plan = { "stage" : "FETCH", "inputStage" : { "stage" : "OR", 
+                                                     "inputStages" : [ { "stage" : "IXSCAN" },
+                                                                       { "stage" : "COLLSCAN" } ] }}
+        self.assertEqual( [ "FETCH", "OR", "IXSCAN", "COLLSCAN" ], list( stages( plan )))
+
+    def test_analyse(self):
+        ixscan = { "stage" : "FETCH", "inputStage" : { "stage" : "IXSCAN" }}
+        self.assertEqual( None, analyse( result( ixscan, 10, 10, 10 ))[ "flagged" ] )
+        self.assertEqual( None, analyse( result( ixscan, 0, 0, 0 ))[ "flagged" ] )
+        self.assertTrue( analyse( result( ixscan, 1000, 1000, 10 ))[ "flagged" ].startswith( "IXSCAN" ))
+        self.assertEqual( None, analyse( result( ixscan, 1000, 1000, 10 ), ratio=100 )[ "flagged" ] )
+        self.assertEqual( "COLLSCAN", analyse( result( { "stage" : "COLLSCAN" }, 0, 100, 1 ))[ "flagged" ] )
+
+    def test_expected(self):
+        collscan = result( { "stage" : "COLLSCAN" }, 0, 100, 1 )
+        a = analyse( collscan, expected="COLLSCAN" )
+        self.assertEqual( None, a[ "flagged" ] )
+        self.assertEqual( "COLLSCAN", a[ "expected" ] )
+
+        ixscan = { "stage" : "FETCH", "inputStage" : { "stage" : "IXSCAN" }}
+        a = analyse( result( ixscan, 1000, 1000, 10 ), expected="COLLSCAN" )
+        self.assertTrue( a[ "flagged" ].startswith( "IXSCAN" ))
+        self.assertEqual( None, a[ "expected" ] )
+
+    def test_templates(self):
+        s = { "batchID" : 1, "urlname" : "a", "urls" : [ "a", "b" ], "country" : "Ireland", "member_id" : 1 }
+        names = [ t[ 0 ] for t in TEMPLATES ]
+        self.assertEqual( len( names ), len( set( names )))
+        for ( name, collection_name, query, sort, expected ) in TEMPLATES :
+            self.assertTrue( isinstance( query( s ), dict ), name )
+        self.assertTrue( "Members.get_many_group_members" in names )
+        self.assertTrue( "PastEvents.find_group_events" in names )
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
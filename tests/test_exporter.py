@@ -0,0 +1,69 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+import os
+import gzip
+import json
+import tempfile
+import shutil
+from datetime import datetime
+
+from mugalyser.exporter import Exporter, accessor
+
+
+class Test_exporter(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._docs = [ { "group" : u"DublinMUG", "info" : { "name" : u"Caf\xe9", "time" : datetime( 2017, 1, 2, 3, 4, 5 ) }},
+                       { "group" : u"London-MongoDB-User-Group", "info" : {} } ]
+
+    def tearDown(self):
+        shutil.rmtree( self._dir )
+
+    def test_accessor(self):
+        self.assertEqual( "DublinMUG", accessor( "group" )( self._docs[ 0 ] ))
+        self.assertEqual( u"Caf\xe9", accessor( "info.name" )( self._docs[ 0 ] ))
+        self.assertEqual( None, accessor( "info.name" )( self._docs[ 1 ] ))
+        self.assertEqual( None, accessor( "group.name" )( self._docs[ 0 ] ))
+
+    def test_csv(self):
+        filename = os.path.join( self._dir, "out.csv" )
+        exporter = Exporter( filename, "csv", compress=True )
+        self.assertEqual( filename + ".gz", exporter.filename())
+        self.assertEqual( 2, exporter.output( iter( self._docs ), [ "group", "info.name", "info.time" ], datemap=[ "info.time" ] ))
+
+        lines = gzip.open( exporter.filename()).read().splitlines()
+        self.assertEqual( [ "group,info.name,info.time",
+                            "DublinMUG,Caf\xc3\xa9,2017-01-02 03:04:05",
+                            "London-MongoDB-User-Group,," ], lines )
+
+    def test_nested_datemap(self):
+        docs = [ { "_id" : { "ts" : datetime( 2017, 1, 2, 3, 4, 5 ), "batchID" : 7 }, "count" : 10 } ]
+        rows = list( Exporter().rows( iter( docs ), [ "_id", "_id.ts", "count" ], datemap=[ "_id.ts" ] ))
+        self.assertEqual( [ [ { "ts" : "2017-01-02 03:04:05", "batchID" : 7 }, "2017-01-02 03:04:05", 10 ] ], rows )
+        self.assertTrue( isinstance( docs[ 0 ][ "_id" ][ "ts" ], datetime ))
+
+        filename = os.path.join( self._dir, "history.csv" )
+        Exporter( filename, "csv" ).output( iter( docs ), [ "_id.ts", "_id.batchID", "count" ], datemap=[ "_id.ts" ] )
+        with open( filename ) as f :
+            self.assertEqual( [ "_id.ts,_id.batchID,count", "2017-01-02 03:04:05,7,10" ], f.read().splitlines())
+
+    def test_json(self):
+        filename = os.path.join( self._dir, "out.json" )
+        exporter = Exporter( filename, "JSON" )
+        self.assertEqual( 1, exporter.output( iter( self._docs ), [ "group", "info.time" ], datemap=[ "info.time" ], limit=1 ))
+
+        with open( filename ) as f :
+            rows = [ json.loads( l ) for l in f ]
+        self.assertEqual( [ { "group" : "DublinMUG", "info.time" : "2017-01-02 03:04:05" } ], rows )
+
+        self.assertRaises( ValueError, Exporter, filename, "xml" )
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,59 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+
+from mugalyser.facet import Pipeline, Facet
+
+
+class Collection( object ):
+
+    def __init__(self, name ):
+        self.name = name
+
+
+class Test_facet(unittest.TestCase):
+
+    def setUp(self):
+        self._events = Collection( "past_events" )
+
+    def test_pipeline(self):
+        p = Pipeline( self._events )
+        p.addMatch( { "batchID" : 1 } ).addRangeMatch( "event.time", None, 10 )
+        p.addGroup( { "_id" : "$event.group.urlname" } )
+        self.assertEqual( [ { "$match" : { "batchID" : 1 }},
+                            { "$match" : { "event.time" : { "$lte" : 10 }}},
+                            { "$group" : { "_id" : "$event.group.urlname" }} ], p.stages())
+        self.assertRaises( ValueError, p.addSort, None )
+
+    def test_facet(self):
+        totals = Pipeline( self._events ).addMatch( { "batchID" : 1, "event.status" : "past", "event.group.urlname" : { "$in" : [ "a" ] }} )
+        totals.addGroup( { "_id" : "$event.group.urlname" } )
+        rsvps = Pipeline( self._events ).addMatch( { "batchID" : 1, "event.group.urlname" : { "$in" : [ "a" ] }} )
+        events = Pipeline( self._events ).addMatch( { "batchID" : 1, "event.group.urlname" : { "$in" : [ "a" ] }} )
+        events.addProject( { "_id" : 0 } )
+
+        facet = Facet( self._events )
+        facet.add( "grouptotals", totals )
+        facet.add( "rsvpevents", rsvps )
+        facet.add( "events", events )
+
+        self.assertEqual( { "batchID" : 1, "event.group.urlname" : { "$in" : [ "a" ] }}, facet.common_match())
+        self.assertEqual( [ { "$match" : { "batchID" : 1, "event.group.urlname" : { "$in" : [ "a" ] }}},
+                            { "$facet" : { "grouptotals" : [ { "$match" : { "event.status" : "past" }},
+                                                             { "$group" : { "_id" : "$event.group.urlname" }} ],
+                                           "rsvpevents"  : [ { "$match" : {}} ],
+                                           "events"      : [ { "$project" : { "_id" : 0 }} ] }} ],
+                          facet.pipeline())
+
+        results = facet.results( [ { "grouptotals" : [ { "_id" : "a" } ], "events" : [] } ] )
+        self.assertEqual( { "grouptotals" : [ { "_id" : "a" } ], "rsvpevents" : [], "events" : [] }, results )
+
+        self.assertRaises( ValueError, facet.add, "members", Pipeline( Collection( "members" )))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
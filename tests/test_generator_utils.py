@@ -0,0 +1,65 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+import threading
+import time
+from mugalyser.generator_utils import concurrent_generate
+
+def failing():
+    yield 1
+    raise ValueError( "failed" )
+
+class Test_generator_utils(unittest.TestCase):
+
+    def test_unordered(self):
+        tasks = [ ( i, ( lambda i=i : range( i * 10, i * 10 + 10 ))) for i in range( 5 ) ]
+        results = list( concurrent_generate( tasks, workers=3, queue_size=2 ))
+        self.assertEqual( len( results ), 50 )
+        self.assertEqual( sorted( v for ( _, v ) in results ), range( 50 ))
+        for ( k, v ) in results :
+            self.assertEqual( k, v // 10 )
+            
+    def test_ordered(self):
+        tasks = [ ( i, ( lambda i=i : range( i * 10, i * 10 + 10 ))) for i in range( 5 ) ]
+        results = list( concurrent_generate( tasks, workers=3, ordered=True ))
+        self.assertEqual( [ v for ( _, v ) in results ], range( 50 ))
+        
+    def test_ordered_backpressure(self):
+        produced = [ 0 ]
+        lock = threading.Lock()
+        
+        def task():
+            for i in xrange( 1000 ):
+                with lock :
+                    produced[ 0 ] = produced[ 0 ] + 1
+                yield i
+                
+        tasks = [ ( i, task ) for i in range( 10 ) ]
+        g = concurrent_generate( tasks, workers=2, ordered=True, queue_size=5 )
+        first = [ next( g ) for _ in range( 3 ) ]
+        time.sleep( 0.5 )
+        # Only the two running tasks have produced anything and each has filled its queue
+        self.assertTrue( produced[ 0 ] <= 2 * ( 5 + 1 ) + 3, produced[ 0 ] )
+        self.assertEqual( [ ( 0, 0 ), ( 0, 1 ), ( 0, 2 ) ], first )
+        
+        rest = list( g )
+        self.assertEqual( 10 * 1000, len( first ) + len( rest ))
+        self.assertEqual( [ k for ( k, _ ) in first + rest ], sorted( k for ( k, _ ) in first + rest ))
+        
+    def test_exception(self):
+        tasks = [ ( "ok", lambda : range( 10 )), ( "fail", failing ) ]
+        self.assertRaises( ValueError, list, concurrent_generate( tasks, workers=2 ))
+        self.assertRaises( ValueError, list, concurrent_generate( tasks, workers=2, ordered=True ))
+        
+    def test_early_exit(self):
+        tasks = [ ( i, ( lambda : xrange( 100000 ))) for i in range( 4 ) ]
+        g = concurrent_generate( tasks, workers=4, queue_size=10 )
+        first = [ next( g ) for _ in range( 5 ) ]
+        g.close()
+        self.assertEqual( len( first ), 5 )
+        
+if __name__ == "__main__":
+    unittest.main()
@@ -25,10 +25,18 @@ class Test_groups(unittest.TestCase):
         g = self._groups.get_group( "DublinMUG")
         self.assertEqual( g[ "group"][ "urlname"], "DublinMUG" )
         
+    def test_get_many_groups(self):
+        groups = list( self._groups.get_groups( [ "London-MongoDB-User-Group", "DublinMUG", "nosuchgroup" ] ))
+        self.assertEqual( [ "DublinMUG", "London-MongoDB-User-Group" ], [ g[ "group" ][ "urlname" ] for g in groups ] )
+        
     def test_get_country(self):
         c = self._groups.get_country( "DublinMUG" )
         self.assertEqual( c, "Ireland" )
         
+    def test_get_countries(self):
+        countries = self._groups.get_countries( [ "DublinMUG", "nyccpp", "DublinMUG", "nosuchgroup" ], chunk_size=1 )
+        self.assertEqual( { "DublinMUG" : "Ireland", "nyccpp" : "USA" }, countries )
+        
     def testGroups(self):
         groups = self._groups.get_all_groups()
         self.assertEqual( len( [ x for x in groups ]), 114 )
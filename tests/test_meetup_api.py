@@ -58,12 +58,32 @@ class Test_meetup_api(unittest.TestCase):
         self.assertTrue( u"name" in event )
         self.assertEqual( event[ "rsvp_limit"], 80 )
 
+    def test_get_attendees_parallel(self):
+        serial = [ ( a[ "member" ][ "id" ], e[ "id" ] ) for ( a, e ) in self._api.get_attendees( "DublinMUG" ) ]
+        parallel = [ ( a[ "member" ][ "id" ], e[ "id" ] ) for ( a, e ) in self._api.get_attendees( "DublinMUG", workers=4 ) ]
+        self.assertEqual( serial, parallel )
+        
+        unordered = [ ( a[ "member" ][ "id" ], e[ "id" ] ) for ( a, e ) in self._api.get_attendees( "DublinMUG", workers=4, ordered=False ) ]
+        self.assertEqual( sorted( serial ), sorted( unordered ))
+        
     def test_get_aamember_by_id(self):
         member = self._api.get_member_by_id( 210984049 )
         self.assertEqual( member[ "name"], u"Julio Román" )
         #print( member[ "name"] )
         self.assertEqual( type(member[ "name"] ), types.UnicodeType )
         
+    def test_shared_session(self):
+        session = self._api.session()
+        self.assertTrue( session is self._api._requester.session())
+        
+        api = MeetupAPI( session=session )
+        self.assertTrue( api.session() is session )
+        
+        self._api.get_group( "DublinMUG" )
+        self._api.get_group( "DublinMUG" )
+        adapter = session.get_adapter( "https://api.meetup.com/" )
+        self.assertEqual( len( adapter.poolmanager.pools ), 1 )
+        
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -4,9 +4,11 @@ Created on 20 Apr 2017
 @author: jdrumgoole
 '''
 import unittest
-from mugalyser.meetup_writer import MeetupWriter
+from datetime import datetime, timedelta
+from mugalyser.meetup_writer import MeetupWriter, classifyAttendance
 from mugalyser.mongodb import MUGAlyserMongoDB
 from mugalyser.audit import Audit
+from mugalyser.apikey import get_meetup_key
 class Test(unittest.TestCase):
 
 
@@ -25,8 +27,129 @@ class Test(unittest.TestCase):
             
     def testProcessMembers(self):
         self._writer.processMembers( nopro=False)
+        
+    def test_capture_snapshots(self):
+        batchID = self._audit.startBatch( {}, trial=True )
+        writer = MeetupWriter( self._audit, self._mdb, [ "DublinMUG", "London-MongoDB-User-Group" ] )
+        writer.capture_snapshots( [ "DublinMUG", "London-MongoDB-User-Group" ], False, [ "upcomingevents" ], workers=2 )
+        self._audit.endBatch( batchID )
+        
+        groups = self._mdb.upcomingEventsCollection().find( { "batchID" : batchID } ).distinct( "event.group.urlname" )
+        self.assertEqual( sorted( groups ), [ "DublinMUG", "London-MongoDB-User-Group" ] )
 
 
+class FakeMeetupAPI( object ):
+    
+    def __init__(self, events ):
+        self._events = events
+        self.fetched = []
+        
+    def get_past_events(self, url_name ):
+        return iter( self._events )
+    
+    def get_events_attendees(self, events, url_name, workers=1, ordered=True ):
+        for event in events :
+            self.fetched.append( event[ "id" ] )
+            for i in range( 2 ):
+                yield ( { "member" : { "id" : i, "name" : "member %i" % i }, "rsvp" : { "response" : "yes" }}, event )
+    
+    
+class Test_incremental_attendance(unittest.TestCase):
+    
+    def setUp(self):
+        self._mdb = MUGAlyserMongoDB( "mongodb://localhost:27017/TEST_ATTENDANCE" )
+        self._audit = Audit( self._mdb )
+        self._now = datetime.now()
+        
+    def tearDown(self):
+        self._mdb.client().drop_database( "TEST_ATTENDANCE" )
+        
+    def event(self, event_id, days_ago ):
+        return { "id" : event_id, "time" : self._now - timedelta( days=days_ago ), "group" : { "urlname" : "a" }}
+    
+    def test_classify_cutoff(self):
+        cutoff = self._now - timedelta( days=7 )
+        events = [ self.event( "old", 8 ), self.event( "edge", 7 ), self.event( "new", 1 ) ]
+        ( final, carried, fetch ) = classifyAttendance( events, {}, cutoff )
+        # An event that started exactly incremental_window ago is not final yet
+        self.assertEqual( [ "old" ], final )
+        self.assertEqual( {}, carried )
+        self.assertEqual( [ "old", "edge", "new" ], [ e[ "id" ] for e in fetch ] )
+        
+    def test_classify_carry_forward(self):
+        cutoff = self._now - timedelta( days=7 )
+        events = [ self.event( "old", 30 ), self.event( "older", 60 ), self.event( "new", 1 ), self.event( "recaptured", 2 ) ]
+        ( final, carried, fetch ) = classifyAttendance( events, { "old" : 3, "older" : 2, "recaptured" : 3 }, cutoff )
+        self.assertEqual( [ "old", "older" ], final )
+        self.assertEqual( { 3 : [ "old" ], 2 : [ "older" ] }, carried )
+        # Still in the window so fetched even though it was captured
+        self.assertEqual( [ "new", "recaptured" ], [ e[ "id" ] for e in fetch ] )
+        
+    def run_batch(self, events, end=True ):
+        api = FakeMeetupAPI( events )
+        batchID = self._audit.startBatch( {}, trial=False, apikey=get_meetup_key())
+        writer = MeetupWriter( self._audit, self._mdb, [ "a" ], meetup_api=api, incremental=True )
+        writer.processNewAttendees( "a" )
+        if end :
+            self._audit.endBatch( batchID )
+        return ( batchID, api.fetched )
+    
+    def test_carry_forward(self):
+        index = self._mdb.attendanceIndexCollection()
+        attendees = self._mdb.attendeesCollection()
+        
+        ( first, fetched ) = self.run_batch( [ self.event( 1, 30 ), self.event( 2, 1 ) ] )
+        self.assertEqual( [ 1, 2 ], fetched )
+        self.assertEqual( first, index.find_one( { "_id" : 1 } )[ "batchID" ] )
+        self.assertEqual( None, index.find_one( { "_id" : 2 } ))
+        
+        # A failed run carries event 1 forward and indexes event 3 against a batch that never ends
+        ( failed, fetched ) = self.run_batch( [ self.event( 1, 30 ), self.event( 2, 1 ), self.event( 3, 20 ) ], end=False )
+        self.assertEqual( [ 2, 3 ], fetched )
+        self.assertEqual( first, index.find_one( { "_id" : 1 } )[ "batchID" ] )
+        self.assertEqual( failed, index.find_one( { "_id" : 3 } )[ "batchID" ] )
+        
+        # The next run ignores the failed batch and fetches event 3 again
+        ( third, fetched ) = self.run_batch( [ self.event( 1, 30 ), self.event( 2, 1 ), self.event( 3, 20 ) ] )
+        self.assertEqual( [ 2, 3 ], fetched )
+        self.assertEqual( third, index.find_one( { "_id" : 3 } )[ "batchID" ] )
+        self.assertEqual( 6, attendees.count( { "batchID" : third } ))
+        self.assertEqual( 2, attendees.count( { "batchID" : third, "info.event.id" : 1 } ))
+
+        
+        
+class Test_delta_deletions(unittest.TestCase):
+    
+    def setUp(self):
+        self._mdb = MUGAlyserMongoDB( "mongodb://localhost:27017/TEST_DELTA_WRITER" )
+        self._audit = Audit( self._mdb )
+        
+    def tearDown(self):
+        self._mdb.client().drop_database( "TEST_DELTA_WRITER" )
+        
+    def event(self, event_id, urlname ):
+        return { "id" : event_id, "time" : datetime( 2026, 1, event_id ), "group" : { "urlname" : urlname }}
+    
+    def test_incomplete_phase(self):
+        base = self._audit.startBatch( {}, trial=False, apikey=get_meetup_key())
+        self._mdb.pastEventsCollection().insert_many( [ self._audit.addTimestamp( "event", self.event( 1, "a" )),
+                                                        self._audit.addTimestamp( "event", self.event( 2, "b" )) ] )
+        self._audit.endBatch( base )
+        
+        batchID = self._audit.startBatch( { "storage" : "delta" }, trial=False, apikey=get_meetup_key())
+        writer = MeetupWriter( self._audit, self._mdb, [ "a", "b" ], meetup_api=FakeMeetupAPI( [ self.event( 1, "a" ) ] ),
+                               delta=True )
+        writer.run_phase( "pastevents", "a", writer.processPastEvents, "a" )
+        
+        # Group b wasn't captured so its event isn't deleted
+        writer.finish()
+        deltas = self._mdb.deltasCollection( "past_events" )
+        self.assertEqual( 0, deltas.count( { "batchID" : batchID, "op" : "delete" } ))
+        
+        self._audit.checkpoint( batchID, "pastevents", "b" )
+        writer.finish()
+        self.assertEqual( [ 2 ], [ i[ "key" ] for i in deltas.find( { "batchID" : batchID, "op" : "delete" } ) ] )
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -39,6 +39,17 @@ class Test_members(unittest.TestCase):
         members  = self._members.get_many_group_members( [ "DublinMUG", "London-MongoDB-User-Group"] )
         self.assertGreaterEqual( self._members.count( members ), 2357 )
         
+    def test_count_members(self ):
+        groups = [ "DublinMUG", "London-MongoDB-User-Group", "nosuchgroup" ]
+        counts = self._members.group_member_counts( groups )
+        self.assertEqual( counts[ "DublinMUG" ], self._members.get_group_members( "DublinMUG" ).count())
+        self.assertEqual( counts[ "nosuchgroup" ], 0 )
+        self.assertEqual( self._members.count_members( groups ), 
+                          counts[ "DublinMUG" ] + counts[ "London-MongoDB-User-Group" ] )
+        
+        self.assertEqual( self._members.count_documents( { "member.chapters.urlname" : "DublinMUG" } ),
+                          counts[ "DublinMUG" ] )
+        
     def test_get_group_members(self ):
         members  = self._members.get_group_members( "DublinMUG" )
         self.assertGreaterEqual( len( list( members)), 830 )
@@ -55,6 +66,13 @@ class Test_members(unittest.TestCase):
         jdrumgoole = self._members.get_by_name( "Joe Drumgoole")
         self.assertNotEqual( jdrumgoole, None )
         
+    def test_get_by_IDs(self):
+        
+        ids = [ i[ "member" ][ "member_id" ] for i in self._members.get_group_members( "DublinMUG", projection={ "member.member_id" : 1 } ) ]
+        members = self._members.get_by_IDs( ids + [ -1 ], { "member.join_time" : 1 }, chunk_size=100 )
+        self.assertEqual( set( ids ), set( members.keys()))
+        self.assertEqual( members[ ids[ 0 ]][ "join_time" ], self._members.get_by_ID( ids[ 0 ] )[ "join_time" ] )
+        
     def test_get_by_date_range(self ):
         
         start = parse( "1-Jan-2009, 00:01" )
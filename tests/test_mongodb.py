@@ -0,0 +1,50 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+
+from mugalyser.mongodb import MUGAlyserMongoDB
+from mugalyser.version import __indexVersion__
+
+
+class Test_mongodb(unittest.TestCase):
+
+    def setUp(self):
+        self._mdb = MUGAlyserMongoDB( uri="mongodb://localhost/TEST_MONGODB" )
+
+    def tearDown(self):
+        self._mdb.client().drop_database( "TEST_MONGODB" )
+
+    def test_ensureSchema(self):
+        self.assertEqual( __indexVersion__, self._mdb.indexVersion())
+        self.assertTrue( "batchID_1" in self._mdb.groupsCollection().index_information())
+
+        # A connect to an up to date database doesn't recreate the indexes
+        self._mdb.groupsCollection().drop_index( "batchID_1" )
+        mdb = MUGAlyserMongoDB( uri="mongodb://localhost/TEST_MONGODB" )
+        self.assertFalse( "batchID_1" in mdb.groupsCollection().index_information())
+
+        mdb.ensureSchema()
+        self.assertTrue( "batchID_1" in mdb.groupsCollection().index_information())
+
+    def test_parallel_arrays(self):
+        # Linked or deduplicated members have a batchID array as well as the chapters array
+        members = self._mdb.membersCollection()
+        self.assertFalse( "batchID_1_member.chapters.urlname_1" in members.index_information())
+        members.insert_one( { "batchID" : [ 1, 2 ],
+                              "member"  : { "member_id" : 1, "chapters" : [ { "urlname" : "a" }, { "urlname" : "b" } ] }} )
+        self.assertEqual( 1, members.count( { "batchID" : 2, "member.chapters.urlname" : "b" } ))
+
+    def test_upgrade_drops_compound_chapters_index(self):
+        members = self._mdb.membersCollection()
+        members.create_index( [ ( "batchID", 1 ), ( "member.chapters.urlname", 1 ) ] )
+        self._mdb.ensureSchema()
+        self.assertFalse( "batchID_1_member.chapters.urlname_1" in members.index_information())
+        self.assertTrue( "member.chapters.urlname_1" in members.index_information())
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,90 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+import os
+import imp
+import time
+import tempfile
+import shutil
+
+mug_analytics_main = imp.load_source( "mug_analytics_main",
+                                      os.path.join( os.path.dirname( os.path.abspath( __file__ )),
+                                                    "..", "bin", "mug_analytics_main.py" ))
+
+
+class StubAnalytics( object ):
+    '''
+    Just enough of MUG_Analytics for run_reports, using its copy.
+    '''
+
+    copy = mug_analytics_main.MUG_Analytics.copy.__func__
+
+    def __init__(self ):
+        self._files = []
+        self._filename = "-"
+
+    def files(self ):
+        return self._files
+
+    def report(self, filename, delay=0.0 ):
+        time.sleep( delay )
+        self._filename = filename
+        with open( filename, "w" ) as f :
+            f.write( os.path.basename( filename ))
+        self._files.append( filename )
+
+    def fail(self ):
+        raise ValueError( "report failed" )
+
+
+class Test_run_reports(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree( self._dir )
+
+    def jobs(self ):
+        #
+        # The first job finishes last when they run in parallel.
+        #
+        return [ ( "first",  "report", { "filename" : os.path.join( self._dir, "first" ),  "delay" : 0.2 } ),
+                 ( "second", "report", { "filename" : os.path.join( self._dir, "second" ) } ) ]
+
+    def test_copy(self):
+        analytics = StubAnalytics()
+        analytics.files().append( "x" )
+        c = analytics.copy()
+        self.assertEqual( [], c.files())
+        self.assertEqual( [ "x" ], analytics.files())
+
+    def test_run_reports(self):
+        for parallel in [ 1, 2 ] :
+            analytics = StubAnalytics()
+            results = mug_analytics_main.run_reports( analytics, self.jobs(), parallel=parallel )
+
+            self.assertEqual( [ "first", "second" ], [ name for ( name, _, _ ) in results ] )
+            for ( name, files, _ ) in results :
+                self.assertEqual( [ os.path.join( self._dir, name ) ], files )
+                with open( files[ 0 ] ) as f :
+                    self.assertEqual( name, f.read())
+
+            self.assertEqual( [ os.path.join( self._dir, "first" ), os.path.join( self._dir, "second" ) ],
+                              analytics.files())
+            self.assertEqual( "-", analytics._filename )
+
+    def test_run_reports_failure(self):
+        for parallel in [ 1, 2 ] :
+            analytics = StubAnalytics()
+            jobs = self.jobs() + [ ( "bad", "fail", {} ) ]
+            self.assertRaises( ValueError, mug_analytics_main.run_reports, analytics, jobs, parallel )
+            self.assertEqual( [], analytics.files())
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
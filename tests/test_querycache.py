@@ -0,0 +1,88 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+import tempfile
+import shutil
+
+from mugalyser.querycache import QueryCache, CachedResult, CachedAgg
+
+
+class Agg( object ):
+
+    def __init__(self, docs ):
+        self._docs = docs
+
+    def aggregate(self ):
+        return iter( self._docs )
+
+    def __str__(self ):
+        return "[ { '$match' : { 'batchID' : 1 } } ]"
+
+
+class Test_querycache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree( self._dir )
+
+    def test_key(self):
+        self.assertEqual( QueryCache.key( "groups", { "a" : 1, "b" : 2 } ),
+                          QueryCache.key( "groups", { "b" : 2, "a" : 1 } ))
+        self.assertNotEqual( QueryCache.key( "groups", { "a" : 1 } ),
+                             QueryCache.key( "members", { "a" : 1 } ))
+
+    def test_cachedAgg_deployments(self):
+        # The same database, collection and batchID on two deployments share a cache directory
+        cache = QueryCache( path=self._dir )
+        local = [ { "x" : "local" } ]
+        atlas = [ { "x" : "atlas" } ]
+        self.assertEqual( local, list( CachedAgg( cache, Agg( local ), "mongodb://localhost/MUGS", "MUGS.groups" ).aggregate()))
+        self.assertEqual( atlas, list( CachedAgg( cache, Agg( atlas ), "mongodb+srv://cluster0.example.net/MUGS", "MUGS.groups" ).aggregate()))
+        self.assertEqual( local, list( CachedAgg( cache, Agg( [] ), "mongodb://localhost/MUGS", "MUGS.groups" ).aggregate()))
+
+    def test_lru(self):
+        cache = QueryCache( maxBytes=100 )
+        doc = { "x" : "a" * 20 }  # 33 bytes of BSON
+        cache.put( "a", [ doc ] )
+        cache.put( "b", [ doc ] )
+        cache.put( "c", [ doc ] )
+        self.assertEqual( [ doc ], cache.get( "a" ))
+        cache.put( "d", [ doc ] )                      # evicts b, a was used more recently
+        self.assertEqual( None, cache.get( "b" ))
+        self.assertEqual( [ doc ], cache.get( "a" ))
+        cache.put( "big", [ doc ] * 4 )                # larger than the cache, ignored
+        self.assertEqual( None, cache.get( "big" ))
+        self.assertEqual( 3, cache.stats()[ "entries" ] )
+
+    def test_disk(self):
+        QueryCache( path=self._dir ).put( "k", [ { "x" : 1 } ] )
+        self.assertEqual( [ { "x" : 1 } ], QueryCache( path=self._dir ).get( "k" ))
+
+    def test_disk_unreadable(self):
+        cache = QueryCache( path=self._dir )
+        with open( cache._filename( "k" ), "wb" ) as f :
+            f.write( "not BSON" )
+        self.assertEqual( None, cache.get( "k" ))
+
+    def test_cachedResult(self):
+        cache = QueryCache()
+        calls = []
+        def producer():
+            calls.append( 1 )
+            return [ { "x" : 1 }, { "x" : 2 } ]
+
+        first = list( CachedResult( cache, "k", producer ))
+        first[ 0 ][ "x" ] = 99   # callers can't change the cached copy
+        second = list( CachedResult( cache, "k", producer ))
+        self.assertEqual( [ { "x" : 1 }, { "x" : 2 } ], second )
+        self.assertEqual( 1, len( calls ))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
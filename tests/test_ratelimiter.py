@@ -0,0 +1,55 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+import tempfile
+import shutil
+import os
+import time
+from mugalyser.ratelimiter import RateLimiter, FileRateLimiter
+
+class Test_ratelimiter(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree( self._dir )
+        
+    def test_paced(self):
+        limiter = RateLimiter( limit=11, window=1, margin=1 )
+        start = time.time()
+        for _ in range( 5 ):
+            limiter.acquire()
+        elapsed = time.time() - start
+        # 10 usable requests in a one second window means one every 0.1 seconds
+        self.assertGreaterEqual( elapsed, 0.35 )
+        self.assertLess( elapsed, 1.0 )
+        
+    def test_update(self):
+        limiter = RateLimiter( limit=30, window=10 )
+        limiter.update( { "X-RateLimit-Limit" : "30",
+                          "X-RateLimit-Remaining" : "1",
+                          "X-RateLimit-Reset" : "1" } )
+        start = time.time()
+        limiter.acquire()
+        self.assertGreaterEqual( time.time() - start, 0.5 )
+        
+    def test_missing_headers(self):
+        limiter = RateLimiter()
+        limiter.update( {} )
+        limiter.acquire()
+        
+    def test_file_shared(self):
+        path = os.path.join( self._dir, "ratelimit.json" )
+        a = FileRateLimiter( path, limit=30, window=10 )
+        b = FileRateLimiter( path, limit=30, window=10 )
+        a.acquire()
+        b.update( { "X-RateLimit-Remaining" : "5", "X-RateLimit-Reset" : "8" } )
+        with a._state() as state :
+            self.assertEqual( state[ "remaining" ], 5 )
+        
+if __name__ == "__main__":
+    unittest.main()
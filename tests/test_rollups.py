@@ -0,0 +1,76 @@
+'''
+Created on 18 Oct 2026
+
+@author: jdrumgoole
+'''
+import unittest
+from datetime import datetime
+
+from mugalyser.mongodb import MUGAlyserMongoDB
+from mugalyser.audit import batchIDCache
+from mugalyser.apikey import get_meetup_key
+from mugalyser.rollups import Rollups
+
+
+class Test_rollups(unittest.TestCase):
+
+    def setUp(self):
+        self._mdb = MUGAlyserMongoDB( uri="mongodb://localhost/TEST_ROLLUPS" )
+        self._audit = self._mdb.audit()
+        self._rollups = Rollups( self._mdb )
+
+    def tearDown(self):
+        self._mdb.client().drop_database( "TEST_ROLLUPS" )
+        batchIDCache.invalidate()
+
+    def event(self, batchID, urlname, year, rsvps ):
+        return { "batchID" : batchID,
+                 "event"   : { "status"         : "past",
+                               "time"           : datetime( year, 6, 1 ),
+                               "yes_rsvp_count" : rsvps,
+                               "group"          : { "urlname" : urlname }}}
+
+    def attendee(self, batchID, name, urlname, response ):
+        return { "batchID" : batchID,
+                 "info"    : { "attendee" : { "member" : { "name" : name }, "rsvp" : { "response" : response }},
+                               "event"    : { "group" : { "urlname" : urlname }}}}
+
+    def test_build(self):
+        batchID = self._audit.startBatch( {}, trial=False, apikey=get_meetup_key())
+        self._mdb.pastEventsCollection().insert_many( [ self.event( batchID, "DublinMUG", 2016, 10 ),
+                                                        self.event( batchID, "DublinMUG", 2016, 20 ),
+                                                        self.event( batchID, "DublinMUG", 2017, 5 ),
+                                                        self.event( batchID, "LondonMUG", 2017, 7 ) ] )
+        self._mdb.attendeesCollection().insert_many( [ self.attendee( batchID, "joe", "DublinMUG", "yes" ),
+                                                       self.attendee( batchID, "joe", "DublinMUG", "no" ),
+                                                       self.attendee( batchID, "ann", "LondonMUG", "yes" ) ] )
+        self._mdb.membersCollection().insert_many( [ { "batchID" : batchID, "member" : { "country" : "Ireland" }},
+                                                     { "batchID" : batchID, "member" : { "country" : "Ireland" }},
+                                                     { "batchID" : batchID, "member" : { "country" : "France" }} ] )
+        self.assertFalse( self._rollups.exists( batchID ))
+        self._audit.endBatch( batchID, rollup=True )
+        self.assertTrue( self._rollups.exists( batchID ))
+
+        totals = self._rollups.collection( "group_totals" )
+        dublin = totals.find_one( { "batchID" : batchID, "group" : "DublinMUG", "year" : 2016 } )
+        self.assertEqual( 2, dublin[ "event_count" ] )
+        self.assertEqual( 30, dublin[ "rsvp_count" ] )
+
+        rsvps = self._rollups.collection( "group_rsvps" ).find_one( { "batchID" : batchID, "group" : "DublinMUG" } )
+        self.assertEqual( 35, rsvps[ "rsvp_count" ] )
+
+        joe = self._rollups.collection( "attendance" ).find_one( { "batchID" : batchID, "attendee" : "joe" } )
+        self.assertEqual( 2, joe[ "event_count" ] )
+        self.assertEqual( 1, joe[ "yes_count" ] )
+
+        ireland = self._rollups.collection( "country_totals" ).find_one( { "batchID" : batchID, "country" : "Ireland" } )
+        self.assertEqual( 2, ireland[ "members" ] )
+
+        # Rebuilding replaces rather than adds
+        self._rollups.build( batchID )
+        self.assertEqual( 3, totals.count( { "batchID" : batchID } ))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -5,13 +5,15 @@ Created on 4 Oct 2016
 '''
 
 from mugalyser.mongodb import MUGAlyserMongoDB
-from mugalyser.audit import Audit
+from mugalyser.querycache import QueryCache
+from mugalyser.groups import Groups
 from flask import Flask, jsonify
 from flask.templating import render_template
 app = Flask(__name__)
 
 mdb = MUGAlyserMongoDB()
-auditdb = Audit( mdb )
+mdb.setQueryCache( QueryCache())
+auditdb = mdb.audit()
 membersCollection = mdb.membersCollection()
 groupCollection = mdb.groupsCollection()
 auditCollection = auditdb.auditCollection()
@@ -30,10 +32,8 @@ def index():
 @app.route('/groups')
 def groups():
 
-    curBatch = auditdb.currentBatch()
-    curGroups = groupCollection.find( { "batchID" : curBatch["ID"]}, 
-                                      { "_id"           : 0, 
-                                        "group.urlname" : 1 })
+    curGroups = Groups( mdb ).get_all_groups( projection={ "_id"           : 0, 
+                                                           "group.urlname" : 1 })
     
     output = []
     for d in curGroups: